@@ -3,12 +3,25 @@ Admin API endpoints for managing companies
 Add this to main.py or import as a router
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, load_only
+from pydantic import BaseModel, Field, ValidationError
 from typing import Optional, List
 from models import Company, get_db
+from tenant_cache import tenant_cache
+from answer_cache import answer_cache
+from single_flight import chat_flights
+from run_poller import run_timings
+from circuit_breaker import openai_breaker
+from usage import default_range, top_tenants, usage_report
+from transcripts import session_transcript
+from analytics import analytics_report
+from assistant_sync import sync_company
+from company_io import IMPORT_BATCH_SIZE, export_companies, iter_jsonl, iter_tarball, spool_upload, upsert_batch
 from datetime import datetime
+import hmac
+import os
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -31,6 +44,8 @@ class CompanyCreate(BaseModel):
     faqs: Optional[List[dict]] = None
     sms_enabled: bool = False
     sms_phone_number: Optional[str] = None
+    rate_limit_per_minute: Optional[int] = Field(None, ge=0, description="Chat messages/minute (0 = unlimited, unset = default)")
+    rate_limit_burst: Optional[int] = Field(None, ge=1)
 
 
 class CompanyUpdate(BaseModel):
@@ -49,9 +64,17 @@ class CompanyUpdate(BaseModel):
     faqs: Optional[List[dict]] = None
     sms_enabled: Optional[bool] = None
     sms_phone_number: Optional[str] = None
+    rate_limit_per_minute: Optional[int] = Field(None, ge=0)
+    rate_limit_burst: Optional[int] = Field(None, ge=1)
     active: Optional[bool] = None
 
 
+class CompanyImport(CompanyCreate):
+    """One bulk import record; name is only required when creating"""
+    name: Optional[str] = None
+    active: bool = True
+
+
 class CompanyResponse(BaseModel):
     id: int
     site_id: str
@@ -64,27 +87,161 @@ class CompanyResponse(BaseModel):
     knowledge_base: str
     faqs: Optional[List[dict]]
     sms: dict
+    rate_limits: dict
     active: bool
     created_at: Optional[str]
     updated_at: Optional[str]
 
 
-@router.get("/companies", response_model=List[CompanyResponse])
+# Keys returned by ?summary=true
+SUMMARY_FIELDS = ["id", "site_id", "name", "domain", "active", "updated_at"]
+
+
+@router.get("/companies")
 async def list_companies(
+    request: Request,
+    response: Response,
     active_only: bool = True,
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[int] = None,
+    fields: Optional[str] = None,
+    summary: bool = False,
     db: Session = Depends(get_db)
 ):
     """
-    List all companies
+    List companies, a page at a time (ordered by id)
     Query params:
     - active_only: Filter for active companies only (default: true)
+    - limit: Page size (default: 100, max: 1000)
+    - after: Cursor from the previous page's X-Next-Cursor header
+    - fields: Comma-separated keys to return, e.g. "site_id,name,branding"
+      (only the matching columns are loaded from the database)
+    - summary: Shorthand for fields=id,site_id,name,domain,active,updated_at
     """
+    if summary:
+        selected = SUMMARY_FIELDS
+    elif fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in Company.DICT_COLUMNS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(Company.DICT_COLUMNS)}"
+            )
+    else:
+        selected = None
+
     query = db.query(Company)
+    if selected is not None:
+        # Defer every other column (knowledge_base, faqs, ... stay in the DB)
+        columns = {"id"} | {c for f in selected for c in Company.DICT_COLUMNS[f]}
+        query = query.options(load_only(*(getattr(Company, c) for c in columns)))
     if active_only:
         query = query.filter(Company.active == True)
+    if after is not None:
+        query = query.filter(Company.id > after)
+
+    companies = query.order_by(Company.id).limit(limit).all()
+
+    # Keyset pagination: a full page means there may be more after the last id
+    if len(companies) == limit:
+        next_cursor = companies[-1].id
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+        response.headers["Link"] = f'<{request.url.include_query_params(after=next_cursor)}>; rel="next"'
+
+    return [company.to_dict(selected) for company in companies]
 
-    companies = query.all()
-    return [company.to_dict() for company in companies]
+
+async def sync_companies(site_ids: List[str]):
+    """Background task: sync imported companies one at a time"""
+    for site_id in site_ids:
+        await sync_company(site_id)
+
+
+@router.post("/companies:bulk")
+async def bulk_import_companies(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    sync: bool = True,
+    db: Session = Depends(get_db)
+):
+    """
+    Create or update many companies at once
+    Body is either JSONL/NDJSON (one company per line, same fields as
+    POST /companies, as written by /companies:export) or a tar/tar.gz of
+    config/<site>.yaml + content/<site>/knowledge.md
+    Records are upserted in batched transactions; bad records are reported
+    and skipped
+    Query params:
+    - sync: Re-index / re-push assistants of changed companies afterwards (default: true)
+    """
+    content_type = request.headers.get("content-type", "")
+    is_tarball = any(kind in content_type for kind in ("tar", "gzip"))
+
+    summary = {"created": 0, "updated": 0, "unchanged": 0, "batches": 0, "errors": []}
+    changed_site_ids = []
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        try:
+            result = upsert_batch(db, batch)
+        except Exception as e:
+            db.rollback()
+            summary["errors"].append({"site_ids": [r.site_id for r in batch], "error": str(e)})
+        else:
+            for outcome in ("created", "updated", "unchanged"):
+                summary[outcome] += len(result[outcome])
+            summary["errors"].extend(result["errors"])
+            changed_site_ids.extend(result["created"] + result["updated"])
+            summary["batches"] += 1
+        batch.clear()
+
+    def add(location, record, error):
+        if error is None:
+            try:
+                batch.append(CompanyImport(**record))
+            except ValidationError as e:
+                error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        if error is not None:
+            summary["errors"].append({"record": location, "error": error})
+        elif len(batch) >= IMPORT_BATCH_SIZE:
+            flush()
+
+    if is_tarball:
+        spool = await spool_upload(request.stream())
+        try:
+            for member_name, record, error in iter_tarball(spool):
+                add(member_name, record, error)
+        finally:
+            spool.close()
+    else:
+        async for line_number, record, error in iter_jsonl(request.stream()):
+            add(line_number, record, error)
+    flush()
+
+    for site_id in changed_site_ids:
+        tenant_cache.invalidate(site_id)
+    if sync and changed_site_ids:
+        background_tasks.add_task(sync_companies, changed_site_ids)
+
+    return summary
+
+
+@router.get("/companies:export")
+async def export_all_companies(active_only: bool = False, include_knowledge: bool = True):
+    """
+    Stream every company as JSONL (re-importable via POST /companies:bulk)
+    Query params:
+    - active_only: Only export active companies (default: false)
+    - include_knowledge: Include knowledge_base text (default: true)
+    """
+    return StreamingResponse(
+        export_companies(active_only, include_knowledge),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="companies.jsonl"'}
+    )
 
 
 @router.get("/companies/{site_id}", response_model=CompanyResponse)
@@ -97,7 +254,11 @@ async def get_company(site_id: str, db: Session = Depends(get_db)):
 
 
 @router.post("/companies", response_model=CompanyResponse, status_code=201)
-async def create_company(company_data: CompanyCreate, db: Session = Depends(get_db)):
+async def create_company(
+    company_data: CompanyCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     """
     Create a new company/chatbot
     No redeployment needed!
@@ -128,12 +289,16 @@ async def create_company(company_data: CompanyCreate, db: Session = Depends(get_
         faqs=company_data.faqs or [],
         sms_enabled=company_data.sms_enabled,
         sms_phone_number=company_data.sms_phone_number,
+        rate_limit_per_minute=company_data.rate_limit_per_minute,
+        rate_limit_burst=company_data.rate_limit_burst,
         active=True
     )
 
     db.add(company)
     db.commit()
     db.refresh(company)
+    tenant_cache.invalidate(company.site_id)
+    background_tasks.add_task(sync_company, company.site_id)
 
     return company.to_dict()
 
@@ -142,6 +307,7 @@ async def create_company(company_data: CompanyCreate, db: Session = Depends(get_
 async def update_company(
     site_id: str,
     updates: CompanyUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -160,6 +326,9 @@ async def update_company(
     company.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(company)
+    tenant_cache.invalidate(site_id)
+    # Re-index / re-push the assistant only if the content actually changed
+    background_tasks.add_task(sync_company, site_id)
 
     return company.to_dict()
 
@@ -178,11 +347,13 @@ async def delete_company(site_id: str, permanent: bool = False, db: Session = De
     if permanent:
         db.delete(company)
         db.commit()
+        tenant_cache.invalidate(site_id)
         return {"message": f"Company '{site_id}' permanently deleted"}
     else:
         company.active = False
         company.updated_at = datetime.utcnow()
         db.commit()
+        tenant_cache.invalidate(site_id)
         return {"message": f"Company '{site_id}' deactivated"}
 
 
@@ -196,6 +367,7 @@ async def activate_company(site_id: str, db: Session = Depends(get_db)):
     company.active = True
     company.updated_at = datetime.utcnow()
     db.commit()
+    tenant_cache.invalidate(site_id)
 
     return {"message": f"Company '{site_id}' activated", "company": company.to_dict()}
 
@@ -208,6 +380,7 @@ class KnowledgeUpdate(BaseModel):
 async def update_knowledge_base(
     site_id: str,
     data: KnowledgeUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -221,5 +394,119 @@ async def update_knowledge_base(
     company.knowledge_base = data.knowledge_base
     company.updated_at = datetime.utcnow()
     db.commit()
+    tenant_cache.invalidate(site_id)
+    background_tasks.add_task(sync_company, site_id)
 
     return {"message": "Knowledge base updated", "updated_at": company.updated_at.isoformat()}
+
+
+@router.get("/companies/{site_id}/usage")
+async def get_company_usage(
+    site_id: str,
+    bucket: str = Query("day", pattern="^(hour|day)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Assistant usage for one company: runs, tokens, run time and estimated cost
+    Query params:
+    - bucket: "hour" or "day" rollups (default: day)
+    - since / until: UTC ISO timestamps (default: the last 7 days)
+    """
+    if not db.query(Company.id).filter(Company.site_id == site_id).first():
+        raise HTTPException(status_code=404, detail=f"Company '{site_id}' not found")
+
+    default_since, default_until = default_range()
+    return usage_report(db, site_id, since or default_since, until or default_until, bucket)
+
+
+@router.get("/companies/{site_id}/analytics")
+async def get_company_analytics(
+    site_id: str,
+    bucket: str = Query("day", pattern="^(hour|day)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    top: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Chat analytics for one company: conversations, questions, answer sources,
+    latency percentiles and top questions, from precomputed rollups
+    Query params:
+    - bucket: "hour" or "day" rollups (default: day)
+    - since / until: UTC ISO timestamps (default: the last 7 days)
+    - top: how many top questions to return (counts are approximate upper bounds)
+    """
+    if not db.query(Company.id).filter(Company.site_id == site_id).first():
+        raise HTTPException(status_code=404, detail=f"Company '{site_id}' not found")
+
+    default_since, default_until = default_range()
+    return analytics_report(db, site_id, since or default_since, until or default_until, bucket, top)
+
+
+def require_transcripts_token(x_admin_token: Optional[str] = Header(None)):
+    """
+    Transcripts hold customer messages (and SMS session ids hold phone numbers),
+    so unlike the rest of this router they need X-Admin-Token to match
+    TRANSCRIPTS_ADMIN_TOKEN; without that setting they can't be read at all
+    """
+    expected = os.getenv("TRANSCRIPTS_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Transcript access is disabled (TRANSCRIPTS_ADMIN_TOKEN is not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.get("/companies/{site_id}/sessions/{session_id}/messages",
+            dependencies=[Depends(require_transcripts_token)])
+async def get_session_messages(
+    site_id: str,
+    session_id: str,
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """
+    Transcript of one chat/SMS session, oldest message first (needs X-Admin-Token)
+    Messages are written in batches, so the last few seconds may not be in it yet
+    """
+    messages = session_transcript(db, site_id, session_id, limit)
+    if not messages:
+        raise HTTPException(status_code=404, detail=f"No messages for session '{session_id}' of '{site_id}'")
+    return {"site_id": site_id, "session_id": session_id, "messages": messages}
+
+
+@router.get("/usage")
+async def get_top_usage(
+    since: Optional[datetime] = None,
+    sort: str = Query("cost", pattern="^(cost|prompt_tokens|avg_prompt_tokens|run_seconds)$"),
+    limit: int = Query(20, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    Companies ranked by assistant usage, with knowledge base size alongside
+    Query params:
+    - since: UTC ISO timestamp (default: 7 days ago)
+    - sort: cost, prompt_tokens, avg_prompt_tokens or run_seconds (default: cost)
+    - limit: How many companies (default: 20)
+    """
+    return top_tenants(db, since or default_range()[0], limit, sort)
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the tenant config and answer caches, and chat coalescing (this worker)"""
+    return {
+        "tenant_cache": tenant_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "coalescing": chat_flights.stats(),
+    }
+
+
+@router.get("/runs/stats")
+async def run_stats():
+    """
+    Assistant run durations (p50/p90), poll counts and deadline timeouts per
+    tenant/model, plus the OpenAI circuit breaker's state (this worker)
+    """
+    return {**run_timings.stats(), "circuit_breaker": openai_breaker.stats()}
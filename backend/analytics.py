@@ -0,0 +1,333 @@
+"""
+Chat analytics for tenant dashboards
+A background aggregator folds new chat_messages rows into hourly and daily
+rollups (conversations, questions, answers by source, a latency histogram)
+and a bounded space-saving summary of each day's top questions. Reports only
+read rollups, so they cost the same however much history there is.
+Aggregation is exactly-once across processes: each batch runs in one
+transaction holding a lock on the watermark row
+"""
+
+import asyncio
+import os
+import traceback
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from answer_cache import normalize_question
+from models import AnalyticsRollup, AnalyticsState, ChatMessageLog, run_db
+from usage import naive_utc
+
+ANALYTICS_INTERVAL = float(os.getenv("ANALYTICS_INTERVAL", "60"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "2000"))
+# Messages younger than this wait for the next pass, so batches still being inserted aren't skipped
+ANALYTICS_SETTLE_SECONDS = float(os.getenv("ANALYTICS_SETTLE_SECONDS", "30"))
+TOP_QUESTIONS_CAPACITY = int(os.getenv("ANALYTICS_TOP_QUESTIONS_CAPACITY", "200"))  # Counters per site per day
+QUESTION_TEXT_CHARS = 200
+STATE_KEY = "chat_messages"
+
+# Upper bounds (ms) of the latency histogram buckets; one more bucket holds anything slower
+LATENCY_BUCKETS_MS = (100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 20000, 30000)
+
+RollupKey = Tuple[str, str, datetime]  # site_id, period, bucket start
+
+
+class SpaceSaving:
+    """
+    Approximate top-k counts in at most `capacity` counters (Metwally et al.)
+    Each count overestimates the true one by no more than its error
+    """
+
+    def __init__(self, capacity: int, counters: Optional[dict] = None):
+        self.capacity = capacity
+        self.counters: Dict[str, list] = {key: list(value) for key, value in (counters or {}).items()}
+
+    def add(self, key: str, text: str, count: int = 1):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [count, 0, text]
+        else:
+            # Replace the smallest counter; the newcomer inherits its count as error
+            evicted = min(self.counters, key=lambda k: self.counters[k][0])
+            floor = self.counters.pop(evicted)[0]
+            self.counters[key] = [floor + count, floor, text]
+
+    def min_count(self) -> int:
+        """What an untracked key may have been counted (0 until the summary is full)"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def to_json(self) -> dict:
+        return {key: list(value) for key, value in self.counters.items()}
+
+    @classmethod
+    def merge(cls, summaries: List["SpaceSaving"], capacity: int) -> "SpaceSaving":
+        """Combine summaries (e.g. several days); keys one summary lacks get its min count as error"""
+        merged: Dict[str, list] = {}
+        for summary in summaries:
+            for key, (count, error, text) in summary.counters.items():
+                counter = merged.setdefault(key, [0, 0, text])
+                counter[0] += count
+                counter[1] += error
+        for summary in summaries:
+            floor = summary.min_count()
+            if floor:
+                for key, counter in merged.items():
+                    if key not in summary.counters:
+                        counter[0] += floor
+                        counter[1] += floor
+        top = sorted(merged.items(), key=lambda item: item[1][0], reverse=True)[:capacity]
+        return cls(capacity, dict(top))
+
+    def top(self, n: int) -> List[dict]:
+        ranked = sorted(self.counters.values(), key=lambda counter: counter[0], reverse=True)[:n]
+        return [{"question": text, "count": count, "max_error": error} for count, error, text in ranked]
+
+
+def latency_bucket(latency_ms: int) -> int:
+    for index, bound in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= bound:
+            return index
+    return len(LATENCY_BUCKETS_MS)
+
+
+def histogram_percentile(histogram: List[int], pct: float) -> Optional[int]:
+    """Percentile (ms) from bucket counts, interpolated within the bucket"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = pct * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        if count and seen + count >= rank:
+            if index == len(LATENCY_BUCKETS_MS):
+                return LATENCY_BUCKETS_MS[-1]
+            lower = LATENCY_BUCKETS_MS[index - 1] if index else 0
+            return round(lower + (LATENCY_BUCKETS_MS[index] - lower) * (rank - seen) / count)
+        seen += count
+    return LATENCY_BUCKETS_MS[-1]
+
+
+def _bucket_start(when: datetime, period: str) -> datetime:
+    start = when.replace(minute=0, second=0, microsecond=0)
+    return start.replace(hour=0) if period == "day" else start
+
+
+def _empty_rollup() -> dict:
+    return {
+        "conversations": 0,
+        "questions": 0,
+        "answers": 0,
+        "sources": Counter(),
+        "latency_histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+        "questions_asked": [],  # (normalized, text) - daily buckets only
+    }
+
+
+def _lock_state(db: Session) -> AnalyticsState:
+    """The watermark row, locked until commit (on Postgres) so one aggregator runs at a time"""
+    query = db.query(AnalyticsState).filter(AnalyticsState.key == STATE_KEY).with_for_update()
+    state = query.first()
+    if state is None:
+        db.add(AnalyticsState(key=STATE_KEY, last_message_id=0))
+        try:
+            db.flush()
+        except IntegrityError:
+            # Another process created it first
+            db.rollback()
+        state = query.one()
+    return state
+
+
+def _new_sessions(db: Session, rows: List[ChatMessageLog], before_id: int) -> set:
+    """Sessions in this batch with no earlier messages"""
+    session_ids = {row.session_id for row in rows if row.role == "user"}
+    if not session_ids:
+        return set()
+    seen = db.query(ChatMessageLog.session_id).filter(
+        ChatMessageLog.session_id.in_(session_ids),
+        ChatMessageLog.id <= before_id,
+    ).distinct()
+    return session_ids - {session_id for (session_id,) in seen}
+
+
+def aggregate_messages(db: Session, batch_size: int = ANALYTICS_BATCH_SIZE) -> int:
+    """Fold the next batch of chat_messages into the rollups; returns messages processed"""
+    state = _lock_state(db)
+    rows = db.query(ChatMessageLog).filter(
+        ChatMessageLog.id > state.last_message_id
+    ).order_by(ChatMessageLog.id).limit(batch_size).all()
+
+    # Stop at the first message that's too new - the watermark can't skip ahead of it
+    cutoff = datetime.utcnow() - timedelta(seconds=ANALYTICS_SETTLE_SECONDS)
+    ready = []
+    for row in rows:
+        if row.created_at >= cutoff:
+            break
+        ready.append(row)
+    if not ready:
+        db.commit()
+        return 0
+
+    new_sessions = _new_sessions(db, ready, state.last_message_id)
+    rollups: Dict[RollupKey, dict] = defaultdict(_empty_rollup)
+    for row in ready:
+        for period in ("hour", "day"):
+            rollup = rollups[(row.site_id, period, _bucket_start(row.created_at, period))]
+            if row.role == "user":
+                rollup["questions"] += 1
+                if row.session_id in new_sessions:
+                    rollup["conversations"] += 1
+                if period == "day":
+                    normalized = normalize_question(row.content)
+                    if normalized:
+                        rollup["questions_asked"].append((normalized, row.content[:QUESTION_TEXT_CHARS]))
+            else:
+                rollup["answers"] += 1
+                rollup["sources"][row.source or "unknown"] += 1
+                if row.latency_ms is not None:
+                    rollup["latency_histogram"][latency_bucket(row.latency_ms)] += 1
+        if row.role == "user":
+            new_sessions.discard(row.session_id)  # Only its first message starts a conversation
+
+    existing = _load_rollups(db, list(rollups))
+    for key, counts in rollups.items():
+        _add_to_rollup(db, existing.get(key), key, counts)
+
+    state.last_message_id = ready[-1].id
+    state.last_message_at = ready[-1].created_at
+    db.commit()
+    return len(ready)
+
+
+def _load_rollups(db: Session, keys: List[RollupKey]) -> Dict[RollupKey, AnalyticsRollup]:
+    """The existing rollup rows for a batch, in one query per chunk of keys"""
+    rows = {}
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        for row in db.query(AnalyticsRollup).filter(
+            tuple_(AnalyticsRollup.site_id, AnalyticsRollup.period, AnalyticsRollup.bucket_start).in_(chunk)
+        ):
+            rows[(row.site_id, row.period, row.bucket_start)] = row
+    return rows
+
+
+def _add_to_rollup(db: Session, row: Optional[AnalyticsRollup], key: RollupKey, counts: dict):
+    """Add a batch's counts to a rollup row (safe: the watermark lock makes us the only writer)"""
+    if row is None:
+        row = AnalyticsRollup(site_id=key[0], period=key[1], bucket_start=key[2],
+                              conversations=0, questions=0, answers=0)
+        db.add(row)
+
+    row.conversations += counts["conversations"]
+    row.questions += counts["questions"]
+    row.answers += counts["answers"]
+    # JSON columns get new objects so the change is detected
+    row.sources = dict(Counter(row.sources or {}) + counts["sources"])
+    histogram = row.latency_histogram or [0] * len(counts["latency_histogram"])
+    row.latency_histogram = [a + b for a, b in zip(histogram, counts["latency_histogram"])]
+    if counts["questions_asked"]:
+        summary = SpaceSaving(TOP_QUESTIONS_CAPACITY, row.top_questions)
+        for normalized, text in counts["questions_asked"]:
+            summary.add(normalized, text)
+        row.top_questions = summary.to_json()
+
+
+async def run_aggregation() -> int:
+    """Aggregate until caught up; returns messages processed"""
+    processed = 0
+    try:
+        while True:
+            count = await run_db(aggregate_messages)
+            processed += count
+            if count < ANALYTICS_BATCH_SIZE:
+                return processed
+    except Exception as e:
+        print(f"ERROR: Analytics aggregation failed: {str(e)}")
+        print(traceback.format_exc())
+        return processed
+
+
+async def analytics_loop():
+    """Background task: fold new messages into the rollups every ANALYTICS_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(ANALYTICS_INTERVAL)
+        await run_aggregation()
+
+
+def _summarize(conversations: int, questions: int, answers: int, sources: Counter, histogram: List[int]) -> dict:
+    return {
+        "conversations": conversations,
+        "questions": questions,
+        "answers": answers,
+        "answered_by": dict(sources),
+        "latency_ms": {
+            "p50": histogram_percentile(histogram, 0.5),
+            "p90": histogram_percentile(histogram, 0.9),
+        },
+    }
+
+
+def analytics_report(db: Session, site_id: str, since: datetime, until: datetime, bucket: str,
+                     top: int) -> dict:
+    """Volume, answer sources, latency percentiles and top questions for one tenant"""
+    since, until = naive_utc(since), naive_utc(until)
+    rows = db.query(AnalyticsRollup).filter(
+        AnalyticsRollup.site_id == site_id,
+        AnalyticsRollup.period == bucket,
+        AnalyticsRollup.bucket_start >= _bucket_start(since, bucket),
+        AnalyticsRollup.bucket_start < until,
+    ).order_by(AnalyticsRollup.bucket_start).all()
+
+    # Top questions are kept per day
+    days = rows if bucket == "day" else db.query(AnalyticsRollup).filter(
+        AnalyticsRollup.site_id == site_id,
+        AnalyticsRollup.period == "day",
+        AnalyticsRollup.bucket_start >= _bucket_start(since, "day"),
+        AnalyticsRollup.bucket_start < until,
+    ).all()
+    top_questions = SpaceSaving.merge(
+        [SpaceSaving(TOP_QUESTIONS_CAPACITY, day.top_questions) for day in days if day.top_questions],
+        TOP_QUESTIONS_CAPACITY,
+    )
+
+    histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    sources = Counter()
+    for row in rows:
+        for index, count in enumerate(row.latency_histogram or []):
+            histogram[index] += count
+        sources.update(row.sources or {})
+
+    state = db.query(AnalyticsState).filter(AnalyticsState.key == STATE_KEY).first()
+    return {
+        "site_id": site_id,
+        "bucket": bucket,
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        # Newer messages aren't in the numbers yet
+        "aggregated_until": state.last_message_at.isoformat() if state and state.last_message_at else None,
+        "totals": _summarize(
+            sum(row.conversations for row in rows),
+            sum(row.questions for row in rows),
+            sum(row.answers for row in rows),
+            sources,
+            histogram,
+        ),
+        "top_questions": top_questions.top(top),
+        "buckets": [
+            {
+                "start": row.bucket_start.isoformat(),
+                **_summarize(row.conversations, row.questions, row.answers,
+                             Counter(row.sources or {}), row.latency_histogram or []),
+            }
+            for row in rows
+        ],
+    }
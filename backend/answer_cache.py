@@ -0,0 +1,184 @@
+"""
+Per-tenant answer cache for repeated questions
+Matches on normalized text. With ANSWER_CACHE_THRESHOLD below 1.0 it also
+matches on character-trigram similarity, but only between questions with the
+same content words: "How much does the card cost?" and "how much does a card
+cost" can share one answer, "Medicaid" and "Medicare" never do.
+Entries are tied to the company's updated_at, so editing the knowledge base
+(or any other company field) drops that tenant's cached answers
+"""
+
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, FrozenSet, NamedTuple, Optional, Set
+
+from faq_matcher import tokenize
+
+_NON_WORD = re.compile(r'[^\w\s]')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    text = _NON_WORD.sub(' ', text.lower())
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def trigrams(normalized: str) -> Set[str]:
+    """Character trigrams of a normalized string (padded at word edges)"""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Entry(NamedTuple):
+    created: float
+    answer: str
+    grams: frozenset
+    terms: FrozenSet[str]  # Content words (no stopwords)
+
+
+class _TenantAnswers:
+    """One tenant's cached answers plus a trigram → question inverted index"""
+
+    def __init__(self, version: Optional[datetime]):
+        self.version = version
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.index: Dict[str, Set[str]] = {}
+
+    def add(self, key: str, entry: _Entry):
+        self.remove(key)
+        self.entries[key] = entry
+        for gram in entry.grams:
+            self.index.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry.grams:
+            keys = self.index.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.index[gram]
+
+    def most_similar(self, grams: Set[str], terms: FrozenSet[str]):
+        """Best (key, jaccard) among questions with the same content words sharing at least one trigram"""
+        shared = Counter()
+        for gram in grams:
+            for key in self.index.get(gram, ()):
+                shared[key] += 1
+
+        best_key, best_score = None, 0.0
+        for key, overlap in shared.items():
+            if self.entries[key].terms != terms:
+                continue  # One different word ("Saturday" / "Sunday") is a different question
+            score = overlap / (len(grams) + len(self.entries[key].grams) - overlap)
+            if score > best_score:
+                best_key, best_score = key, score
+        return best_key, best_score
+
+
+class AnswerCache:
+    """
+    Answer cache keyed by (site_id, company version)
+    threshold 1.0 (the default) only uses exact hits on the normalized text
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries_per_tenant: int, threshold: float):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_tenant = max_entries_per_tenant
+        self.threshold = threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.site_hits: Counter = Counter()
+        self.site_misses: Counter = Counter()
+        self._tenants: Dict[str, _TenantAnswers] = {}
+        self._lock = threading.Lock()
+
+    def _tenant(self, site_id: str, version: Optional[datetime]) -> _TenantAnswers:
+        tenant = self._tenants.get(site_id)
+        if tenant is None or tenant.version != version:
+            # Company changed since these answers were cached - start over
+            tenant = _TenantAnswers(version)
+            self._tenants[site_id] = tenant
+        return tenant
+
+    def get(self, site_id: str, version: Optional[datetime], question: str) -> Optional[str]:
+        """Return a cached answer for this question, or None"""
+        key = normalize_question(question)
+        now = time.monotonic()
+
+        with self._lock:
+            tenant = self._tenant(site_id, version)
+
+            entry = tenant.entries.get(key)
+            similar = False
+            if entry is None and self.threshold < 1.0 and tenant.entries:
+                match_key, score = tenant.most_similar(trigrams(key), frozenset(tokenize(key)))
+                if match_key is not None and score >= self.threshold:
+                    key, entry, similar = match_key, tenant.entries[match_key], True
+
+            if entry is not None and now - entry.created >= self.ttl_seconds:
+                tenant.remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                self.site_misses[site_id] += 1
+                return None
+
+            tenant.entries.move_to_end(key)
+            self.hits += 1
+            self.site_hits[site_id] += 1
+            if similar:
+                self.similar_hits += 1
+            return entry.answer
+
+    def put(self, site_id: str, version: Optional[datetime], question: str, answer: str):
+        """Cache an answer for a question"""
+        key = normalize_question(question)
+        if not key:
+            return
+
+        with self._lock:
+            tenant = self._tenant(site_id, version)
+            tenant.add(key, _Entry(time.monotonic(), answer, frozenset(trigrams(key)),
+                                   frozenset(tokenize(key))))
+            while len(tenant.entries) > self.max_entries_per_tenant:
+                oldest = next(iter(tenant.entries))
+                tenant.remove(oldest)
+
+    def invalidate(self, site_id: Optional[str] = None):
+        """Drop cached answers for one tenant (or all)"""
+        with self._lock:
+            if site_id is None:
+                self._tenants.clear()
+            else:
+                self._tenants.pop(site_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": sum(len(t.entries) for t in self._tenants.values()),
+            "by_site": {
+                site_id: {"hits": self.site_hits[site_id], "misses": self.site_misses[site_id]}
+                for site_id in set(self.site_hits) | set(self.site_misses)
+            },
+        }
+
+
+answer_cache = AnswerCache(
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    max_entries_per_tenant=int(os.getenv("ANSWER_CACHE_SIZE", "256")),
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "1.0")),
+)
@@ -0,0 +1,205 @@
+"""
+One assistant turn: add the user's message to a thread and run the assistant
+Shared by the web chat and SMS paths
+"""
+
+import time
+import uuid
+from typing import NamedTuple, Optional
+
+import openai
+
+from models import run_db
+from openai_client import get_async_client, tenant_slot
+from citations import strip_citations
+from sessions import add_user_message, get_session_history, record_turn
+from retrieval import retrieve_instructions
+from tenant_cache import tenant_cache
+from answer_cache import answer_cache
+from jobs import PermanentJobError, final_attempt, register_handler
+from run_poller import wait_for_run
+from metrics import FALLBACKS, RUN_POLLS, observe_stage, site_label, track_stage
+from usage import usage_tracker
+from circuit_breaker import FAILURE, IGNORE, SUCCESS, CircuitOpenError, is_outage, openai_breaker
+from fallbacks import fallback_answer
+from history import HistoryContext, summary_instructions
+from transcripts import transcript_log
+
+# Run errors that mean OpenAI is struggling (others, like invalid prompts, are on us)
+OUTAGE_RUN_ERRORS = ("server_error", "rate_limit_exceeded")
+
+
+class TurnFailedError(Exception):
+    """An assistant run that failed or timed out (raised instead of a fallback when asked to)"""
+
+
+class TurnResult(NamedTuple):
+    thread_id: str
+    status: str  # Final run status
+    reply: Optional[str]  # Citation-free reply text (only when completed)
+    polls: int = 0  # Run status checks made
+    run_seconds: float = 0.0  # Run creation until its final status was seen
+    timed_out: bool = False  # Cancelled at the deadline
+    error_code: Optional[str] = None  # The run's last_error code, if it failed
+
+
+async def run_turn(company, thread_id: Optional[str], text: str,
+                   history: Optional[HistoryContext] = None) -> TurnResult:
+    """
+    Continue (or start) a thread with `text` and wait for the assistant's reply
+    With a compacted `history` the run only sees its last turns plus the summary
+    Raises CircuitOpenError, without calling OpenAI, while the breaker is open
+    """
+    if not openai_breaker.allow():
+        raise CircuitOpenError("OpenAI circuit breaker is open")
+
+    started = time.perf_counter()
+    outcome = IGNORE
+    try:
+        turn = await _run_turn(company, thread_id, text, history)
+        outcome = _turn_outcome(turn)
+        return turn
+    except Exception as e:
+        outcome = FAILURE if is_outage(e) else IGNORE
+        raise
+    finally:
+        openai_breaker.record(outcome, time.perf_counter() - started)
+
+
+def _turn_outcome(turn: TurnResult) -> str:
+    """How a finished turn counts towards the circuit breaker"""
+    if turn.status == 'completed':
+        return SUCCESS
+    if turn.timed_out or turn.status == 'expired' or turn.error_code in OUTAGE_RUN_ERRORS:
+        return FAILURE
+    return IGNORE
+
+
+def run_options(excerpts: str, history: Optional[HistoryContext]) -> dict:
+    """additional_instructions (plus truncation_strategy for a compacted history) for a run"""
+    if history is None:
+        return {"additional_instructions": excerpts}
+    return {
+        "additional_instructions": (excerpts or "") + summary_instructions(history),
+        "truncation_strategy": {"type": "last_messages", "last_messages": history.last_messages},
+    }
+
+
+async def _run_turn(company, thread_id: Optional[str], text: str,
+                    history: Optional[HistoryContext]) -> TurnResult:
+    client = get_async_client()
+    site_id, model = company.site_id, company.model
+
+    # Only the knowledge base sections relevant to this question ride along
+    with track_stage("retrieval", site_id, model):
+        excerpts = await retrieve_instructions(site_id, company.updated_at, text)
+
+    # Cap in-flight runs per tenant; awaiting keeps the event loop free
+    queued = time.perf_counter()
+    async with tenant_slot(site_id):
+        observe_stage("tenant_slot_wait", time.perf_counter() - queued, site_id, model)
+
+        # Continue the session's thread, or start one for a new session
+        with track_stage("message_add" if thread_id else "thread_create", site_id, model):
+            thread_id = await add_user_message(thread_id, text)
+
+        with track_stage("run_create", site_id, model):
+            run = await client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=company.assistant_id,
+                **run_options(excerpts, history)
+            )
+        # Adaptive polling with a hard deadline (see run_poller)
+        with track_stage("run_poll", site_id, model):
+            waited = await wait_for_run(client, run, site_id, model)
+        RUN_POLLS.labels(site_label(site_id), model or "default").observe(waited.polls)
+        run = waited.run
+        usage_tracker.record(site_id, model, run.usage, waited.seconds, waited.timed_out)
+
+        if run.status != 'completed':
+            error_code = run.last_error.code if run.last_error else None
+            return TurnResult(thread_id, run.status, None, waited.polls, waited.seconds, waited.timed_out, error_code)
+
+        with track_stage("message_list", site_id, model):
+            messages = await client.beta.threads.messages.list(thread_id=thread_id, limit=1)
+
+    # Remove citation annotations like 【4:0†source】
+    with track_stage("citation_strip", site_id, model):
+        reply = strip_citations(messages.data[0].content[0].text.value)
+    return TurnResult(thread_id, run.status, reply, waited.polls, waited.seconds)
+
+
+async def answer_chat(company, session_id: Optional[str], thread_id: Optional[str], text: str,
+                      history: Optional[HistoryContext] = None, raise_on_error: bool = False) -> dict:
+    """
+    Run a web chat turn and record it
+    Returns {"response", "session_id", "source"}. When the assistant can't
+    answer (breaker open, OpenAI error, failed or too slow run) the response
+    is a tenant fallback with source "fallback" - unless raise_on_error, when
+    OpenAI errors propagate and failed runs raise TurnFailedError, so a
+    queued job is retried (an open breaker still gets the fallback)
+    """
+    try:
+        turn = await run_turn(company, thread_id, text, history)
+    except CircuitOpenError:
+        return _fallback(company, session_id, text, "circuit_open")
+    except openai.OpenAIError as e:
+        if raise_on_error:
+            raise
+        print(f"ERROR: Assistant turn for {company.site_id} failed: {str(e)}")
+        return _fallback(company, session_id, text, "openai_error")
+
+    session_id = session_id or turn.thread_id
+    # Record even failed turns - the question is in the thread either way
+    session_id = await run_db(record_turn, session_id, company.site_id, turn.thread_id, text, turn.reply)
+
+    if turn.status != 'completed':
+        if raise_on_error:
+            raise TurnFailedError(f"Assistant run for {company.site_id} ended with status {turn.status}"
+                                  f"{' (timed out)' if turn.timed_out else f' ({turn.error_code})'}")
+        if not turn.timed_out:
+            print(f"⚠ Assistant run for {company.site_id} ended with status {turn.status} ({turn.error_code})")
+        return _fallback(company, session_id, text, "timeout" if turn.timed_out else "run_failed")
+
+    # Only opening questions are cacheable (follow-ups depend on the thread)
+    if thread_id is None:
+        answer_cache.put(company.site_id, company.updated_at, text, turn.reply)
+
+    return {"response": turn.reply, "session_id": session_id, "source": "assistant"}
+
+
+def degraded_reply(company, text: str, reason: str) -> str:
+    """A tenant fallback answer for `text`, counted by reason and kind"""
+    reply, kind = fallback_answer(company, text)
+    FALLBACKS.labels(site_label(company.site_id), reason, kind).inc()
+    return reply
+
+
+def _fallback(company, session_id: Optional[str], text: str, reason: str) -> dict:
+    return {
+        "response": degraded_reply(company, text, reason),
+        "session_id": session_id or f"session_{uuid.uuid4().hex}",
+        "source": "fallback",
+    }
+
+
+@register_handler("chat")
+async def chat_job(payload: dict) -> dict:
+    """
+    Job handler: a queued /api/chat message
+    Errors propagate so the job is retried; only the last attempt settles for a fallback
+    """
+    company = await tenant_cache.get(payload["site_id"])
+    if company is None or not company.assistant_id:
+        raise PermanentJobError(f"Company '{payload['site_id']}' not found, inactive or without an assistant")
+
+    started = time.perf_counter()
+    session_id = payload.get("session_id")
+    thread_id, history = (await run_db(get_session_history, session_id, company.site_id)
+                          if session_id else (None, None))
+    answer = await answer_chat(company, session_id, thread_id, payload["message"], history,
+                               raise_on_error=not final_attempt())
+    # Latency here is queue pickup to answer (the web request may have gotten a 202 meanwhile)
+    transcript_log.record(company.site_id, answer["session_id"], payload["message"], answer["response"],
+                          answer["source"], time.perf_counter() - started)
+    return answer
@@ -0,0 +1,150 @@
+"""
+Assistant instruction building and change-only syncing
+Each company's assistant is re-pushed to OpenAI only when the hash of what
+we'd send (model + instructions built from system_prompt/knowledge_base)
+differs from the last successful push
+"""
+
+import os
+import traceback
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from models import AssistantSync, Company, run_db
+from openai_client import get_async_client
+from retrieval import content_hash, index_store, knowledge_mode
+
+# Re-push stale assistants when the app starts (e.g. after a KNOWLEDGE_MODE change)
+SYNC_ON_STARTUP = os.getenv("ASSISTANT_SYNC_ON_STARTUP", "true").lower() == "true"
+
+
+def build_instructions(company: Company) -> str:
+    """
+    Assistant instructions for a company
+    In retrieval mode (default) the knowledge base is left out - the relevant
+    excerpts are attached to each run instead (see retrieval.py).
+    KNOWLEDGE_MODE=embedded restores the full knowledge base in the instructions.
+    """
+    style = "Provide responses in a natural, conversational tone without excessive markdown formatting (avoid bullet points and bold text unless specifically needed for clarity)."
+
+    if knowledge_mode() == "retrieval":
+        return f"""{company.system_prompt}
+
+Relevant knowledge base excerpts are provided with each question. Use them to answer questions accurately. {style}"""
+
+    # Combine system prompt with knowledge base
+    return f"""{company.system_prompt}
+
+KNOWLEDGE BASE:
+{company.knowledge_base}
+
+Use the knowledge base above to answer questions accurately. {style}"""
+
+
+def assistant_hash(company: Company) -> str:
+    """Hash of everything we push to the assistant"""
+    return content_hash(f"{company.model}\0{build_instructions(company)}")
+
+
+def pending_hash(db: Session, company: Company) -> Optional[str]:
+    """The new content hash if the assistant is out of date, else None"""
+    new_hash = assistant_hash(company)
+    state = db.get(AssistantSync, company.site_id)
+    if state and state.assistant_id == company.assistant_id and state.content_hash == new_hash:
+        return None
+    return new_hash
+
+
+def record_sync(db: Session, company: Company, new_hash: str):
+    """Remember what was pushed (caller commits)"""
+    state = db.get(AssistantSync, company.site_id)
+    if state is None:
+        state = AssistantSync(site_id=company.site_id)
+        db.add(state)
+    state.assistant_id = company.assistant_id
+    state.content_hash = new_hash
+    state.synced_at = datetime.utcnow()
+
+
+def _prepare_sync(db: Session, site_id: str):
+    """
+    Bring the retrieval index up to date and work out whether the assistant
+    needs a push; returns (company, new hash) or None. Runs in a worker thread
+    """
+    company = db.query(Company).filter(Company.site_id == site_id).first()
+    if company is None:
+        return None
+
+    index_store.get(company.site_id, company.updated_at)
+
+    if not company.assistant_id:
+        return None
+
+    new_hash = pending_hash(db, company)
+    if new_hash is None:
+        print(f"✓ Assistant for {site_id} already up to date")
+        return None
+    return company, new_hash
+
+
+def _finish_sync(db: Session, company: Company, new_hash: str):
+    record_sync(db, company, new_hash)
+    db.commit()
+
+
+async def sync_company(site_id: str):
+    """
+    Background task run after admin writes
+    Updates the retrieval index incrementally and re-pushes the assistant
+    only if its instructions/model actually changed. The DB and index work
+    runs off the event loop, so a sync doesn't hold up chat traffic
+    """
+    try:
+        pending = await run_db(_prepare_sync, site_id)
+        if pending is None:
+            return
+        company, new_hash = pending
+
+        await get_async_client().beta.assistants.update(
+            assistant_id=company.assistant_id,
+            instructions=build_instructions(company),
+            model=company.model
+        )
+        await run_db(_finish_sync, company, new_hash)
+        print(f"✓ Synced assistant for {site_id}")
+
+    except Exception as e:
+        print(f"ERROR: Assistant sync failed for {site_id}: {str(e)}")
+        print(traceback.format_exc())
+
+
+def _stale_sites(db: Session) -> List[str]:
+    """Active companies whose assistant differs from what build_instructions() makes now"""
+    companies = db.query(Company).filter(
+        Company.active == True,
+        Company.assistant_id.isnot(None)
+    ).all()
+    return [company.site_id for company in companies if pending_hash(db, company) is not None]
+
+
+async def sync_stale_assistants():
+    """
+    Startup task: re-push every assistant whose stored hash is out of date
+    Existing assistants still carry whatever instructions they were last given
+    (e.g. the full knowledge base from before retrieval mode) until this runs.
+    One at a time, and each is re-checked first, so several workers booting
+    together mostly skip what another already pushed
+    """
+    try:
+        site_ids = await run_db(_stale_sites)
+    except Exception as e:
+        print(f"ERROR: Checking assistants for stale instructions failed: {str(e)}")
+        return
+
+    if not site_ids:
+        return
+    print(f"⚠ {len(site_ids)} assistant(s) out of date, re-syncing")
+    for site_id in site_ids:
+        await sync_company(site_id)
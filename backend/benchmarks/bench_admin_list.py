@@ -0,0 +1,150 @@
+"""
+Benchmark: GET /api/admin/companies on a large SQLite database
+Compares the old load-everything listing (query.all() + full to_dict()) with
+keyset pages, a fields= projection, and summary mode
+
+Usage (from backend/):
+    python benchmarks/bench_admin_list.py --companies 10000 --kb-chars 8000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+
+def setup_environment():
+    tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+
+
+def seed_companies(count: int, kb_chars: int):
+    """Insert synthetic companies with realistic-size knowledge bases and FAQs"""
+    from models import Company, engine, init_db
+
+    init_db()
+    rng = random.Random(11)
+    words = "pharmacy savings card family hospital provider hours coverage discount member".split()
+    now = datetime.utcnow()
+
+    rows = []
+    for i in range(count):
+        knowledge = " ".join(rng.choice(words) for _ in range(kb_chars // 8))
+        rows.append({
+            "site_id": f"site-{i:05d}",
+            "name": f"Company {i}",
+            "domain": f"company{i}.example",
+            "primary_color": "#0066cc",
+            "greeting": "Hi!",
+            "model": "gpt-4o-mini",
+            "temperature": "0.4",
+            "max_tokens": 500,
+            "system_prompt": "You are a helpful assistant.",
+            "contact_info": {"phone": "555-0100"},
+            "knowledge_base": f"# Overview\n{knowledge}",
+            "faqs": [{"question": f"Question {j}?", "answer": "Answer " * 20} for j in range(10)],
+            "sms_enabled": False,
+            "active": True,
+            "created_at": now,
+            "updated_at": now,
+        })
+    with engine.begin() as conn:
+        conn.execute(Company.__table__.insert(), rows)
+
+
+def legacy_list():
+    """The old list_companies body: every row, every column"""
+    from models import Company, SessionLocal
+
+    db = SessionLocal()
+    try:
+        import json
+        return len(json.dumps([c.to_dict() for c in db.query(Company).filter(Company.active == True).all()]))
+    finally:
+        db.close()
+
+
+async def timed_get(client, url: str, repeat: int):
+    times, size = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        times.append(time.perf_counter() - start)
+        size = len(response.content)
+    return statistics.median(times) * 1000, size, response
+
+
+async def walk_all(client, query: str):
+    """Fetch every page via X-Next-Cursor"""
+    start = time.perf_counter()
+    total_bytes, rows, cursor = 0, 0, None
+    while True:
+        url = f"/api/admin/companies?limit=1000&{query}" + (f"&after={cursor}" if cursor else "")
+        response = await client.get(url)
+        response.raise_for_status()
+        total_bytes += len(response.content)
+        rows += len(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return (time.perf_counter() - start) * 1000, total_bytes, rows
+
+
+def row(label: str, ms: float, size: int):
+    print(f"{label:<44} {ms:>10.1f} {size / 1024:>12,.0f}")
+
+
+async def run(args):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        print(f"{'request':<44} {'ms (p50)':>10} {'KiB':>12}")
+
+        start = time.perf_counter()
+        size = legacy_list()
+        row("old: all rows, full to_dict (in-process)", (time.perf_counter() - start) * 1000, size)
+
+        for label, url in (
+            ("page of 100, full", "/api/admin/companies?limit=100"),
+            ("page of 100, fields=site_id,name,branding", "/api/admin/companies?limit=100&fields=site_id,name,branding"),
+            ("page of 100, summary", "/api/admin/companies?limit=100&summary=true"),
+            ("deep page (after=9000), summary", "/api/admin/companies?limit=100&summary=true&after=9000"),
+        ):
+            ms, size, _ = await timed_get(client, url, args.repeat)
+            row(label, ms, size)
+
+        ms, size, rows = await walk_all(client, "summary=true")
+        row(f"all {rows} via cursor, summary", ms, size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=10000)
+    parser.add_argument("--kb-chars", type=int, default=8000, help="Knowledge base size per company")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_environment()
+    start = time.perf_counter()
+    seed_companies(args.companies, args.kb_chars)
+    print("="*60)
+    print(f"Admin Listing Benchmark ({args.companies:,} companies, "
+          f"{args.kb_chars:,}-char knowledge bases; seeded in {time.perf_counter() - start:.1f}s)")
+    print("="*60)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Analytics benchmark: rollup-backed report vs querying chat_messages directly
+Loads --messages transcript rows spread over --days, aggregates them, then
+times a 7-day report both ways as history grows. The raw version is the
+obvious GROUP BY (volume per day, top questions, latencies for a median)
+
+Usage (from backend/):
+    python benchmarks/bench_analytics.py --messages 20000 100000 400000
+    DATABASE_URL=postgresql://... python benchmarks/bench_analytics.py
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+QUESTIONS = [f"Question about topic {i}?" for i in range(500)]
+
+
+def setup_environment():
+    """A throwaway SQLite DB unless DATABASE_URL is set; everything loaded is old enough to aggregate"""
+    if not os.getenv("DATABASE_URL"):
+        tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["ANALYTICS_SETTLE_SECONDS"] = "0"
+
+
+def load_messages(db, count: int, days: int, offset: int):
+    """Insert `count` exchanges (question + answer rows) over the last `days` days"""
+    from models import ChatMessageLog
+
+    now = datetime.utcnow()
+    # In time order, like real inserts (each aggregation batch then touches a few rollup rows)
+    times = sorted(now - timedelta(seconds=random.uniform(60, days * 86400)) for _ in range(count))
+    rows = []
+    for i, when in zip(range(offset, offset + count), times):
+        # Zipf-ish: a few questions are asked far more than the rest
+        question = QUESTIONS[min(len(QUESTIONS) - 1, int(random.paretovariate(1.2)) - 1)]
+        common = {"site_id": "bench", "session_id": f"session_{i // 4}", "channel": "web"}
+        rows.append({**common, "role": "user", "content": question, "created_at": when})
+        rows.append({**common, "role": "assistant", "content": "An answer.", "source": "assistant",
+                     "latency_ms": int(random.lognormvariate(7, 0.5)), "created_at": when})
+        if len(rows) >= 10000:
+            db.bulk_insert_mappings(ChatMessageLog, rows)
+            db.commit()
+            rows = []
+    if rows:
+        db.bulk_insert_mappings(ChatMessageLog, rows)
+        db.commit()
+
+
+def raw_report(db, since: datetime, top: int) -> dict:
+    from sqlalchemy import func
+    from models import ChatMessageLog
+
+    base = db.query(ChatMessageLog).filter(ChatMessageLog.site_id == "bench", ChatMessageLog.created_at >= since)
+    per_day = base.filter(ChatMessageLog.role == "user").with_entities(
+        func.date(ChatMessageLog.created_at), func.count()
+    ).group_by(func.date(ChatMessageLog.created_at)).all()
+    questions = base.filter(ChatMessageLog.role == "user").with_entities(
+        ChatMessageLog.content, func.count()
+    ).group_by(ChatMessageLog.content).order_by(func.count().desc()).limit(top).all()
+    latencies = [latency for (latency,) in base.filter(ChatMessageLog.role == "assistant").with_entities(
+        ChatMessageLog.latency_ms
+    )]
+    return {"days": per_day, "top": questions, "p50": statistics.median(latencies) if latencies else None}
+
+
+def timed(fn, repeat: int = 5) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[20000, 100000, 400000],
+                        help="Total exchanges in history at each step")
+    parser.add_argument("--days", type=int, default=90, help="History spread over this many days")
+    args = parser.parse_args()
+
+    setup_environment()
+    from analytics import aggregate_messages, analytics_report
+    from models import SessionLocal, init_db
+
+    print("="*60)
+    print("Analytics Benchmark")
+    print("="*60)
+    print(f"History over {args.days} days | report: last 7 days, daily buckets, top 20 questions")
+
+    init_db()
+    db = SessionLocal()
+    random.seed(7)
+    loaded = 0
+    print(f"\n{'exchanges':>10} {'aggregate (s)':>14} {'raw (ms)':>10} {'rollups (ms)':>13}")
+    for total in args.messages:
+        load_messages(db, total - loaded, args.days, loaded)
+        loaded = total
+
+        start = time.perf_counter()
+        while aggregate_messages(db) > 0:
+            pass
+        aggregated = time.perf_counter() - start
+
+        since, until = datetime.utcnow() - timedelta(days=7), datetime.utcnow()
+        raw = timed(lambda: raw_report(db, since, 20))
+        rollup = timed(lambda: analytics_report(db, "bench", since, until, "day", 20))
+        print(f"{total:>10} {aggregated:>14.2f} {raw * 1000:>10.1f} {rollup * 1000:>13.1f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark: sequential setup_assistants.py vs. concurrent bulk_provision.py
+Seeds N companies without assistants and provisions them both ways against
+the stub OpenAI server, which adds per-call latency and returns 429s above
+--stub-rps (like a real account's rate limit)
+
+Usage (from backend/):
+    python benchmarks/bench_bulk_provision.py --companies 300 --stub-rps 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import stub_openai
+
+
+def setup_environment(args):
+    tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["RETRIEVAL_INDEX_DIR"] = f"{tmp_dir}/indexes"
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+
+
+def seed_companies(count: int):
+    """Fresh set of active companies with no assistant yet"""
+    from models import AssistantSync, Company, SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    db.query(AssistantSync).delete()
+    db.query(Company).delete()
+    for i in range(count):
+        db.add(Company(
+            site_id=f"bench-{i:04d}",
+            name=f"Bench Co {i}",
+            primary_color="#0066cc",
+            greeting="Hi!",
+            system_prompt="You are a helpful assistant. Be concise.",
+            knowledge_base=f"# Overview\nBench company {i} knowledge base.\n",
+            faqs=[],
+            active=True,
+        ))
+    db.commit()
+    db.close()
+
+
+def provisioned_count() -> int:
+    from models import Company, SessionLocal
+
+    db = SessionLocal()
+    try:
+        return db.query(Company).filter(Company.assistant_id.isnot(None)).count()
+    finally:
+        db.close()
+
+
+def run_sequential() -> float:
+    import setup_assistants
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup_assistants.setup_all_assistants()
+    return time.perf_counter() - start
+
+
+def run_bulk(args) -> tuple:
+    import bulk_provision
+    from models import SessionLocal
+
+    db = SessionLocal()
+    try:
+        changes = bulk_provision.plan_changes(db)
+    finally:
+        db.close()
+
+    start = time.perf_counter()
+    stats = asyncio.run(bulk_provision.provision(
+        changes, args.concurrency, args.rate, args.burst, args.batch_size
+    ))
+    return time.perf_counter() - start, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=300)
+    parser.add_argument("--stub-latency", type=float, default=0.15, help="Seconds per assistant call")
+    parser.add_argument("--stub-rps", type=float, default=20.0, help="Stub rate limit (requests/second)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=18.0, help="Bulk client request rate")
+    parser.add_argument("--burst", type=float, default=10.0)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--skip-sequential", action="store_true")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    setup_environment(args)
+    stub_openai.serve(args.port)
+    stub_openai.stub_app.state.assistant_latency = args.stub_latency
+    stub_openai.stub_app.state.assistant_rps = args.stub_rps
+
+    print("="*60)
+    print(f"Bulk Provisioning Benchmark ({args.companies} companies, "
+          f"{args.stub_latency * 1000:.0f} ms/call, {args.stub_rps:g} req/s limit)")
+    print("="*60)
+    print(f"{'mode':<12} {'seconds':>9} {'companies/s':>12} {'provisioned':>12} {'429s':>6}")
+
+    if not args.skip_sequential:
+        seed_companies(args.companies)
+        stub_openai.stats["rate_limited"] = 0
+        elapsed = run_sequential()
+        print(f"{'sequential':<12} {elapsed:>9.1f} {args.companies / elapsed:>12.1f} "
+              f"{provisioned_count():>12} {stub_openai.stats['rate_limited']:>6}")
+
+    seed_companies(args.companies)
+    stub_openai.stats["rate_limited"] = 0
+    elapsed, stats = run_bulk(args)
+    print(f"{'bulk':<12} {elapsed:>9.1f} {args.companies / elapsed:>12.1f} "
+          f"{provisioned_count():>12} {stub_openai.stats['rate_limited']:>6}")
+    print(f"\nBulk: {stats['retries']} retries, {stats['failed']} failed, {stats['commits']} commits")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Load benchmark for /api/chat against a local stub OpenAI server
+Shows throughput with N in-flight chats and that other endpoints stay responsive
+
+Usage (from backend/):
+    python benchmarks/bench_chat_load.py --concurrency 1 8 32 64 --requests 128
+    python benchmarks/bench_chat_load.py --concurrency 64 --same-question  # request coalescing
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+import stub_openai
+from stub_openai import serve
+
+
+def setup_environment(args):
+    """Point the app at a throwaway SQLite DB and the stub server"""
+    tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["TENANT_MAX_CONCURRENCY"] = str(args.tenant_limit)
+    os.environ["ANSWER_CACHE_TTL"] = "0"  # Every chat is a real (stub) run
+    os.environ["RATE_LIMIT_CLIENT_PER_MINUTE"] = "0"  # All requests come from one IP
+    os.environ["RATE_LIMIT_SITE_PER_MINUTE"] = "0"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct * (len(values) - 1))))]
+
+
+def seed_company():
+    from models import Company, init_db, SessionLocal
+
+    init_db()
+    db = SessionLocal()
+    db.add(Company(
+        site_id="bench",
+        name="Bench Co",
+        primary_color="#0066cc",
+        greeting="Hi!",
+        assistant_id="asst_stub",
+        knowledge_base="",
+        active=True,
+    ))
+    db.commit()
+    db.close()
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total: int, same_question: bool = False):
+    """Send `total` chats with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    config_latencies = []
+    done = asyncio.Event()
+
+    async def one_chat(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/chat", json={
+                "message": "Is the card free?" if same_question else f"Is the card free? #{i}",
+                "site": "bench",
+            })
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    async def probe_config():
+        # Widget config fetches while chats are in flight
+        while not done.is_set():
+            start = time.perf_counter()
+            await client.get("/api/config/bench")
+            config_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.05)
+
+    runs_before = len(stub_openai.runs)
+    probe = asyncio.create_task(probe_config())
+    start = time.perf_counter()
+    await asyncio.gather(*(one_chat(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe
+
+    return {
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "throughput": total / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "config_p95": percentile(config_latencies, 0.95),
+        "runs": len(stub_openai.runs) - runs_before,
+    }
+
+
+async def main_async(args):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        print(f"\n{'in-flight':>10} {'chats/s':>10} {'p50 (s)':>10} {'p95 (s)':>10} "
+              f"{'config p95 (ms)':>16} {'runs':>6}")
+        for concurrency in args.concurrency:
+            result = await run_level(client, concurrency, args.requests, args.same_question)
+            print(
+                f"{result['concurrency']:>10} {result['throughput']:>10.1f} "
+                f"{result['p50']:>10.3f} {result['p95']:>10.3f} {result['config_p95'] * 1000:>16.1f} "
+                f"{result['runs']:>6}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub run latency in seconds")
+    parser.add_argument("--tenant-limit", type=int, default=64)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--same-question", action="store_true",
+                        help="Every chat asks the identical opening question (shows request coalescing)")
+    args = parser.parse_args()
+
+    setup_environment(args)
+    serve(args.port, args.latency)
+    seed_company()
+
+    print("="*60)
+    print("Chat Load Benchmark (stub OpenAI)")
+    print("="*60)
+    print(f"Run latency: {args.latency}s | Requests per level: {args.requests} | "
+          f"Tenant limit: {args.tenant_limit}")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Cold start benchmark: import time and time-to-first-request per boot
+Times `import main` in fresh interpreters, then boots uvicorn repeatedly and
+measures from process start to the first 200 from /api/config/<site> (a
+tenant lookup), for each DB_SCHEMA_MODE: "create" runs create_all on every
+boot (the old behaviour), "auto" skips it once the stored schema version
+matches, "skip" trusts the schema entirely
+
+Usage (from backend/):
+    python benchmarks/bench_cold_start.py --companies 500 --boots 5
+    DATABASE_URL=postgresql://... python benchmarks/bench_cold_start.py
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def setup_environment():
+    """A throwaway SQLite DB unless DATABASE_URL is set; OpenAI is never called"""
+    if not os.getenv("DATABASE_URL"):
+        tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-stub")
+
+
+def seed_companies(count: int):
+    from models import Company, SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    if db.query(Company).filter(Company.site_id.like("coldstart_%")).count() == 0:
+        faqs = [{"question": f"What is covered by plan {i}?", "answer": f"Plan {i} covers the basics."}
+                for i in range(20)]
+        db.add_all(Company(site_id=f"coldstart_{i}", name=f"Cold Start {i}", greeting="Hi!",
+                           assistant_id="asst_stub", knowledge_base="", faqs=faqs, active=True)
+                   for i in range(count))
+        db.commit()
+    db.close()
+
+
+def count_init_queries(mode: str) -> tuple:
+    """(statements, seconds) for one init_db() call - each statement is a round trip on a remote DB"""
+    from sqlalchemy import event
+    from models import engine, init_db
+
+    statements = []
+
+    def count(*args):
+        statements.append(1)
+
+    os.environ["DB_SCHEMA_MODE"] = mode
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        start = time.perf_counter()
+        init_db()
+        return len(statements), time.perf_counter() - start
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+        del os.environ["DB_SCHEMA_MODE"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import(env: dict) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_first_request(env: dict, site: str, timeout: float = 60) -> float:
+    """Seconds from spawning uvicorn to the first successful tenant request"""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if client.get(f"/api/config/{site}").status_code == 200:
+                        return time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.005)
+        raise RuntimeError(f"Server didn't answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=500, help="Tenants in the database")
+    parser.add_argument("--boots", type=int, default=5, help="Boots (and imports) per configuration")
+    args = parser.parse_args()
+
+    setup_environment()
+    seed_companies(args.companies)
+
+    print("="*60)
+    print("Cold Start Benchmark")
+    print("="*60)
+    print(f"{args.companies} companies | {args.boots} boots each | {os.environ['DATABASE_URL'].split('://')[0]}")
+
+    env = {**os.environ, "RATE_LIMIT_CLIENT_PER_MINUTE": "0"}
+    imports = [time_import(env) for _ in range(args.boots)]
+    print(f"\nimport main: p50 {statistics.median(imports) * 1000:.0f}ms, "
+          f"min {min(imports) * 1000:.0f}ms")
+
+    print(f"\n{'DB_SCHEMA_MODE':>15} {'init_db queries':>16} {'init_db (ms)':>13} "
+          f"{'first request p50 (ms)':>23} {'min (ms)':>9}")
+    for mode in ("create", "auto", "skip"):
+        queries, init_seconds = count_init_queries(mode)
+        mode_env = {**env, "DB_SCHEMA_MODE": mode}
+        times = [time_first_request(mode_env, f"coldstart_{boot % args.companies}") for boot in range(args.boots)]
+        print(f"{mode:>15} {queries:>16} {init_seconds * 1000:>13.1f} "
+              f"{statistics.median(times) * 1000:>23.0f} {min(times) * 1000:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
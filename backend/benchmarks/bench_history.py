@@ -0,0 +1,151 @@
+"""
+History compaction benchmark: long widget conversations with and without it
+Sends --turns follow-ups per session through /api/chat against the local
+stub (whose runs get slower with prompt size) and reports prompt tokens and
+latency for the early and late turns of each conversation
+
+Usage (from backend/):
+    python benchmarks/bench_history.py --turns 40 --sessions 4
+    python benchmarks/bench_history.py --turns 40 --per-1k 0.2 --reply-chars 800
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+import stub_openai
+from stub_openai import serve
+
+QUESTIONS = [
+    "Which pharmacies accept the discount card and do I need to show anything at the counter?",
+    "Can I use it together with my insurance plan or does it replace my copay?",
+    "How much could I expect to save on a generic blood pressure prescription?",
+    "Does the card work for my kids and my parents too, or do they each need one?",
+    "Is there an expiry date, and what happens if I lose the card?",
+]
+
+
+def setup_environment(args):
+    """Point the app at a throwaway SQLite DB and the stub server"""
+    tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["ANSWER_CACHE_TTL"] = "0"  # Every chat is a real (stub) run
+    os.environ["FAQ_MATCH_THRESHOLD"] = "2"  # No FAQ shortcuts
+    os.environ["RATE_LIMIT_CLIENT_PER_MINUTE"] = "0"  # All requests come from one IP
+    os.environ["RATE_LIMIT_SITE_PER_MINUTE"] = "0"
+
+
+def seed_company():
+    from models import Company, init_db, SessionLocal
+
+    init_db()
+    db = SessionLocal()
+    db.add(Company(
+        site_id="bench",
+        name="Bench Co",
+        primary_color="#0066cc",
+        greeting="Hi!",
+        assistant_id="asst_stub",
+        knowledge_base="",
+        active=True,
+    ))
+    db.commit()
+    db.close()
+
+
+async def conversation(client: httpx.AsyncClient, turns: int, results: list):
+    """One session of `turns` messages; appends (turn, prompt tokens, seconds) per turn"""
+    session_id = None
+    for turn in range(turns):
+        runs_before = set(stub_openai.runs)
+        start = time.perf_counter()
+        response = await client.post("/api/chat", json={
+            "message": f"{QUESTIONS[turn % len(QUESTIONS)]} (#{turn})",
+            "site": "bench",
+            "session_id": session_id,
+        })
+        response.raise_for_status()
+        seconds = time.perf_counter() - start
+        session_id = response.json()["session_id"]
+
+        # Concurrent sessions create runs too - ours is the one on this session's thread
+        for run_id in set(stub_openai.runs) - runs_before:
+            if stub_openai.runs[run_id]["thread_id"] == session_id:
+                results.append((turn, stub_openai.runs[run_id]["prompt_tokens"], seconds))
+
+
+async def run_mode(client: httpx.AsyncClient, compaction: bool, args):
+    import history
+
+    history.HISTORY_COMPACTION = compaction
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(client, args.turns, results) for _ in range(args.sessions)))
+    elapsed = time.perf_counter() - start
+
+    late_from = args.turns * 3 // 4
+    early = [r for r in results if r[0] < args.turns // 4]
+    late = [r for r in results if r[0] >= late_from]
+    return {
+        "mode": "compacted" if compaction else "full thread",
+        "tokens_total": sum(r[1] for r in results),
+        "tokens_early": statistics.mean(r[1] for r in early),
+        "tokens_late": statistics.mean(r[1] for r in late),
+        "p50_late": statistics.median(r[2] for r in late),
+        "elapsed": elapsed,
+    }
+
+
+async def main_async(args):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        print(f"\n{'mode':>12} {'prompt tokens':>14} {'early/turn':>11} {'late/turn':>10} "
+              f"{'late p50 (s)':>13} {'elapsed (s)':>12}")
+        for compaction in (False, True):
+            result = await run_mode(client, compaction, args)
+            print(
+                f"{result['mode']:>12} {result['tokens_total']:>14} {result['tokens_early']:>11.0f} "
+                f"{result['tokens_late']:>10.0f} {result['p50_late']:>13.3f} {result['elapsed']:>12.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=40, help="Messages per conversation")
+    parser.add_argument("--sessions", type=int, default=4, help="Conversations run at once")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub run latency in seconds")
+    parser.add_argument("--per-1k", type=float, default=0.1, help="Extra run seconds per 1k prompt tokens")
+    parser.add_argument("--reply-chars", type=int, default=400, help="Length of the stub's replies")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    setup_environment(args)
+    serve(args.port, args.latency, args.per_1k)
+    stub_openai.stub_app.state.reply = (
+        "Most major pharmacies accept it. Just show the card at the counter. " * 20
+    )[:args.reply_chars]
+    seed_company()
+
+    print("="*60)
+    print("History Compaction Benchmark (stub OpenAI)")
+    print("="*60)
+    print(f"Turns: {args.turns} | Sessions: {args.sessions} | Run latency: {args.latency}s "
+          f"+ {args.per_1k}s per 1k prompt tokens")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
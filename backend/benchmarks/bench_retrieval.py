@@ -0,0 +1,185 @@
+"""
+Benchmark: full knowledge base in instructions vs. top-k retrieved excerpts
+Reports prompt size per question, index build/search cost, and end-to-end
+chat latency against the stub OpenAI server (whose runs get slower as the
+prompt grows, via --ms-per-1k-tokens)
+
+Usage (from backend/):
+    python benchmarks/bench_retrieval.py --sections 80
+    python benchmarks/bench_retrieval.py --knowledge-file ../content/rx4miracles/knowledge.md
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+import stub_openai
+
+QUESTIONS = [
+    "Is the card really free?",
+    "Which pharmacies accept the card?",
+    "How much can I save on generic medications?",
+    "Do I need insurance to use it?",
+    "How do I find a participating provider?",
+    "What are your customer service hours?",
+    "Can my whole family use the same card?",
+    "How does the program support children's hospitals?",
+]
+
+TOPICS = [
+    "pharmacy", "savings", "generic", "brand", "insurance", "family", "hospital",
+    "provider", "hours", "enrollment", "eligibility", "pricing", "card", "refill",
+    "coverage", "discount", "membership", "dental", "vision", "support",
+]
+
+FILLER = (
+    "members customers program benefit service network partner medication "
+    "prescription plan option account website phone email question answer "
+    "policy process request location state national local available"
+).split()
+
+
+def synthetic_knowledge_base(sections: int, words_per_section: int, seed: int = 7) -> str:
+    """Markdown KB with topic-flavoured sections (stands in for a real tenant)"""
+    rng = random.Random(seed)
+    parts = ["# Overview\nThis knowledge base describes our free savings program.\n"]
+    for i in range(sections):
+        topic = TOPICS[i % len(TOPICS)]
+        words = [rng.choice(FILLER + [topic] * 6) for _ in range(words_per_section)]
+        parts.append(f"## {topic.title()} details part {i // len(TOPICS) + 1}\n{' '.join(words)}.\n")
+    return "\n".join(parts)
+
+
+def setup_environment(args):
+    tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["RETRIEVAL_INDEX_DIR"] = f"{tmp_dir}/indexes"
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["ANSWER_CACHE_THRESHOLD"] = "1.0"
+    os.environ["ANSWER_CACHE_TTL"] = "0"  # Measure every run
+    os.environ["RATE_LIMIT_CLIENT_PER_MINUTE"] = "0"  # All requests come from one IP
+    os.environ["RATE_LIMIT_SITE_PER_MINUTE"] = "0"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def create_company(knowledge: str, mode: str):
+    """Company + stub assistant whose instructions match the given knowledge mode"""
+    from models import Company, SessionLocal
+    from openai import OpenAI
+
+    os.environ["KNOWLEDGE_MODE"] = mode
+    from assistant_sync import build_instructions
+
+    db = SessionLocal()
+    company = Company(
+        site_id=f"bench-{mode}",
+        name=f"Bench {mode}",
+        primary_color="#0066cc",
+        greeting="Hi!",
+        system_prompt="You are a helpful assistant for a prescription savings program. Be concise.",
+        knowledge_base=knowledge,
+        faqs=[],
+        active=True,
+    )
+    client = OpenAI(api_key="sk-stub", base_url=os.environ["OPENAI_BASE_URL"])
+    company.assistant_id = client.beta.assistants.create(
+        name=company.name, instructions=build_instructions(company), model="gpt-4o-mini"
+    ).id
+    db.add(company)
+    db.commit()
+    instructions = build_instructions(company)
+    db.close()
+    return instructions
+
+
+async def chat_latencies(site: str, mode: str, rounds: int):
+    import main
+
+    os.environ["KNOWLEDGE_MODE"] = mode
+    latencies = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for _ in range(rounds):
+            for question in QUESTIONS:
+                start = time.perf_counter()
+                response = await client.post("/api/chat", json={"message": question, "site": site})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--knowledge-file", type=Path)
+    parser.add_argument("--sections", type=int, default=80)
+    parser.add_argument("--words", type=int, default=150, help="Words per synthetic section")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub base run latency (s)")
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=40.0,
+                        help="Extra stub run latency per 1k prompt tokens")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    setup_environment(args)
+    stub_openai.serve(args.port, args.latency, args.ms_per_1k_tokens / 1000)
+
+    from models import init_db
+    from retrieval import RetrievalIndex, chunk_markdown, format_excerpts
+
+    knowledge = (args.knowledge_file.read_text() if args.knowledge_file
+                 else synthetic_knowledge_base(args.sections, args.words))
+    init_db()
+
+    print("="*60)
+    print("Retrieval vs. Full-Instructions Benchmark")
+    print("="*60)
+    print(f"Knowledge base: {len(knowledge):,} chars (~{estimate_tokens(knowledge):,} tokens)")
+
+    # Index build and search cost
+    start = time.perf_counter()
+    chunks = chunk_markdown(knowledge)
+    index = RetrievalIndex(chunks, "bench")
+    build_ms = (time.perf_counter() - start) * 1000
+
+    search_times, excerpt_tokens = [], []
+    for question in QUESTIONS * 50:
+        start = time.perf_counter()
+        results = index.search(question)
+        search_times.append((time.perf_counter() - start) * 1000)
+        excerpt_tokens.append(estimate_tokens(format_excerpts(results or [index.first_chunk()])))
+
+    print(f"Chunks: {len(chunks)} | Build: {build_ms:.1f} ms | "
+          f"Search p50: {statistics.median(search_times):.3f} ms")
+
+    # Prompt size per run
+    full_instructions = create_company(knowledge, "embedded")
+    short_instructions = create_company(knowledge, "retrieval")
+    full_tokens = estimate_tokens(full_instructions)
+    retrieval_tokens = estimate_tokens(short_instructions) + statistics.mean(excerpt_tokens)
+
+    print(f"\n{'mode':<12} {'prompt tokens/run':>18} {'chat p50 (s)':>14} {'chat p95 (s)':>14}")
+    for mode, tokens in (("embedded", full_tokens), ("retrieval", retrieval_tokens)):
+        latencies = asyncio.run(chat_latencies(f"bench-{mode}", mode, args.rounds))
+        latencies.sort()
+        print(f"{mode:<12} {tokens:>18,.0f} {statistics.median(latencies):>14.3f} "
+              f"{latencies[int(round(0.95 * (len(latencies) - 1)))]:>14.3f}")
+
+    print(f"\nPrompt reduction: {100 * (1 - retrieval_tokens / full_tokens):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
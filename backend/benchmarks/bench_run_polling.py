@@ -0,0 +1,117 @@
+"""
+Run polling benchmark: the SDK's create_and_poll vs run_poller.wait_for_run
+Measures status checks per run and how long after a run finished it was
+noticed (overshoot), against a local stub with jittered run latency. The
+stub's openai-poll-after-ms hint drives create_and_poll's fixed interval;
+--poll-after-ms 0 drops it (the SDK then polls every second)
+
+Usage (from backend/):
+    python benchmarks/bench_run_polling.py --runs 64 --concurrency 16
+    python benchmarks/bench_run_polling.py --poll-after-ms 0 --latency 2
+    python benchmarks/bench_run_polling.py --deadline 1 --latency 3   # deadline + cancel
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import stub_openai
+from stub_openai import serve
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct * (len(values) - 1))))]
+
+
+async def run_mode(client, mode: str, runs: int, concurrency: int, deadline: float):
+    """Create `runs` runs (at most `concurrency` at once) and wait for each"""
+    from run_poller import wait_for_run
+
+    semaphore = asyncio.Semaphore(concurrency)
+    overshoots, totals, timed_out = [], [], 0
+
+    async def one_run():
+        nonlocal timed_out
+        async with semaphore:
+            thread = await client.beta.threads.create(messages=[{"role": "user", "content": "Is the card free?"}])
+            start = time.perf_counter()
+            if mode == "sdk":
+                run = await client.beta.threads.runs.create_and_poll(thread_id=thread.id, assistant_id="asst_stub")
+            else:
+                run = await client.beta.threads.runs.create(thread_id=thread.id, assistant_id="asst_stub")
+                result = await wait_for_run(client, run, "bench", "gpt-4o-mini", deadline)
+                run, timed_out = result.run, timed_out + int(result.timed_out)
+            seen = time.perf_counter() - start
+            totals.append(seen)
+            if run.status == "completed":
+                overshoots.append(max(0.0, seen - stub_openai.runs[run.id]["latency"]))
+
+    requests_before = stub_openai.stats["requests"]
+    await asyncio.gather(*(one_run() for _ in range(runs)))
+    # Per run: thread create + run create are the fixed cost; the rest are status checks (and cancels)
+    polls = (stub_openai.stats["requests"] - requests_before) / runs - 2
+
+    return {
+        "mode": mode,
+        "polls": polls,
+        "p50": statistics.median(totals),
+        "overshoot_p50": statistics.median(overshoots) if overshoots else 0.0,
+        "overshoot_p95": percentile(overshoots, 0.95),
+        "timed_out": timed_out,
+    }
+
+
+async def main_async(args):
+    from openai_client import get_async_client, close_async_client
+
+    client = get_async_client()
+    print(f"\n{'mode':>10} {'polls/run':>10} {'p50 (s)':>10} {'overshoot p50 (ms)':>19} "
+          f"{'overshoot p95 (ms)':>19} {'timed out':>10}")
+    # Adaptive runs twice: cold (no history yet) and warm (percentiles learned)
+    for mode in ("sdk", "adaptive", "adaptive"):
+        result = await run_mode(client, mode, args.runs, args.concurrency, args.deadline)
+        print(
+            f"{result['mode']:>10} {result['polls']:>10.1f} {result['p50']:>10.3f} "
+            f"{result['overshoot_p50'] * 1000:>19.0f} {result['overshoot_p95'] * 1000:>19.0f} "
+            f"{result['timed_out']:>10}"
+        )
+    await close_async_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=1.0, help="Mean stub run latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Run latency varies by +/- this fraction")
+    parser.add_argument("--poll-after-ms", type=int, default=250,
+                        help="openai-poll-after-ms hint the stub sends (0 = none)")
+    parser.add_argument("--deadline", type=float, default=25.0, help="wait_for_run deadline in seconds")
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    stub_openai.stub_app.state.run_jitter = args.jitter
+    stub_openai.stub_app.state.poll_after_ms = args.poll_after_ms or None
+    serve(args.port, args.latency)
+
+    print("="*60)
+    print("Run Polling Benchmark (stub OpenAI)")
+    print("="*60)
+    print(f"Runs: {args.runs} | In flight: {args.concurrency} | Latency: {args.latency}s "
+          f"+/-{args.jitter:.0%} | poll-after hint: {args.poll_after_ms or 'none'}")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
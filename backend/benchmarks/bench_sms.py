@@ -0,0 +1,157 @@
+"""
+Throughput benchmark for the SMS webhook + reply workers
+Posts Twilio-style webhooks from many phone numbers, replies go to a fake
+sender instead of Twilio, and assistant runs go to the stub OpenAI server.
+Reports webhook acknowledgement latency and reply throughput per worker count
+
+Usage (from backend/):
+    python benchmarks/bench_sms.py --workers 4 16 32 --messages 200 --numbers 50
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+from stub_openai import serve
+from bench_chat_load import percentile
+
+COMPANY_NUMBER = "+15550001000"
+
+
+class FakeSender:
+    """Records replies instead of calling Twilio"""
+
+    def __init__(self, send_latency: float):
+        self.send_latency = send_latency
+        self.sent = []
+
+    async def send(self, to: str, from_: str, body: str):
+        await asyncio.sleep(self.send_latency)
+        self.sent.append((time.perf_counter(), to, from_, body))
+
+
+def setup_environment(args):
+    tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ["TENANT_MAX_CONCURRENCY"] = str(max(args.workers))
+
+
+def seed_company():
+    from models import Company, init_db, SessionLocal
+
+    init_db()
+    db = SessionLocal()
+    db.add(Company(
+        site_id="bench-sms",
+        name="Bench SMS Co",
+        assistant_id="asst_stub",
+        knowledge_base="",
+        faqs=[],
+        sms_enabled=True,
+        sms_phone_number=COMPANY_NUMBER,
+        active=True,
+    ))
+    db.commit()
+    db.close()
+
+
+async def run_level(client: httpx.AsyncClient, workers: int, messages: int, numbers: int, send_latency: float):
+    from sms import SMSQueue
+    import main
+
+    # Fresh queue with this many workers, wired to the fake sender
+    queue = SMSQueue(workers=workers, max_size=messages)
+    sender = FakeSender(send_latency)
+    queue.set_sender(sender)
+    main.sms_queue = queue
+
+    ack_times = []
+    sent_at = {}
+    start = time.perf_counter()
+
+    async def post(i: int):
+        from_number = f"+1555{i % numbers:07d}"
+        body = urlencode({
+            "From": from_number,
+            "To": COMPANY_NUMBER,
+            "Body": f"Is the card free? #{i}",
+            "MessageSid": f"SM{i:032d}",
+        })
+        t0 = time.perf_counter()
+        response = await client.post("/api/sms/webhook", content=body,
+                                      headers={"Content-Type": "application/x-www-form-urlencoded"})
+        response.raise_for_status()
+        ack_times.append(time.perf_counter() - t0)
+        sent_at.setdefault(from_number, []).append(t0)
+
+    await asyncio.gather(*(post(i) for i in range(messages)))
+    await queue.join()
+    elapsed = time.perf_counter() - start
+    await queue.stop()
+
+    # Replies per number arrive in order, so pair them with that number's posts
+    reply_latencies = []
+    replies_by_number = {}
+    for sent_time, to, _, _ in sender.sent:
+        replies_by_number.setdefault(to, []).append(sent_time)
+    for number, posts in sent_at.items():
+        for posted, replied in zip(sorted(posts), replies_by_number.get(number, [])):
+            reply_latencies.append(replied - posted)
+
+    return {
+        "elapsed": elapsed,
+        "replies": len(sender.sent),
+        "ack_p50": percentile(ack_times, 0.5) * 1000,
+        "ack_p95": percentile(ack_times, 0.95) * 1000,
+        "reply_p95": percentile(reply_latencies, 0.95),
+        "failed": queue.stats["failed"],
+    }
+
+
+async def run(args):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        print(f"\n{'workers':>8} {'replies/s':>10} {'ack p50 (ms)':>13} {'ack p95 (ms)':>13} "
+              f"{'reply p95 (s)':>14} {'failed':>7}")
+        for workers in args.workers:
+            result = await run_level(client, workers, args.messages, args.numbers, args.send_latency)
+            print(f"{workers:>8} {result['replies'] / result['elapsed']:>10.1f} {result['ack_p50']:>13.1f} "
+                  f"{result['ack_p95']:>13.1f} {result['reply_p95']:>14.2f} {result['failed']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 16, 32])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--numbers", type=int, default=50, help="Distinct sender phone numbers")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub run latency (s)")
+    parser.add_argument("--send-latency", type=float, default=0.05, help="Fake Twilio send latency (s)")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    setup_environment(args)
+    serve(args.port, args.latency)
+    seed_company()
+
+    print("="*60)
+    print("SMS Webhook Benchmark")
+    print("="*60)
+    print(f"Messages: {args.messages} from {args.numbers} numbers | Run latency: {args.latency}s")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
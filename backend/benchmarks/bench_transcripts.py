@@ -0,0 +1,113 @@
+"""
+Transcript logging benchmark: buffered batch writes vs an INSERT per message
+Measures what logging one exchange costs the request that answered it, with
+--concurrency requests logging at once, and how long the background flush
+takes to write everything out
+
+Usage (from backend/):
+    python benchmarks/bench_transcripts.py --exchanges 2000 --concurrency 32
+    DATABASE_URL=postgresql://... python benchmarks/bench_transcripts.py
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def setup_environment():
+    """A throwaway SQLite DB unless DATABASE_URL is set"""
+    if not os.getenv("DATABASE_URL"):
+        tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["TRANSCRIPT_BUFFER_SIZE"] = "1000000"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct * (len(values) - 1))))]
+
+
+def insert_exchange(db, site_id: str, session_id: str, question: str, answer: str):
+    """The unbuffered alternative: write both rows before answering"""
+    from models import ChatMessageLog
+
+    db.add(ChatMessageLog(site_id=site_id, session_id=session_id, role="user", content=question))
+    db.add(ChatMessageLog(site_id=site_id, session_id=session_id, role="assistant", content=answer,
+                          source="assistant", latency_ms=800))
+    db.commit()
+
+
+async def run_mode(mode: str, exchanges: int, concurrency: int):
+    from models import run_db
+    from transcripts import flush_transcripts, transcript_log
+
+    semaphore = asyncio.Semaphore(concurrency)
+    costs = []
+
+    async def one_exchange(i: int):
+        async with semaphore:
+            question, answer = f"Is the card free? #{i}", "Yes! The card is completely free. " * 8
+            start = time.perf_counter()
+            if mode == "buffered":
+                transcript_log.record("bench", f"session_{i % 100}", question, answer, "assistant", 0.8)
+            else:
+                await run_db(insert_exchange, "bench", f"session_{i % 100}", question, answer)
+            costs.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_exchange(i) for i in range(exchanges)))
+    handled = time.perf_counter() - start
+
+    flush_start = time.perf_counter()
+    if mode == "buffered":
+        await flush_transcripts()
+    flushed = time.perf_counter() - flush_start
+
+    return {
+        "mode": mode,
+        "p50": statistics.median(costs),
+        "p99": percentile(costs, 0.99),
+        "handled": handled,
+        "flush": flushed,
+    }
+
+
+async def main_async(args):
+    from models import init_db
+
+    init_db()
+    print(f"\n{'mode':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'all logged (s)':>15} {'flush (s)':>10}")
+    for mode in ("insert", "buffered"):
+        result = await run_mode(mode, args.exchanges, args.concurrency)
+        print(
+            f"{result['mode']:>10} {result['p50'] * 1000:>10.3f} {result['p99'] * 1000:>10.3f} "
+            f"{result['handled']:>15.2f} {result['flush']:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exchanges", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    setup_environment()
+
+    print("="*60)
+    print("Transcript Logging Benchmark")
+    print("="*60)
+    print(f"Exchanges: {args.exchanges} | Concurrency: {args.concurrency}")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Widget delivery benchmark: what a page load costs, legacy embed vs bootstrap
+Counts requests and bytes for the legacy embed (chatbot.css + chatbot.js +
+/api/config) and the bootstrap embed (bootstrap script + hashed, compressed
+bundle), first visit and revisit, and times /api/config 200s vs 304s
+
+Usage (from backend/):
+    python benchmarks/bench_widget.py --requests 2000
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+
+def setup_environment():
+    tmp_dir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/bench.db"
+    os.environ["OPENAI_API_KEY"] = "sk-stub"
+
+
+def seed_company():
+    from models import Company, init_db, SessionLocal
+
+    init_db()
+    db = SessionLocal()
+    db.add(Company(
+        site_id="bench",
+        name="Bench Co",
+        primary_color="#0066cc",
+        greeting="Hi! How can I help you today?",
+        assistant_id="asst_stub",
+        knowledge_base="",
+        active=True,
+    ))
+    db.commit()
+    db.close()
+
+
+async def page_load(client: httpx.AsyncClient, paths, cache: dict) -> tuple:
+    """Fetch `paths` like a browser with `cache` (path -> ETag); returns (requests, bytes on the wire)"""
+    requests, wire_bytes = 0, 0
+    for path in paths:
+        headers = {"Accept-Encoding": "gzip, br"}
+        if path in cache:
+            headers["If-None-Match"] = cache[path]
+        response = await client.get(path, headers=headers)
+        requests += 1
+        wire_bytes += int(response.headers.get("content-length", len(response.content)))
+        if "etag" in response.headers:
+            cache[path] = response.headers["etag"]
+    return requests, wire_bytes
+
+
+async def time_config(client: httpx.AsyncClient, requests: int, etag=None) -> float:
+    headers = {"If-None-Match": etag} if etag else {}
+    times = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await client.get("/api/config/bench", headers=headers)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+async def main_async(args):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        bootstrap = (await client.get("/widget/bootstrap/bench.js")).text
+        bundle = re.findall(r'"(/widget/dist/[^"]+)"', bootstrap)
+
+        legacy = ["/widget/chatbot.css", "/widget/chatbot.js", "/api/config/bench"]
+        versioned = ["/widget/bootstrap/bench.js"] + bundle
+
+        print(f"\n{'embed':>10} {'visit':>10} {'requests':>9} {'bytes':>8}")
+        for name, paths, immutable in (("legacy", legacy, ()), ("bootstrap", versioned, bundle)):
+            cache = {}
+            first = await page_load(client, paths, cache)
+            # Within max-age nothing is re-requested; past it, revalidation (304s) - except
+            # immutable bundle files, which the browser never asks about again
+            again = await page_load(client, [path for path in paths if path not in immutable], cache)
+            print(f"{name:>10} {'first':>10} {first[0]:>9} {first[1]:>8}")
+            print(f"{name:>10} {'revalidate':>10} {again[0]:>9} {again[1]:>8}")
+
+        etag = (await client.get("/api/config/bench")).headers["etag"]
+        full = await time_config(client, args.requests)
+        not_modified = await time_config(client, args.requests, etag)
+        print(f"\n/api/config p50: {full * 1000:.2f}ms (200), {not_modified * 1000:.2f}ms (304)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="Config requests to time")
+    args = parser.parse_args()
+
+    setup_environment()
+    seed_company()
+
+    print("="*60)
+    print("Widget Delivery Benchmark")
+    print("="*60)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Local stub of the OpenAI Assistants API for benchmarks
+Implements just enough of /v1/assistants, threads, runs and messages for the
+chat path, with a configurable run latency so no real API key or network is
+needed. Runs can also take longer the bigger their prompt is
+(latency_per_1k_tokens), to model the cost of large instructions
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+POLL_AFTER_MS = 25
+STREAM_CHUNK_CHARS = 4
+
+stub_app = FastAPI(title="OpenAI Stub")
+stub_app.state.run_latency = 0.5
+stub_app.state.latency_per_1k_tokens = 0.0
+stub_app.state.run_jitter = 0.0  # Run latency varies by +/- this fraction
+stub_app.state.run_error_rate = 0.0  # Share of run creations that fail with a 500
+stub_app.state.poll_after_ms = POLL_AFTER_MS  # openai-poll-after-ms hint (None = not sent)
+stub_app.state.assistant_latency = 0.0  # Seconds per assistant create/update
+stub_app.state.assistant_rps = 0.0  # Assistant writes/second before 429s (0 = unlimited)
+stub_app.state.reply = "Yes! The Rx4Miracles card is completely free 【4:0†source】."
+
+assistants = {}
+threads = {}
+runs = {}
+stats = {"requests": 0}
+
+
+@stub_app.middleware("http")
+async def count_requests(request: Request, call_next):
+    stats["requests"] += 1
+    return await call_next(request)
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def _message(thread_id: str, role: str, text: str) -> dict:
+    return {
+        "id": _new_id("msg"),
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "status": "completed",
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        "attachments": [],
+        "metadata": {},
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return len(text) // 4
+
+
+def _run_body(run: dict) -> dict:
+    """Advance the run state based on elapsed time and serialize it"""
+    if run["status"] in ("queued", "in_progress"):
+        if time.monotonic() - run["started"] >= run["latency"]:
+            run["status"] = "completed"
+            threads[run["thread_id"]].append(
+                _message(run["thread_id"], "assistant", stub_app.state.reply)
+            )
+        else:
+            run["status"] = "in_progress"
+    return {
+        "id": run["id"],
+        "object": "thread.run",
+        "created_at": run["created_at"],
+        "thread_id": run["thread_id"],
+        "assistant_id": run["assistant_id"],
+        "status": run["status"],
+        "model": "gpt-4o-mini",
+        "instructions": "",
+        "tools": [],
+        "metadata": {},
+        "usage": {
+            "prompt_tokens": run["prompt_tokens"],
+            "completion_tokens": run["completion_tokens"],
+            "total_tokens": run["prompt_tokens"] + run["completion_tokens"],
+        } if run["status"] == "completed" else None,
+    }
+
+
+def _poll_response(body: dict, status_code: int = 200) -> JSONResponse:
+    poll_after_ms = stub_app.state.poll_after_ms
+    headers = {"openai-poll-after-ms": str(poll_after_ms)} if poll_after_ms is not None else {}
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+
+def _assistant_body(assistant: dict) -> dict:
+    return {
+        "id": assistant["id"],
+        "object": "assistant",
+        "created_at": assistant["created_at"],
+        "name": assistant.get("name"),
+        "model": assistant.get("model", "gpt-4o-mini"),
+        "instructions": assistant.get("instructions", ""),
+        "tools": [],
+        "metadata": {},
+    }
+
+
+_assistant_bucket = {"tokens": 0.0, "updated": 0.0}
+
+
+async def _assistant_write_gate():
+    """Simulate assistant write latency and rate limiting; returns a 429 response or None"""
+    rps = stub_app.state.assistant_rps
+    if rps:
+        now = time.monotonic()
+        bucket = _assistant_bucket
+        bucket["tokens"] = min(rps, bucket["tokens"] + (now - bucket["updated"]) * rps)
+        bucket["updated"] = now
+        if bucket["tokens"] < 1:
+            stats["rate_limited"] = stats.get("rate_limited", 0) + 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after-ms": str(int(1000 / rps))},
+            )
+        bucket["tokens"] -= 1
+    await asyncio.sleep(stub_app.state.assistant_latency)
+    return None
+
+
+@stub_app.post("/v1/assistants")
+async def create_assistant(request: Request):
+    limited = await _assistant_write_gate()
+    if limited:
+        return limited
+    data = await request.json()
+    assistant = {"id": _new_id("asst"), "created_at": int(time.time()), **data}
+    assistants[assistant["id"]] = assistant
+    return _assistant_body(assistant)
+
+
+@stub_app.post("/v1/assistants/{assistant_id}")
+async def update_assistant(assistant_id: str, request: Request):
+    limited = await _assistant_write_gate()
+    if limited:
+        return limited
+    data = await request.json()
+    assistant = assistants.setdefault(assistant_id, {"id": assistant_id, "created_at": int(time.time())})
+    assistant.update(data)
+    return _assistant_body(assistant)
+
+
+@stub_app.post("/v1/threads")
+async def create_thread(request: Request):
+    data = await request.json()
+    thread_id = _new_id("thread")
+    threads[thread_id] = [
+        _message(thread_id, m["role"], m["content"]) for m in data.get("messages", [])
+    ]
+    return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+
+
+@stub_app.delete("/v1/threads/{thread_id}")
+async def delete_thread(thread_id: str):
+    threads.pop(thread_id, None)
+    return {"id": thread_id, "object": "thread.deleted", "deleted": True}
+
+
+@stub_app.post("/v1/threads/{thread_id}/messages")
+async def create_message(thread_id: str, request: Request):
+    data = await request.json()
+    message = _message(thread_id, data["role"], data["content"])
+    threads.setdefault(thread_id, []).append(message)
+    return message
+
+
+@stub_app.get("/v1/threads/{thread_id}/messages")
+async def list_messages(thread_id: str):
+    # Newest first, like the real API
+    data = list(reversed(threads.get(thread_id, [])))
+    return {
+        "object": "list",
+        "data": data,
+        "first_id": data[0]["id"] if data else None,
+        "last_id": data[-1]["id"] if data else None,
+        "has_more": False,
+    }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_run(run: dict):
+    """Emit the reply as message deltas spread over the run latency"""
+    reply = stub_app.state.reply
+    chunks = [reply[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(reply), STREAM_CHUNK_CHARS)]
+    message = _message(run["thread_id"], "assistant", "")
+    message["status"] = "in_progress"
+    message["content"] = []
+
+    run["status"] = "in_progress"
+    yield _sse("thread.run.created", _run_body(run))
+    yield _sse("thread.message.created", message)
+    for chunk in chunks:
+        await asyncio.sleep(run["latency"] / len(chunks))
+        yield _sse("thread.message.delta", {
+            "id": message["id"],
+            "object": "thread.message.delta",
+            "delta": {"content": [{"index": 0, "type": "text", "text": {"value": chunk, "annotations": []}}]},
+        })
+
+    run["status"] = "completed"
+    message.update(_message(run["thread_id"], "assistant", reply), id=message["id"])
+    threads[run["thread_id"]].append(message)
+    yield _sse("thread.message.completed", message)
+    yield _sse("thread.run.completed", _run_body(run))
+    yield "event: done\ndata: [DONE]\n\n"
+
+
+@stub_app.post("/v1/threads/{thread_id}/runs")
+async def create_run(thread_id: str, request: Request):
+    data = await request.json()
+    if random.random() < stub_app.state.run_error_rate:
+        stats["run_errors"] = stats.get("run_errors", 0) + 1
+        return JSONResponse({"error": {"message": "The server had an error", "type": "server_error"}}, status_code=500)
+
+    # Prompt = assistant instructions + per-run instructions + thread history (or its truncation)
+    prompt = assistants.get(data["assistant_id"], {}).get("instructions") or ""
+    prompt += data.get("additional_instructions") or ""
+    history = threads.get(thread_id, [])
+    truncation = data.get("truncation_strategy") or {}
+    if truncation.get("type") == "last_messages":
+        history = history[-truncation["last_messages"]:]
+    prompt += "".join(m["content"][0]["text"]["value"] for m in history)
+    prompt_tokens = estimate_tokens(prompt)
+
+    run = {
+        "id": _new_id("run"),
+        "thread_id": thread_id,
+        "assistant_id": data["assistant_id"],
+        "status": "queued",
+        "created_at": int(time.time()),
+        "started": time.monotonic(),
+        "latency": (stub_app.state.run_latency + prompt_tokens / 1000 * stub_app.state.latency_per_1k_tokens)
+        * random.uniform(1 - stub_app.state.run_jitter, 1 + stub_app.state.run_jitter),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": estimate_tokens(stub_app.state.reply),
+    }
+    runs[run["id"]] = run
+    if data.get("stream"):
+        return StreamingResponse(_stream_run(run), media_type="text/event-stream")
+    return _poll_response(_run_body(run))
+
+
+@stub_app.get("/v1/threads/{thread_id}/runs/{run_id}")
+async def get_run(thread_id: str, run_id: str):
+    return _poll_response(_run_body(runs[run_id]))
+
+
+@stub_app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+async def cancel_run(thread_id: str, run_id: str):
+    run = runs[run_id]
+    if run["status"] in ("queued", "in_progress"):
+        run["status"] = "cancelled"
+    return _poll_response(_run_body(run))
+
+
+def serve(port: int = 8765, run_latency: float = 0.5, latency_per_1k_tokens: float = 0.0) -> uvicorn.Server:
+    """Start the stub in a background thread and wait until it's listening"""
+    stub_app.state.run_latency = run_latency
+    stub_app.state.latency_per_1k_tokens = latency_per_1k_tokens
+    config = uvicorn.Config(stub_app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+if __name__ == "__main__":
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    stub_app.state.run_latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    uvicorn.run(stub_app, host="127.0.0.1", port=port)
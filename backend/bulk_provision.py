@@ -0,0 +1,229 @@
+"""
+Bulk assistant provisioning for many companies at once
+Creates missing assistants and re-pushes changed ones concurrently, under a
+token-bucket request rate, retrying 429s with backoff, and committing DB
+updates in batches
+
+Usage:
+    python bulk_provision.py --dry-run                 # Show what would change
+    python bulk_provision.py --concurrency 16 --rate 8
+    python bulk_provision.py --force                   # Re-push every assistant
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
+
+# Load environment variables
+env_path = Path(__file__).parent.parent / '.env'
+load_dotenv(dotenv_path=env_path, override=True)
+
+from models import AssistantSync, Company, SessionLocal, init_db
+from assistant_sync import assistant_hash, build_instructions, pending_hash, record_sync
+from token_bucket import TokenBucket
+
+MAX_ATTEMPTS = 6
+BASE_BACKOFF = 0.5  # Seconds; doubles each attempt
+MAX_BACKOFF = 30.0
+
+
+class PlannedChange(NamedTuple):
+    site_id: str
+    name: str
+    action: str  # 'create', 'update' or 'unchanged'
+    reason: str
+    content_hash: str
+    instructions: str
+    model: str
+    assistant_id: Optional[str]
+
+
+def plan_changes(db, force: bool = False) -> List[PlannedChange]:
+    """Work out which active companies need an assistant created or updated"""
+    changes = []
+
+    # Load all sync state up front so pending_hash() hits the identity map
+    db.query(AssistantSync).all()
+
+    for company in db.query(Company).filter(Company.active == True).order_by(Company.site_id):
+        new_hash = assistant_hash(company)
+
+        if not company.assistant_id:
+            action, reason = "create", "no assistant yet"
+        elif force:
+            action, reason = "update", "forced"
+        elif pending_hash(db, company) is not None:
+            action, reason = "update", "instructions/model changed since last sync"
+        else:
+            action, reason = "unchanged", ""
+
+        changes.append(PlannedChange(
+            site_id=company.site_id,
+            name=company.name,
+            action=action,
+            reason=reason,
+            content_hash=new_hash,
+            instructions=build_instructions(company),
+            model=company.model,
+            assistant_id=company.assistant_id,
+        ))
+    return changes
+
+
+def print_diff_report(changes: List[PlannedChange]):
+    """Dry-run report of what a real run would do"""
+    symbols = {"create": "+", "update": "~", "unchanged": "="}
+    for change in changes:
+        if change.action == "unchanged":
+            continue
+        target = change.assistant_id or "(new)"
+        print(f"  {symbols[change.action]} {change.site_id:<30} {change.action:<7} {target:<32} "
+              f"{change.model:<14} {len(change.instructions):>7,} chars  {change.reason}")
+
+    counts = {action: sum(1 for c in changes if c.action == action) for action in symbols}
+    print(f"\nWould create {counts['create']}, update {counts['update']}, "
+          f"leave {counts['unchanged']} unchanged")
+
+
+def _retry_after(error: RateLimitError) -> Optional[float]:
+    """Server-suggested wait from a 429 response, if any"""
+    headers = error.response.headers if error.response is not None else {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return None
+
+
+async def call_with_backoff(bucket: TokenBucket, make_call, stats: dict):
+    """Rate-limited API call, retrying 429s/transient errors with jittered exponential backoff"""
+    for attempt in range(MAX_ATTEMPTS):
+        await bucket.acquire()
+        try:
+            return await make_call()
+        except (RateLimitError, InternalServerError, APIConnectionError) as e:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            stats["retries"] += 1
+            delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt)
+            if isinstance(e, RateLimitError):
+                stats["rate_limited"] += 1
+                delay = max(delay, _retry_after(e) or 0.0)
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+
+
+async def provision(changes: List[PlannedChange], concurrency: int, rate: float,
+                    burst: float, batch_size: int) -> dict:
+    """Run creates/updates concurrently and commit results in batches"""
+    client = AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        max_retries=0,  # Retries are handled here, under the shared rate limit
+    )
+    bucket = TokenBucket(rate, burst)
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"created": 0, "updated": 0, "failed": 0, "retries": 0, "rate_limited": 0, "commits": 0}
+    pending: List[tuple] = []  # (change, assistant_id) waiting to be written
+
+    def flush():
+        if not pending:
+            return
+        db = SessionLocal()
+        try:
+            site_ids = [change.site_id for change, _ in pending]
+            companies = {
+                c.site_id: c for c in db.query(Company).filter(Company.site_id.in_(site_ids))
+            }
+            for change, assistant_id in pending:
+                company = companies.get(change.site_id)
+                if company is None:
+                    continue
+                company.assistant_id = assistant_id
+                record_sync(db, company, change.content_hash)
+            db.commit()
+            stats["commits"] += 1
+        finally:
+            db.close()
+        pending.clear()
+
+    async def apply(change: PlannedChange):
+        async with semaphore:
+            try:
+                if change.action == "create":
+                    assistant = await call_with_backoff(bucket, lambda: client.beta.assistants.create(
+                        name=f"{change.name} Support Assistant",
+                        instructions=change.instructions,
+                        model=change.model
+                    ), stats)
+                    stats["created"] += 1
+                else:
+                    assistant = await call_with_backoff(bucket, lambda: client.beta.assistants.update(
+                        assistant_id=change.assistant_id,
+                        instructions=change.instructions,
+                        model=change.model
+                    ), stats)
+                    stats["updated"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"❌ {change.site_id}: {str(e)}")
+                return
+
+            pending.append((change, assistant.id))
+            if len(pending) >= batch_size:
+                flush()
+
+    try:
+        await asyncio.gather(*(apply(c) for c in changes if c.action != "unchanged"))
+        flush()
+    finally:
+        await client.close()
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--force", action="store_true", help="Update every existing assistant")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=8.0, help="API requests per second")
+    parser.add_argument("--burst", type=float, default=16.0)
+    parser.add_argument("--batch-size", type=int, default=50, help="Companies per DB commit")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("Bulk Assistant Provisioning" + (" (dry run)" if args.dry_run else ""))
+    print("="*60 + "\n")
+
+    init_db()
+    db = SessionLocal()
+    try:
+        changes = plan_changes(db, force=args.force)
+    finally:
+        db.close()
+
+    if args.dry_run:
+        print_diff_report(changes)
+        return
+
+    start = time.perf_counter()
+    stats = asyncio.run(provision(changes, args.concurrency, args.rate, args.burst, args.batch_size))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n✓ Created {stats['created']}, updated {stats['updated']}, failed {stats['failed']} "
+          f"in {elapsed:.1f}s ({stats['retries']} retries, {stats['rate_limited']} rate-limited, "
+          f"{stats['commits']} commits)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Circuit breaker for the OpenAI Assistants API
+Tracks the error rate and the share of slow assistant turns over a rolling
+window. When either crosses its threshold the breaker opens and chat/SMS
+answer at once from fallbacks instead of queueing more runs onto a degraded
+API; after a cool-off a few probe calls decide whether to close it again
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Tuple
+
+import openai
+
+from metrics import CIRCUIT_OPEN
+
+WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))  # Don't judge on fewer calls than this
+ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", "15"))
+SLOW_RATE = float(os.getenv("CIRCUIT_SLOW_RATE", "0.5"))
+OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+HALF_OPEN_PROBES = 2  # Calls let through at once to test recovery
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+SUCCESS, FAILURE, IGNORE = "success", "failure", "ignore"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OpenAI while the breaker is open"""
+
+
+def is_outage(error: Exception) -> bool:
+    """Errors that say OpenAI is unhealthy (not our own bad requests)"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True  # APITimeoutError is an APIConnectionError
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    def __init__(self, window_seconds: float, min_calls: int, error_rate: float,
+                 slow_call_seconds: float, slow_rate: float, open_seconds: float):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()  # (when, failed, slow)
+        self._probes = 0
+        self._half_open_since = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """May a call go to OpenAI now? Every allowed call must be followed by record()"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self._set_state(HALF_OPEN)
+                self._probes = 0
+                self._half_open_since = time.monotonic()
+            if self.state == HALF_OPEN:
+                if self._probes >= HALF_OPEN_PROBES:
+                    self.rejected += 1
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, outcome: str, seconds: float = 0.0):
+        """
+        Report an allowed call that took `seconds`: SUCCESS, FAILURE, or
+        IGNORE (failed for reasons unrelated to OpenAI)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if now - seconds < self._half_open_since:
+                    return  # Started before the breaker opened - not a probe
+                self._probes = max(0, self._probes - 1)
+                if outcome == SUCCESS and seconds < self.slow_call_seconds:
+                    self._set_state(CLOSED)
+                    self._calls.clear()
+                    print("✓ OpenAI circuit breaker closed")
+                elif outcome != IGNORE:
+                    self._open(now)
+                return
+            if outcome == IGNORE or self.state == OPEN:
+                return
+
+            self._calls.append((now, outcome == FAILURE, seconds >= self.slow_call_seconds))
+            while self._calls and now - self._calls[0][0] > self.window_seconds:
+                self._calls.popleft()
+
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failed = sum(1 for _, failure, _ in self._calls if failure)
+            slow = sum(1 for _, _, is_slow in self._calls if is_slow)
+            if failed / total >= self.error_rate or slow / total >= self.slow_rate:
+                self._open(now)
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_OPEN.set(0 if state == CLOSED else 1)
+
+    def _open(self, now: float):
+        self._set_state(OPEN)
+        self.opened_at = now
+        self.times_opened += 1
+        self._calls.clear()
+        print(f"⚠ OpenAI circuit breaker opened - answering from fallbacks for {self.open_seconds:g}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = len(self._calls)
+            return {
+                "state": self.state,
+                "window_calls": total,
+                "window_error_rate": round(sum(1 for c in self._calls if c[1]) / total, 3) if total else 0.0,
+                "window_slow_rate": round(sum(1 for c in self._calls if c[2]) / total, 3) if total else 0.0,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+openai_breaker = CircuitBreaker(
+    window_seconds=WINDOW_SECONDS,
+    min_calls=MIN_CALLS,
+    error_rate=ERROR_RATE,
+    slow_call_seconds=SLOW_CALL_SECONDS,
+    slow_rate=SLOW_RATE,
+    open_seconds=OPEN_SECONDS,
+)
@@ -0,0 +1,68 @@
+"""
+Citation marker handling for assistant responses
+The Assistants API embeds file-search citations like 【4:0†source】 in text
+"""
+
+import re
+
+CITATION_PATTERN = re.compile(r'【\d+:\d+†[^】]+】')
+
+# Anything that could still grow into a full citation marker
+_PARTIAL_CITATION = re.compile(r'【(?:\d+(?::(?:\d+(?:†[^】]*)?)?)?)?')
+
+# Real markers are short; give up buffering past this length
+MAX_MARKER_LENGTH = 64
+
+
+def strip_citations(text: str) -> str:
+    """Remove citation annotations like 【4:0†source】"""
+    return CITATION_PATTERN.sub('', text)
+
+
+class CitationStripper:
+    """
+    Incremental citation remover for streamed text
+    Holds back text that might be the start of a marker until it's complete,
+    so markers split across chunks (e.g. '【4:' + '0†source】') are still removed
+    """
+
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the text that is safe to emit"""
+        self._buffer += chunk
+        output = []
+
+        while self._buffer:
+            start = self._buffer.find('【')
+            if start == -1:
+                output.append(self._buffer)
+                self._buffer = ''
+                break
+
+            # Everything before the bracket is plain text
+            output.append(self._buffer[:start])
+            self._buffer = self._buffer[start:]
+
+            end = self._buffer.find('】')
+            if end != -1:
+                candidate = self._buffer[:end + 1]
+                if CITATION_PATTERN.fullmatch(candidate):
+                    self._buffer = self._buffer[end + 1:]
+                    continue
+            elif (len(self._buffer) <= MAX_MARKER_LENGTH
+                  and _PARTIAL_CITATION.fullmatch(self._buffer)):
+                # Might still become a marker - wait for more text
+                break
+
+            # Not a marker: emit the bracket and keep scanning after it
+            output.append(self._buffer[0])
+            self._buffer = self._buffer[1:]
+
+        return ''.join(output)
+
+    def flush(self) -> str:
+        """Return any held-back text at the end of the stream"""
+        remaining, self._buffer = self._buffer, ''
+        return remaining
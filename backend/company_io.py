@@ -0,0 +1,232 @@
+"""
+Bulk company import/export
+Parses streamed JSONL or a tarball of config/*.yaml + content/*/knowledge.md
+into company records, upserts them in batched transactions, and streams
+companies back out as JSONL a batch of rows at a time
+"""
+
+import json
+import os
+import tarfile
+import tempfile
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import yaml
+
+from models import Company, SessionLocal
+
+IMPORT_BATCH_SIZE = int(os.getenv("COMPANY_IMPORT_BATCH", "200"))
+EXPORT_BATCH_SIZE = int(os.getenv("COMPANY_EXPORT_BATCH", "100"))
+SPOOL_MAX_BYTES = 8 * 1024 * 1024  # Uploaded tarballs beyond this go to a temp file
+
+# Columns written by export and accepted by import (flat, so exports re-import as-is)
+EXPORT_FIELDS = [
+    "site_id", "name", "domain", "description", "primary_color", "greeting",
+    "assistant_id", "model", "temperature", "max_tokens", "system_prompt",
+    "contact_info", "knowledge_base", "faqs", "sms_enabled", "sms_phone_number",
+    "rate_limit_per_minute", "rate_limit_burst", "active", "updated_at",
+]
+
+
+def company_fields_from_yaml(config: dict, knowledge: str) -> dict:
+    """Map a legacy config/<site>.yaml (plus its knowledge.md) to Company fields"""
+    site = config.get('site', {})
+    branding = config.get('branding', {})
+    ai = config.get('ai', {})
+    sms = config.get('sms', {})
+
+    return {
+        'name': site.get('name'),
+        'domain': site.get('domain', ''),
+        'description': site.get('description', ''),
+
+        # Branding
+        'primary_color': branding.get('primary_color', '#0066cc'),
+        'greeting': branding.get('greeting', 'Hello! How can I help you today?'),
+
+        # AI config
+        'model': ai.get('model', 'gpt-4o-mini'),
+        'temperature': str(ai.get('temperature', 0.4)),
+        'max_tokens': ai.get('max_tokens', 500),
+        'system_prompt': ai.get('system_prompt', ''),
+
+        # Contact info
+        'contact_info': config.get('business', {}).get('contact', {}),
+
+        # Knowledge and FAQs
+        'knowledge_base': knowledge,
+        'faqs': config.get('faqs', []),
+
+        # SMS config
+        'sms_enabled': sms.get('enabled', False),
+        'sms_phone_number': sms.get('phone_number', ''),
+    }
+
+
+async def iter_jsonl(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Parse a streamed JSONL/NDJSON body one line at a time
+    Yields (line_number, record, error) - bad lines are reported, not fatal
+    """
+    buffer = b""
+    line_number = 0
+
+    def parse(line: bytes):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return None, f"invalid JSON: {str(e)}"
+        if not isinstance(record, dict):
+            return None, "expected a JSON object"
+        return record, None
+
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield (line_number, *parse(line))
+
+    if buffer.strip():
+        yield (line_number + 1, *parse(buffer))
+
+
+async def spool_upload(chunks: AsyncIterator[bytes]):
+    """Copy a streamed upload into a temp file (in memory while small)"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    async for chunk in chunks:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def iter_tarball(fileobj) -> Iterator[Tuple[str, Optional[dict], Optional[str]]]:
+    """
+    Read company records from a (optionally gzipped) tarball laid out like the
+    repo: config/<site>.yaml and content/<site>/knowledge.md, at any depth
+    Yields (member_name, record, error); a knowledge.md without a YAML
+    becomes a knowledge-only update
+    """
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError as e:
+        yield ("", None, f"invalid tarball: {str(e)}")
+        return
+
+    configs: Dict[str, tarfile.TarInfo] = {}
+    knowledge: Dict[str, tarfile.TarInfo] = {}
+
+    with archive:
+        # Headers only - file contents are read one site at a time below
+        for member in archive.getmembers():
+            if not member.isfile():
+                continue
+            parts = PurePosixPath(member.name).parts
+            if len(parts) >= 2 and parts[-2] == "config" and parts[-1].endswith((".yaml", ".yml")):
+                configs[PurePosixPath(parts[-1]).stem] = member
+            elif len(parts) >= 3 and parts[-3] == "content" and parts[-1] == "knowledge.md":
+                knowledge[parts[-2]] = member
+
+        def read(member: tarfile.TarInfo) -> str:
+            return archive.extractfile(member).read().decode("utf-8")
+
+        for site_id in sorted(set(configs) | set(knowledge)):
+            member = configs.get(site_id) or knowledge[site_id]
+            try:
+                knowledge_text = read(knowledge[site_id]) if site_id in knowledge else ""
+                if site_id in configs:
+                    config = yaml.safe_load(read(configs[site_id])) or {}
+                    record = company_fields_from_yaml(config, knowledge_text)
+                else:
+                    record = {"knowledge_base": knowledge_text}
+            except (yaml.YAMLError, UnicodeDecodeError, AttributeError) as e:
+                yield (member.name, None, f"could not read {site_id}: {str(e)}")
+                continue
+
+            record["site_id"] = site_id
+            yield (member.name, {k: v for k, v in record.items() if v is not None}, None)
+
+
+def upsert_batch(db, records: List) -> dict:
+    """
+    Insert or update a batch of validated records (pydantic models) in one
+    transaction. Existing companies only get the fields a record sets, and
+    only actually-changed companies get a new updated_at
+    Returns site_ids by outcome (created, updated, unchanged) plus errors
+    """
+    site_ids = [record.site_id for record in records]
+    existing = {
+        company.site_id: company
+        for company in db.query(Company).filter(Company.site_id.in_(site_ids))
+    }
+    result = {"created": [], "updated": [], "unchanged": [], "errors": []}
+
+    for record in records:
+        company = existing.get(record.site_id)
+
+        if company is None:
+            if not record.name:
+                result["errors"].append({"site_id": record.site_id, "error": "name is required for new companies"})
+                continue
+            fields = record.dict()
+            fields["contact_info"] = fields.get("contact_info") or {}
+            fields["faqs"] = fields.get("faqs") or []
+            company = Company(**fields)
+            db.add(company)
+            existing[record.site_id] = company
+            result["created"].append(record.site_id)
+            continue
+
+        changed = False
+        for field, value in record.dict(exclude_unset=True).items():
+            if getattr(company, field) != value:
+                setattr(company, field, value)
+                changed = True
+
+        if record.site_id in result["created"]:
+            continue
+        if changed:
+            company.updated_at = datetime.utcnow()
+            result["updated"].append(record.site_id)
+        else:
+            result["unchanged"].append(record.site_id)
+
+    db.commit()
+    return result
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def export_companies(active_only: bool = False, include_knowledge: bool = True) -> Iterator[bytes]:
+    """
+    Stream companies as JSONL
+    Pages through the table by id (keyset) with plain column queries, so only
+    one batch of knowledge bases is in memory at a time
+    """
+    fields = [f for f in EXPORT_FIELDS if include_knowledge or f != "knowledge_base"]
+    columns = [Company.id] + [getattr(Company, f) for f in fields]
+    last_id = 0
+
+    while True:
+        db = SessionLocal()
+        try:
+            query = db.query(*columns).filter(Company.id > last_id)
+            if active_only:
+                query = query.filter(Company.active == True)
+            rows = query.order_by(Company.id).limit(EXPORT_BATCH_SIZE).all()
+        finally:
+            db.close()
+
+        if not rows:
+            return
+
+        for row in rows:
+            yield (json.dumps(dict(zip(fields, row[1:])), default=_json_default) + "\n").encode("utf-8")
+        last_id = rows[-1][0]
@@ -0,0 +1,62 @@
+"""
+Answers for when the assistant can't be used (circuit breaker open, run
+failed or past its deadline). Tenant-specific where possible: a cached
+answer, then the closest FAQ (with a lower bar than the normal FAQ
+shortcut), then the company's contact details
+"""
+
+import os
+from typing import Optional, Tuple
+
+from answer_cache import answer_cache
+from faq_matcher import FaqIndex
+
+FALLBACK_FAQ_THRESHOLD = float(os.getenv("FALLBACK_FAQ_THRESHOLD", "0.4"))
+FALLBACK_MESSAGE = os.getenv(
+    "FALLBACK_MESSAGE",
+    "Sorry, I'm having trouble answering right now. Please try again in a moment."
+)
+
+
+def contact_message(company) -> Optional[str]:
+    """Escalation text from the company's contact_info, or None if it has no phone/email/website"""
+    info = company.contact_info or {}
+    phone, email, website = info.get("phone"), info.get("email"), info.get("website")
+
+    ways = " or ".join(part for part in (phone and f"call {phone}", email and f"email {email}") if part)
+    if not ways and not website:
+        return None
+
+    message = "Sorry, I'm having trouble answering right now."
+    if ways:
+        hours = f" ({info['hours']})" if info.get("hours") else ""
+        message += f" To reach the {company.name} team, {ways}{hours}."
+    if website:
+        message += f" You can also visit {website}."
+    return message
+
+
+def _close_faq(index: Optional[FaqIndex], question: str) -> Optional[str]:
+    if index is None:
+        return None
+    match = index.match(question)
+    if match is not None and match.confidence >= FALLBACK_FAQ_THRESHOLD:
+        return match.answer
+    return None
+
+
+def fallback_answer(company, question: str) -> Tuple[str, str]:
+    """(text, kind) where kind is cache, faq, contact or generic"""
+    cached = answer_cache.get(company.site_id, company.updated_at, question)
+    if cached is not None:
+        return cached, "cache"
+
+    faq = _close_faq(company.faq_index, question)
+    if faq is not None:
+        return faq, "faq"
+
+    contact = contact_message(company)
+    if contact is not None:
+        return contact, "contact"
+
+    return FALLBACK_MESSAGE, "generic"
@@ -0,0 +1,153 @@
+"""
+Local FAQ matcher
+BM25 index over a tenant's FAQ questions, so well-known questions are
+answered in milliseconds without an assistant run
+"""
+
+import math
+import os
+import re
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+# Question words and glue that say nothing about which FAQ is meant
+STOPWORDS = frozenset("""
+a an and are as at be can could do does for from get how i if in is it its me my
+of on or our should so that the their there this to was we what when where which
+who why will with would you your
+""".split())
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# F-beta weight of question coverage over FAQ coverage in the confidence
+RECALL_WEIGHT = 2.0
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords (keeps duplicates)"""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class FaqMatch:
+    __slots__ = ("question", "answer", "confidence", "matched_terms")
+
+    def __init__(self, question: str, answer: str, confidence: float, matched_terms: int):
+        self.question = question
+        self.answer = answer
+        self.confidence = confidence
+        self.matched_terms = matched_terms  # Distinct question terms the FAQ contains
+
+
+class FaqIndex:
+    """
+    BM25 over FAQ questions, stored as compact arrays
+    Postings hold precomputed per-(term, doc) BM25 weights, so scoring a
+    query is just summing array entries
+    """
+
+    def __init__(self, faqs: List[dict]):
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        docs: List[List[str]] = []
+
+        for faq in faqs or []:
+            question, answer = faq.get("question"), faq.get("answer")
+            tokens = tokenize(question or "")
+            if tokens and answer:
+                self.questions.append(question)
+                self.answers.append(answer)
+                docs.append(tokens)
+
+        count = len(docs)
+        avg_length = sum(len(doc) for doc in docs) / count if count else 0.0
+
+        document_frequency: Dict[str, int] = {}
+        for doc in docs:
+            for term in set(doc):
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        self.idf: Dict[str, float] = {
+            term: math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        self.max_idf = max(self.idf.values(), default=0.0)
+
+        # term -> (doc ids, BM25 weights)
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        # Sum of idf over each doc's distinct terms (for confidence)
+        self.doc_idf = array('f', [0.0] * count)
+
+        for doc_id, doc in enumerate(docs):
+            length_norm = K1 * (1 - B + B * len(doc) / avg_length)
+            for term in set(doc):
+                tf = doc.count(term)
+                weight = self.idf[term] * tf * (K1 + 1) / (tf + length_norm)
+                doc_ids, weights = self.postings.setdefault(term, (array('H'), array('f')))
+                doc_ids.append(doc_id)
+                weights.append(weight)
+                self.doc_idf[doc_id] += self.idf[term]
+
+    def __len__(self):
+        return len(self.questions)
+
+    def match(self, query: str) -> Optional[FaqMatch]:
+        """
+        Best FAQ for a question, with a 0-1 confidence
+        Ranked by BM25; confidence is an F-score of idf-weighted term overlap
+        (how much of the question the FAQ covers, and vice versa), weighted
+        towards the question side since visitors ask shorter questions
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.questions:
+            return None
+
+        scores: Dict[int, float] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            for doc_id, weight in zip(*posting):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+
+        if not scores:
+            return None
+
+        best = max(scores, key=scores.get)
+        matched = [term for term in terms if self._contains(term, best)]
+        overlap = sum(self.idf[term] for term in matched)
+        # Unknown query terms count as maximally informative
+        query_idf = sum(self.idf.get(term, self.max_idf) for term in terms)
+        recall = overlap / query_idf
+        precision = overlap / self.doc_idf[best]
+        beta2 = RECALL_WEIGHT ** 2
+        confidence = (1 + beta2) * recall * precision / (beta2 * precision + recall) if overlap else 0.0
+
+        return FaqMatch(self.questions[best], self.answers[best], confidence, len(matched))
+
+    def _contains(self, term: str, doc_id: int) -> bool:
+        posting = self.postings.get(term)
+        return posting is not None and doc_id in posting[0]
+
+
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.75"))
+# A one-word question ("card") matches "How do I get a card?" perfectly but says too little
+FAQ_MIN_MATCHED_TERMS = int(os.getenv("FAQ_MIN_MATCHED_TERMS", "2"))
+
+
+def match_faq(index: Optional[FaqIndex], question: str) -> Optional[FaqMatch]:
+    """
+    Return a FAQ match only if it clears the confidence threshold and shares
+    at least FAQ_MIN_MATCHED_TERMS content words with the question.
+    Only for opening questions: follow-ups depend on the conversation
+    """
+    if index is None:
+        return None
+    match = index.match(question)
+    if match is not None and match.confidence >= FAQ_MATCH_THRESHOLD \
+            and match.matched_terms >= FAQ_MIN_MATCHED_TERMS:
+        return match
+    return None
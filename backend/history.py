@@ -0,0 +1,107 @@
+"""
+Conversation history compaction
+Assistant runs send the whole thread, so every turn of a long chat costs
+more tokens and latency than the last. Once a session passes a turn or
+(locally estimated) token budget, older turns are folded into a short
+rolling summary; runs then only see the last few turns
+(truncation_strategy) plus the summary (in the run's instructions)
+"""
+
+import math
+import os
+import re
+from typing import List, NamedTuple, Optional
+
+HISTORY_COMPACTION = os.getenv("HISTORY_COMPACTION", "true").lower() in ("1", "true", "yes")
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "10"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))  # Sent verbatim after compaction
+SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+QUESTION_CHARS = 160
+ANSWER_CHARS = 240
+
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+class HistoryContext(NamedTuple):
+    """What a run needs to use a compacted history"""
+    summary: str
+    last_messages: int  # Thread messages to send (kept turns + the new question)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Rough BPE token count without a tokenizer: ~4 characters per word piece, 1 per punctuation mark"""
+    if not text:
+        return 0
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PIECES.findall(text))
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+
+def _gist(text: str, min_chars: int = 40) -> str:
+    """Leading sentences of an answer - enough of them to say more than a bare "Yes!" """
+    gist = ""
+    for sentence in _SENTENCE_END.split(" ".join(text.split())):
+        gist = f"{gist} {sentence}".strip()
+        if len(gist) >= min_chars:
+            break
+    return gist
+
+
+def summarize(previous: Optional[str], turns: List[list]) -> str:
+    """
+    Fold turns into the rolling summary (extractive: each question plus the
+    gist of its answer), dropping the oldest lines past SUMMARY_MAX_TOKENS
+    """
+    lines = previous.splitlines() if previous else []
+    for question, answer in turns:
+        line = f"- Visitor: {_clip(question, QUESTION_CHARS)}"
+        if answer:
+            line += f" | You: {_clip(_gist(answer), ANSWER_CHARS)}"
+        lines.append(line)
+
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > SUMMARY_MAX_TOKENS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def add_exchange(chat_session, question: Optional[str], answer: Optional[str]):
+    """Record one turn on a ChatSession row, compacting it once it's over budget"""
+    if not HISTORY_COMPACTION or not question:
+        return
+
+    turns = list(chat_session.recent_turns or [])
+    turns.append([question, answer])
+    tokens = (chat_session.history_tokens or 0) + estimate_tokens(question) + estimate_tokens(answer)
+
+    if len(turns) > HISTORY_MAX_TURNS or tokens > HISTORY_TOKEN_BUDGET:
+        older, turns = turns[:-HISTORY_KEEP_TURNS], turns[-HISTORY_KEEP_TURNS:]
+        chat_session.summary = summarize(chat_session.summary, older)
+        tokens = estimate_tokens(chat_session.summary) + sum(
+            estimate_tokens(q) + estimate_tokens(a) for q, a in turns
+        )
+
+    # A new list, so SQLAlchemy sees the JSON column change
+    chat_session.recent_turns = turns
+    chat_session.history_tokens = tokens
+
+
+def history_context(chat_session) -> Optional[HistoryContext]:
+    """Run settings for a compacted session (None until its first compaction)"""
+    if not HISTORY_COMPACTION or chat_session is None or not chat_session.summary:
+        return None
+    kept = len(chat_session.recent_turns or [])
+    return HistoryContext(chat_session.summary, 2 * kept + 1)
+
+
+def summary_instructions(history: HistoryContext) -> str:
+    """Appended to the run's additional_instructions"""
+    return (
+        "\n\n## Earlier in this conversation\n"
+        "Older messages are not shown; this is a summary of them:\n"
+        f"{history.summary}"
+    )
@@ -0,0 +1,57 @@
+"""
+Standalone job worker process
+Runs queued assistant jobs (chat and SMS) so web processes only enqueue.
+Scale this separately from the web dyno; set ASSISTANT_RUN_MODE=queue on both
+and JOB_WORKERS_IN_WEB=0 on web to keep all runs here
+
+Usage:
+    python job_worker.py                  # JOB_WORKERS concurrent jobs (default 16)
+"""
+
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Load environment variables (before local imports, which read settings at import time)
+env_path = Path(__file__).parent.parent / '.env'
+load_dotenv(dotenv_path=env_path, override=True)
+
+from models import init_db
+from openai_client import close_async_client
+from jobs import JobWorkerPool
+from tenant_cache import tenant_cache_sync_loop
+from usage import flush_usage, usage_flush_loop
+from transcripts import flush_transcripts, transcript_flush_loop
+import assistant_runs  # noqa: F401 - registers the "chat" handler
+import sms  # noqa: F401 - registers the "sms" handler
+
+
+async def main():
+    init_db()
+    pool = JobWorkerPool(concurrency=int(os.getenv("JOB_WORKERS", "16")))
+    print(f"✓ Job worker started ({pool.concurrency} concurrent jobs)")
+
+    # Company edits made through the web API should reach this process too
+    cache_sync = asyncio.create_task(tenant_cache_sync_loop())
+    usage_flush = asyncio.create_task(usage_flush_loop())
+    transcript_flush = asyncio.create_task(transcript_flush_loop())
+    pool.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        cache_sync.cancel()
+        usage_flush.cancel()
+        transcript_flush.cancel()
+        await pool.stop()
+        await flush_usage()
+        await flush_transcripts()
+        await close_async_client()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
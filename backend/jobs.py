@@ -0,0 +1,348 @@
+"""
+Durable job queue for assistant runs, backed by the `jobs` table
+Web requests enqueue work (deduplicated by idempotency key) and a pool of
+async workers - in the web process, a separate worker process, or both -
+claims jobs with a lease, runs them with a timeout, and retries failures
+with backoff. Works on Postgres (FOR UPDATE SKIP LOCKED) and SQLite
+"""
+
+import asyncio
+import os
+import traceback
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from models import Job, run_db
+
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "120"))  # Seconds per attempt
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+RETRY_BASE_DELAY = 2.0  # Seconds; doubles per attempt
+LEASE_GRACE = 30  # Extra seconds before a running job counts as abandoned
+
+FINISHED = ("succeeded", "failed")
+
+# kind -> async handler(payload) returning a JSON-able result
+_handlers: Dict[str, Callable[[dict], Awaitable[dict]]] = {}
+
+# Wakes local waiters as soon as a job this process ran finishes
+_finished_events: Dict[str, asyncio.Event] = {}
+
+# (attempt, max_attempts) of the job the current handler is running for
+_attempt: ContextVar[Optional[Tuple[int, int]]] = ContextVar("job_attempt", default=None)
+
+
+class PermanentJobError(Exception):
+    """A failure that retrying won't fix (e.g. the company was deleted)"""
+
+
+def register_handler(kind: str):
+    """Decorator: register the coroutine that executes jobs of this kind"""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def final_attempt() -> bool:
+    """
+    False while a job handler runs an attempt that can still be retried, so
+    it should raise rather than settle for a degraded result; True otherwise
+    (last attempt, or not running under the job queue at all)
+    """
+    attempt = _attempt.get()
+    return attempt is None or attempt[0] >= attempt[1]
+
+
+def run_mode() -> str:
+    """'inline' (default) runs the assistant inside the request; 'queue' goes through jobs"""
+    return os.getenv("ASSISTANT_RUN_MODE", "inline")
+
+
+def job_view(job: Job) -> dict:
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def enqueue_job(db: Session, kind: str, site_id: Optional[str], payload: dict,
+                idempotency_key: Optional[str] = None,
+                conversation_key: Optional[str] = None) -> dict:
+    """Add a job (or return the existing one for this idempotency key)"""
+    if idempotency_key:
+        existing = db.query(Job).filter(Job.idempotency_key == idempotency_key).first()
+        if existing is not None:
+            return job_view(existing)
+
+    job = Job(
+        id=f"job_{uuid.uuid4().hex}",
+        kind=kind,
+        site_id=site_id,
+        status="queued",
+        payload=payload,
+        attempts=0,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        idempotency_key=idempotency_key,
+        conversation_key=conversation_key,
+        run_after=datetime.utcnow(),
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Lost a race with an identical request
+        db.rollback()
+        return job_view(db.query(Job).filter(Job.idempotency_key == idempotency_key).one())
+    return job_view(job)
+
+
+def get_job(db: Session, job_id: str) -> Optional[dict]:
+    job = db.get(Job, job_id)
+    return job_view(job) if job else None
+
+
+def _claimable(now: datetime):
+    """Queued and due, or running with an expired lease"""
+    return or_(
+        and_(Job.status == "queued", Job.run_after <= now),
+        and_(Job.status == "running", Job.locked_until < now),
+    )
+
+
+def claim_jobs(db: Session, limit: int) -> List[dict]:
+    """
+    Lease up to `limit` jobs. Each claim is a conditional UPDATE, so two
+    workers can never take the same job; jobs behind an unfinished one in
+    the same conversation wait their turn
+    """
+    now = datetime.utcnow()
+    lease = now + timedelta(seconds=JOB_TIMEOUT + LEASE_GRACE)
+
+    candidates = db.query(Job.id).filter(_claimable(now)).order_by(Job.created_at).limit(
+        limit * 4
+    ).with_for_update(skip_locked=True).all()
+
+    earlier = aliased(Job)
+    blocked = exists().where(
+        earlier.conversation_key == Job.conversation_key,
+        earlier.id != Job.id,
+        or_(
+            and_(earlier.status == "running", earlier.locked_until >= now),
+            and_(earlier.status == "queued", earlier.created_at < Job.created_at),
+        ),
+    )
+
+    claimed = []
+    for (job_id,) in candidates:
+        if len(claimed) >= limit:
+            break
+        updated = db.query(Job).filter(
+            Job.id == job_id,
+            _claimable(now),
+            or_(Job.conversation_key.is_(None), ~blocked),
+        ).update({
+            Job.status: "running",
+            Job.attempts: Job.attempts + 1,
+            Job.locked_until: lease,
+            Job.started_at: now,
+        }, synchronize_session=False)
+        if updated:
+            claimed.append(job_id)
+    db.commit()
+
+    if not claimed:
+        return []
+    return [
+        {"id": job.id, "kind": job.kind, "payload": job.payload,
+         "attempts": job.attempts, "max_attempts": job.max_attempts}
+        for job in db.query(Job).filter(Job.id.in_(claimed))
+    ]
+
+
+def finish_job(db: Session, job_id: str, result: Optional[dict] = None,
+               error: Optional[str] = None, retry: bool = False):
+    """Record success, a permanent failure, or schedule a retry with backoff"""
+    job = db.get(Job, job_id)
+    if job is None:
+        return
+
+    now = datetime.utcnow()
+    if error is None:
+        job.status, job.result, job.error = "succeeded", result, None
+        job.finished_at = now
+    elif retry and job.attempts < job.max_attempts:
+        job.status, job.error = "queued", error
+        job.run_after = now + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+    else:
+        job.status, job.error = "failed", error
+        job.finished_at = now
+    job.locked_until = None
+    db.commit()
+
+
+def purge_finished_jobs(db: Session, older_than_hours: float) -> int:
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    deleted = db.query(Job).filter(
+        Job.status.in_(FINISHED), Job.finished_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+async def wait_for_job(job_id: str, timeout: float) -> dict:
+    """
+    Wait up to `timeout` seconds for a job to finish; returns its latest view
+    Polls the table (the job may run in another process), waking early when
+    this process's workers finish it
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    event = _finished_events.setdefault(job_id, asyncio.Event())
+    try:
+        while True:
+            view = await run_db(get_job, job_id)
+            remaining = deadline - loop.time()
+            if view is None or view["status"] in FINISHED or remaining <= 0:
+                return view
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, JOB_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        _finished_events.pop(job_id, None)
+
+
+class JobWorkerPool:
+    """
+    Runs up to `concurrency` jobs at once in this process
+    One dispatcher claims as many jobs as there are free slots, then sleeps
+    until a slot frees up, a local enqueue wakes it, or the poll interval passes
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.stats = {"succeeded": 0, "retried": 0, "failed": 0}
+        self._running: set = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._dispatcher is None and self.concurrency > 0:
+            self._wake = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        tasks = [self._dispatcher, *self._running] if self._dispatcher else list(self._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+
+    def wake(self):
+        """Check for work now (called after a local enqueue)"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        last_purge = loop.time()
+
+        while True:
+            jobs = []
+            free = self.concurrency - len(self._running)
+            if free > 0:
+                try:
+                    jobs = await run_db(claim_jobs, free)
+                except Exception as e:
+                    print(f"ERROR: Claiming jobs failed: {str(e)}")
+
+            for job in jobs:
+                task = asyncio.create_task(self._execute(job))
+                self._running.add(task)
+                task.add_done_callback(self._done)
+
+            if loop.time() - last_purge > 600:
+                last_purge = loop.time()
+                try:
+                    await run_db(purge_finished_jobs, JOB_RETENTION_HOURS)
+                except Exception as e:
+                    print(f"ERROR: Purging old jobs failed: {str(e)}")
+
+            # Got a full batch and still have room - go straight back for more
+            if jobs and len(jobs) == free:
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def _done(self, task: asyncio.Task):
+        self._running.discard(task)
+        self.wake()
+
+    async def _execute(self, job: dict):
+        handler = _handlers.get(job["kind"])
+        result, error, retry = None, None, False
+
+        if handler is None:
+            error = f"No handler for job kind '{job['kind']}'"
+        else:
+            token = _attempt.set((job["attempts"], job["max_attempts"]))
+            try:
+                result = await asyncio.wait_for(handler(job["payload"]), JOB_TIMEOUT)
+            except PermanentJobError as e:
+                error = str(e)
+            except asyncio.TimeoutError:
+                error, retry = f"Timed out after {JOB_TIMEOUT:.0f}s", True
+            except Exception as e:
+                error, retry = f"{type(e).__name__}: {str(e)}", True
+                print(f"ERROR: Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed: {str(e)}")
+                print(traceback.format_exc())
+            finally:
+                _attempt.reset(token)
+
+        try:
+            await run_db(finish_job, job["id"], result, error, retry)
+        except Exception as e:
+            # The lease will expire and the job will be picked up again
+            print(f"ERROR: Recording job {job['id']} failed: {str(e)}")
+            return
+
+        if error is None:
+            self.stats["succeeded"] += 1
+        elif retry and job["attempts"] < job["max_attempts"]:
+            self.stats["retried"] += 1
+        else:
+            self.stats["failed"] += 1
+
+        event = _finished_events.get(job["id"])
+        if event is not None:
+            event.set()
+
+
+job_pool = JobWorkerPool(concurrency=int(os.getenv("JOB_WORKERS_IN_WEB", "4")))
+
+
+async def submit_job(kind: str, site_id: Optional[str], payload: dict,
+                     idempotency_key: Optional[str] = None,
+                     conversation_key: Optional[str] = None) -> dict:
+    """Enqueue from async code and nudge this process's workers"""
+    view = await run_db(enqueue_job, kind, site_id, payload, idempotency_key, conversation_key)
+    job_pool.start()  # No-op if already running (or JOB_WORKERS_IN_WEB=0)
+    job_pool.wake()
+    return view
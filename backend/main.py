@@ -4,9 +4,10 @@ Multi-tenant FastAPI server for chat and SMS support with OpenAI Assistants API
 Database-driven configuration - no redeployment needed for new companies!
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 from pathlib import Path
 from dotenv import load_dotenv
@@ -14,10 +15,39 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 import os
 import traceback
-import re
-from openai import OpenAI
-from models import Company, init_db, get_db
+import json
+import asyncio
+import time
+import uuid
+import openai
+
+# Load environment variables (before local imports, which read settings at import time)
+env_path = Path(__file__).parent.parent / '.env'
+load_dotenv(dotenv_path=env_path, override=True)
+
+from models import Company, init_db, run_db
+from openai_client import get_async_client, close_async_client, tenant_slot
+from citations import CitationStripper
+from sessions import get_session_history, add_user_message, record_turn, session_reaper_loop
+from tenant_cache import tenant_cache, tenant_cache_sync_loop, warm_tenant_cache
+from answer_cache import answer_cache, normalize_question
+from single_flight import chat_flights
+from faq_matcher import match_faq
+from retrieval import retrieve_instructions
+from assistant_sync import SYNC_ON_STARTUP, sync_stale_assistants
+from assistant_runs import OUTAGE_RUN_ERRORS, answer_chat, degraded_reply, run_options
+from circuit_breaker import FAILURE, IGNORE, SUCCESS, is_outage, openai_breaker
+from jobs import job_pool, run_mode, submit_job, wait_for_job, get_job
+from sms import sms_queue, sms_session_id, InboundSMS, EMPTY_TWIML, parse_form, valid_signature, find_site_for_number
 from admin_api import router as admin_router
+from usage import flush_usage, usage_flush_loop, usage_tracker
+from transcripts import flush_transcripts, transcript_flush_loop, transcript_log
+from analytics import analytics_loop
+from widget_assets import (
+    WIDGET_DIR, WidgetStaticFiles, asset_response, bootstrap_response, config_response, widget_bundle
+)
+from rate_limit import client_ip, rate_limiter
+from metrics import MetricsMiddleware, observe_stage, render_metrics, track_stage
 
 app = FastAPI(title="Multi-Tenant Chatbot API", version="3.0.0")
 
@@ -35,22 +65,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load environment variables
-env_path = Path(__file__).parent.parent / '.env'
-load_dotenv(dotenv_path=env_path, override=True)
-
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Outermost, so it sees every request (including CORS preflights)
+app.add_middleware(MetricsMiddleware)
 
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database tables on startup"""
+    """Initialize database tables on startup (a no-op when the schema is current, see init_db)"""
     init_db()
-    db = next(get_db())
-    company_count = db.query(Company).count()
-    print(f"✓ Database connected: {company_count} companies loaded")
-    db.close()
+
+    # Preload tenant configs in the background; requests that come first load on demand
+    app.state.tenant_cache_warm = asyncio.create_task(warm_tenant_cache())
+
+    # Re-push assistants whose instructions are stale (e.g. after switching KNOWLEDGE_MODE)
+    if SYNC_ON_STARTUP:
+        app.state.assistant_resync = asyncio.create_task(sync_stale_assistants())
+
+    # Delete OpenAI threads for sessions that have gone idle
+    app.state.session_reaper = asyncio.create_task(session_reaper_loop())
+
+    # Pick up company changes made through other workers
+    app.state.tenant_cache_sync = asyncio.create_task(tenant_cache_sync_loop())
+
+    # Batched writes of per-tenant token usage
+    app.state.usage_flush = asyncio.create_task(usage_flush_loop())
+
+    # Batched transcript writes (chat handlers only append to a buffer)
+    app.state.transcript_flush = asyncio.create_task(transcript_flush_loop())
+
+    # Fold logged messages into the analytics rollups (one process at a time does each batch)
+    app.state.analytics = asyncio.create_task(analytics_loop())
+
+    # Workers that generate and send SMS replies
+    sms_queue.start()
+
+    # Job workers in this process (queue mode; JOB_WORKERS_IN_WEB=0 leaves it to job_worker.py)
+    if run_mode() == "queue":
+        job_pool.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and release pooled OpenAI connections"""
+    app.state.session_reaper.cancel()
+    app.state.tenant_cache_warm.cancel()
+    if SYNC_ON_STARTUP:
+        app.state.assistant_resync.cancel()
+    app.state.tenant_cache_sync.cancel()
+    app.state.usage_flush.cancel()
+    app.state.transcript_flush.cancel()
+    app.state.analytics.cancel()
+    await sms_queue.stop()
+    await job_pool.stop()
+    await flush_usage()  # Whatever the workers above recorded since the last flush
+    await flush_transcripts()
+    await close_async_client()
 
 
 # Pydantic models
@@ -59,17 +128,20 @@ class ChatMessage(BaseModel):
     session_id: Optional[str] = None
     site: str = Field(..., description="Site identifier: rx4miracles or louisianadental")
 
+    @field_validator("session_id")
+    @classmethod
+    def not_sms_session(cls, value):
+        # SMS conversations are keyed by phone number - don't let web chats attach to them
+        if value and value.startswith("sms:"):
+            raise ValueError("invalid session_id")
+        return value
+
 
 class ChatResponse(BaseModel):
     response: str
     session_id: str
     timestamp: str
-
-
-class SMSMessage(BaseModel):
-    from_number: str
-    body: str
-    site: str
+    source: str = "assistant"  # Which path answered: faq, cache, coalesced, assistant or fallback
 
 
 class WidgetConfig(BaseModel):
@@ -78,10 +150,14 @@ class WidgetConfig(BaseModel):
     greeting_message: str
 
 
+def _count_active_companies(db: Session) -> int:
+    return db.query(Company).filter(Company.active == True).count()
+
+
 @app.get("/")
-async def root(db: Session = Depends(get_db)):
+async def root():
     """Health check endpoint"""
-    company_count = db.query(Company).filter(Company.active == True).count()
+    company_count = await run_db(_count_active_companies)
     return {
         "status": "online",
         "service": "Chatbot Microservice API",
@@ -91,58 +167,104 @@ async def root(db: Session = Depends(get_db)):
     }
 
 
+def _local_response(message: ChatMessage, text: str, source: str) -> ChatResponse:
+    """Build a response for an answer that didn't need an assistant run"""
+    return ChatResponse(
+        response=text,
+        session_id=message.session_id or f"session_{uuid.uuid4().hex}",
+        timestamp=datetime.now().isoformat(),
+        source=source,
+    )
+
+
+def _log_exchange(site_id: str, message: ChatMessage, response: ChatResponse, started: float,
+                  channel: str = "web") -> ChatResponse:
+    """Buffer the question and answer for the transcript log (written in the background)"""
+    transcript_log.record(site_id, response.session_id, message.message, response.response,
+                          response.source, time.perf_counter() - started, channel)
+    return response
+
+
+async def _lookup_tenant(site: str):
+    """tenant_cache.get, timed (unknown sites are labelled "unknown")"""
+    start = time.perf_counter()
+    company = await tenant_cache.get(site)
+    observe_stage("tenant_lookup", time.perf_counter() - start,
+                  company.site_id if company else None, company.model if company else None)
+    return company
+
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(message: ChatMessage, db: Session = Depends(get_db)):
+async def chat(message: ChatMessage, request: Request, idempotency_key: Optional[str] = Header(None)):
     """
     Handle chat messages using OpenAI Assistants API
     Loads company config from database dynamically
+    With ASSISTANT_RUN_MODE=queue the run goes through the job queue; if it
+    isn't done within CHAT_JOB_WAIT seconds a 202 with a job_id is returned
+    (poll GET /api/jobs/{job_id}). Repeat requests with the same
+    Idempotency-Key header get the same job
+    Over the client or site rate limit: 429 with Retry-After
     """
-    # Get company from database
-    company = db.query(Company).filter(
-        Company.site_id == message.site,
-        Company.active == True
-    ).first()
+    started = time.perf_counter()
+
+    # Get company config (cached, unknown sites too; only hits the DB on a miss)
+    company = await _lookup_tenant(message.site)
 
     if not company:
         raise HTTPException(status_code=404, detail=f"Company '{message.site}' not found or inactive")
 
+    # One client flooding a site (keyed and labelled by a real site only)
+    await rate_limiter.check_client(company.site_id, client_ip(request))
+
     if not company.assistant_id:
         raise HTTPException(status_code=500, detail=f"Assistant not configured for {message.site}")
 
-    try:
-        # Create a simple thread without file attachments (faster)
-        # The assistant instructions already contain the knowledge
-        thread = client.beta.threads.create(
-            messages=[{
-                "role": "user",
-                "content": message.message
-            }]
-        )
+    # Before any session lookup or OpenAI work
+    await rate_limiter.check_site(company)
 
-        # Run the assistant
-        run = client.beta.threads.runs.create_and_poll(
-            thread_id=thread.id,
-            assistant_id=company.assistant_id
-        )
+    site_id = company.site_id
+
+    # DB work runs off the event loop (and only when there's a session to look up)
+    thread_id, history = (await run_db(get_session_history, message.session_id, site_id)
+                          if message.session_id else (None, None))
+    first_turn = thread_id is None
 
-        # Wait for completion and get response
-        if run.status == 'completed':
-            messages = client.beta.threads.messages.list(thread_id=thread.id)
-            ai_response = messages.data[0].content[0].text.value
+    # Opening questions are answered locally when we can: high-confidence FAQ
+    # matches, then repeats from the cache (follow-ups depend on thread
+    # context, so they always go to the assistant)
+    if first_turn:
+        faq = match_faq(company.faq_index, message.message)
+        if faq is not None:
+            return _log_exchange(site_id, message, _local_response(message, faq.answer, "faq"), started)
 
-            # Remove citation annotations like 【4:0†source】
-            ai_response = re.sub(r'【\d+:\d+†[^】]+】', '', ai_response)
+        cached = answer_cache.get(site_id, company.updated_at, message.message)
+        if cached is not None:
+            return _log_exchange(site_id, message, _local_response(message, cached, "cache"), started)
 
-            return ChatResponse(
-                response=ai_response,
-                session_id=message.session_id or thread.id,
-                timestamp=datetime.now().isoformat(),
+    if run_mode() == "queue":
+        # Logged by the chat job (it may finish after a 202)
+        return await _chat_via_queue(message, site_id, idempotency_key)
+
+    try:
+        if first_turn:
+            # Identical opening questions arriving together share one run;
+            # the others get its answer like a cache hit (without its thread)
+            key = (site_id, company.updated_at, normalize_question(message.message))
+            answer, shared = await chat_flights.do(
+                key, lambda: answer_chat(company, message.session_id, None, message.message), site_id
             )
+            if shared:
+                source = "fallback" if answer["source"] == "fallback" else "coalesced"
+                return _log_exchange(site_id, message, _local_response(message, answer["response"], source), started)
         else:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Assistant run failed with status: {run.status}"
-            )
+            answer = await answer_chat(company, message.session_id, thread_id, message.message, history)
+
+        return _log_exchange(site_id, message, ChatResponse(
+            response=answer["response"],
+            session_id=answer["session_id"],
+            timestamp=datetime.now().isoformat(),
+            source=answer["source"],
+        ), started)
 
     except Exception as e:
         print(f"ERROR: {str(e)}")
@@ -152,40 +274,283 @@ async def chat(message: ChatMessage, db: Session = Depends(get_db)):
         )
 
 
+async def _chat_via_queue(message: ChatMessage, site_id: str, idempotency_key: Optional[str]):
+    job = await submit_job(
+        "chat",
+        site_id,
+        {"site_id": site_id, "message": message.message, "session_id": message.session_id},
+        idempotency_key=f"chat:{site_id}:{idempotency_key}" if idempotency_key else None,
+        # Messages in one session run in order
+        conversation_key=f"chat:{site_id}:{message.session_id}" if message.session_id else None,
+    )
+    job = await wait_for_job(job["job_id"], float(os.getenv("CHAT_JOB_WAIT", "25")))
+
+    if job["status"] == "succeeded":
+        return ChatResponse(
+            response=job["result"]["response"],
+            session_id=job["result"]["session_id"],
+            timestamp=datetime.now().isoformat(),
+            source=job["result"].get("source", "assistant"),
+        )
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Error processing chat message: {job['error']}")
+
+    return JSONResponse(status_code=202, content={
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "poll_url": f"/api/jobs/{job['job_id']}",
+    })
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Status (and, once finished, the result) of a queued chat/SMS job"""
+    job = await run_db(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _sse_event(data: dict) -> str:
+    """Format a dict as a Server-Sent Events message"""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(message: ChatMessage, request: Request):
+    """
+    Stream the assistant's reply as Server-Sent Events
+    Emits {"type": "delta", "text": ...} per token chunk, then a final
+    {"type": "done", ...} (or {"type": "error", ...}) event
+    """
+    started = time.perf_counter()
+    company = await _lookup_tenant(message.site)
+
+    if not company:
+        raise HTTPException(status_code=404, detail=f"Company '{message.site}' not found or inactive")
+
+    await rate_limiter.check_client(company.site_id, client_ip(request))
+
+    if not company.assistant_id:
+        raise HTTPException(status_code=500, detail=f"Assistant not configured for {message.site}")
+
+    # Before any session lookup or OpenAI work
+    await rate_limiter.check_site(company)
+
+    site_id = company.site_id
+    assistant_id = company.assistant_id
+    session_thread_id, history = (await run_db(get_session_history, message.session_id, site_id)
+                                  if message.session_id else (None, None))
+    first_turn = session_thread_id is None
+
+    async def event_stream():
+        client = get_async_client()
+        stripper = CitationStripper()
+        parts = []
+
+        # Same local shortcuts as /api/chat (opening questions only), sent as a single delta
+        local = None
+        if first_turn:
+            faq = match_faq(company.faq_index, message.message)
+            if faq is not None:
+                local = _local_response(message, faq.answer, "faq")
+            else:
+                cached = answer_cache.get(site_id, company.updated_at, message.message)
+                if cached is not None:
+                    local = _local_response(message, cached, "cache")
+        # Checked last: an allowed call has to be reported to the breaker
+        if local is None and not openai_breaker.allow():
+            local = _local_response(message, degraded_reply(company, message.message, "circuit_open"), "fallback")
+
+        if local is not None:
+            _log_exchange(site_id, message, local, started, "stream")
+            yield _sse_event({"type": "delta", "text": local.response})
+            yield _sse_event({
+                "type": "done",
+                "session_id": local.session_id,
+                "timestamp": local.timestamp,
+                "source": local.source,
+            })
+            return
+
+        breaker_started = time.perf_counter()
+        outcome = IGNORE
+        try:
+            excerpts = await retrieve_instructions(site_id, company.updated_at, message.message)
+
+            async with tenant_slot(site_id):
+                stage = "message_add" if session_thread_id else "thread_create"
+                with track_stage(stage, site_id, company.model):
+                    thread_id = await add_user_message(session_thread_id, message.message)
+
+                # Whole run, first token to last (citation stripping happens per delta)
+                run_started = time.perf_counter()
+                with track_stage("run_stream", site_id, company.model):
+                    async with client.beta.threads.runs.stream(
+                        thread_id=thread_id,
+                        assistant_id=assistant_id,
+                        **run_options(excerpts, history)
+                    ) as stream:
+                        async for delta in stream.text_deltas:
+                            text = stripper.feed(delta)
+                            if text:
+                                parts.append(text)
+                                yield _sse_event({"type": "delta", "text": text})
+
+                        run = await stream.get_final_run()
+                usage_tracker.record(site_id, company.model, run.usage, time.perf_counter() - run_started)
+
+            tail = stripper.flush()
+            if tail:
+                parts.append(tail)
+                yield _sse_event({"type": "delta", "text": tail})
+
+            if run.status != 'completed':
+                error_code = run.last_error.code if run.last_error else None
+                outcome = FAILURE if error_code in OUTAGE_RUN_ERRORS or run.status == 'expired' else IGNORE
+                yield _sse_event({
+                    "type": "error",
+                    "detail": f"Assistant run failed with status: {run.status}"
+                })
+                return
+            outcome = SUCCESS
+
+            session_id = await run_db(record_turn, message.session_id or thread_id, site_id, thread_id,
+                                      message.message, ''.join(parts))
+
+            if first_turn:
+                answer_cache.put(site_id, company.updated_at, message.message, ''.join(parts))
+            transcript_log.record(site_id, session_id, message.message, ''.join(parts), "assistant",
+                                  time.perf_counter() - started, "stream")
+
+            yield _sse_event({
+                "type": "done",
+                "session_id": session_id,
+                "timestamp": datetime.now().isoformat(),
+                "source": "assistant",
+            })
+
+        except openai.OpenAIError as e:
+            outcome = FAILURE if is_outage(e) else IGNORE
+            print(f"ERROR: Streaming turn for {site_id} failed: {str(e)}")
+            if parts:
+                yield _sse_event({"type": "error", "detail": "The assistant stopped responding, please try again"})
+                return
+            # Nothing shown yet - answer from the fallbacks instead
+            fallback = _local_response(message, degraded_reply(company, message.message, "openai_error"), "fallback")
+            _log_exchange(site_id, message, fallback, started, "stream")
+            yield _sse_event({"type": "delta", "text": fallback.response})
+            yield _sse_event({
+                "type": "done",
+                "session_id": fallback.session_id,
+                "timestamp": fallback.timestamp,
+                "source": fallback.source,
+            })
+
+        except Exception as e:
+            print(f"ERROR: {str(e)}")
+            print(traceback.format_exc())
+            yield _sse_event({"type": "error", "detail": f"Error processing chat message: {str(e)}"})
+
+        finally:
+            openai_breaker.record(outcome, time.perf_counter() - breaker_started)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Don't let proxies buffer the stream
+        },
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/api/config/{site}", response_model=WidgetConfig)
-async def get_widget_config(site: str, db: Session = Depends(get_db)):
+async def get_widget_config(site: str, request: Request):
     """
     Get widget configuration for a specific site
-    Loads from database - no hardcoded configs!
+    Loads from database (via the tenant cache) - no hardcoded configs!
+    Cacheable: ETag / Last-Modified follow the company's updated_at, and a
+    matching If-None-Match or If-Modified-Since gets a 304
     """
-    company = db.query(Company).filter(
-        Company.site_id == site,
-        Company.active == True
-    ).first()
+    company = await tenant_cache.get(site)
 
     if not company:
         raise HTTPException(status_code=404, detail="Site not found")
 
-    return WidgetConfig(
-        site_name=company.name,
-        primary_color=company.primary_color,
-        greeting_message=company.greeting,
-    )
+    return config_response(request, company)
+
+
+@app.get("/widget/bootstrap/{site}.js", include_in_schema=False)
+async def widget_bootstrap(site: str, request: Request):
+    """
+    One-tag embed: loads the versioned widget bundle and starts it with the
+    site's config inlined, so first paint needs one request instead of two
+    """
+    company = await tenant_cache.get(site)
+
+    if not company:
+        raise HTTPException(status_code=404, detail="Site not found")
+
+    return bootstrap_response(request, company)
+
+
+@app.get("/widget/dist/{filename}", include_in_schema=False)
+async def widget_asset(filename: str, request: Request):
+    """Content-hashed, pre-compressed widget bundle files (cached for a year)"""
+    asset = widget_bundle.find(filename)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return asset_response(request, asset)
 
 
 @app.post("/api/sms/webhook")
-async def sms_webhook(message: SMSMessage):
+async def sms_webhook(request: Request):
     """
     Handle incoming SMS messages (Twilio webhook)
-    TODO: Implement SMS handling with Assistants API
+    Routes by the number that was texted, queues the reply for a background
+    worker, and acknowledges right away with empty TwiML
     """
-    return {"status": "received", "message": "SMS handling coming soon"}
+    form = parse_form(await request.body())
+
+    if not valid_signature(str(request.url), form, request.headers.get("X-Twilio-Signature")):
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+    from_number = form.get("From")
+    to_number = form.get("To")
+    body = form.get("Body", "").strip()
+    if not from_number or not to_number:
+        raise HTTPException(status_code=400, detail="From and To are required")
+
+    site_id = await run_db(find_site_for_number, to_number)
+    if site_id is None:
+        print(f"⚠ SMS to unknown or SMS-disabled number {to_number}")
+    elif body:
+        inbound = InboundSMS(site_id, from_number, to_number, body, form.get("MessageSid"))
+        if run_mode() == "queue":
+            # Twilio retries a webhook it didn't hear back from - MessageSid dedupes those
+            await submit_job(
+                "sms",
+                site_id,
+                inbound._asdict(),
+                idempotency_key=f"sms:{inbound.message_sid}" if inbound.message_sid else None,
+                conversation_key=sms_session_id(site_id, from_number),
+            )
+        elif not sms_queue.enqueue(inbound):
+            print(f"⚠ SMS queue full, dropped message from {from_number} to {site_id}")
+
+    return Response(content=EMPTY_TWIML, media_type="application/xml")
 
 
-# Serve widget static files
-from fastapi.staticfiles import StaticFiles
-widget_path = Path(__file__).parent.parent / 'widget'
-app.mount("/widget", StaticFiles(directory=str(widget_path)), name="widget")
+# Serve widget static files (unversioned; embeds should prefer /widget/dist/* or the bootstrap script)
+app.mount("/widget", WidgetStaticFiles(directory=str(WIDGET_DIR)), name="widget")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+"""
+Prometheus metrics, exposed at /metrics
+Chat pipeline stage timings labelled by site_id and model, HTTP request and
+response sizes, and OpenAI error counts - enough to see which stage and
+which tenants a p99 comes from. Values are per process; with several uvicorn
+workers set PROMETHEUS_MULTIPROC_DIR to an empty directory to aggregate them
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from openai import OpenAIError
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+
+# With thousands of tenants per-site series get expensive - this folds them into "all"
+PER_SITE_LABELS = os.getenv("METRICS_PER_SITE", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_seconds", "Time spent in each stage of the chat path",
+    ["stage", "site_id", "model"], buckets=LATENCY_BUCKETS,
+)
+RUN_POLLS = Histogram(
+    "chatbot_run_polls", "Status checks per assistant run",
+    ["site_id", "model"], buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32),
+)
+OPENAI_ERRORS = Counter(
+    "chatbot_openai_errors_total", "Failed OpenAI API calls",
+    ["stage", "error", "site_id"],
+)
+FALLBACKS = Counter(
+    "chatbot_fallbacks_total", "Answers served from fallbacks instead of the assistant",
+    ["site_id", "reason", "kind"],
+)
+CIRCUIT_OPEN = Gauge(
+    "chatbot_openai_circuit_open", "1 while the OpenAI circuit breaker is open or half-open",
+    multiprocess_mode="max",
+)
+RATE_LIMITED = Counter(
+    "chatbot_rate_limited_total", "Chat requests rejected with 429",
+    ["scope", "site_id"],
+)
+TRANSCRIPT_DROPPED = Counter(
+    "chatbot_transcript_messages_dropped_total", "Transcript messages dropped because the write buffer was full",
+    ["site_id"],
+)
+HTTP_SECONDS = Histogram(
+    "chatbot_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUEST_BYTES = Histogram(
+    "chatbot_http_request_bytes", "HTTP request body size",
+    ["method", "route"], buckets=SIZE_BUCKETS,
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "chatbot_http_response_bytes", "HTTP response body size (streams included)",
+    ["method", "route"], buckets=SIZE_BUCKETS,
+)
+
+
+def site_label(site_id: Optional[str]) -> str:
+    if not site_id:
+        return "unknown"
+    return site_id if PER_SITE_LABELS else "all"
+
+
+def observe_stage(stage: str, seconds: float, site_id: Optional[str], model: Optional[str] = None):
+    STAGE_SECONDS.labels(stage, site_label(site_id), model or "default").observe(seconds)
+
+
+@contextmanager
+def track_stage(stage: str, site_id: Optional[str], model: Optional[str] = None):
+    """Time a block as one chat path stage; OpenAI exceptions raised in it are counted"""
+    start = time.perf_counter()
+    try:
+        yield
+    except OpenAIError as e:
+        OPENAI_ERRORS.labels(stage, type(e).__name__, site_label(site_id)).inc()
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start, site_id, model)
+
+
+def _route_label(scope: dict) -> str:
+    """The matched route's path template, so /api/config/{site} is one series"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and body sizes for every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        sizes = {"request": 0, "response": 0}
+        status = [500]
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            method, route = scope["method"], _route_label(scope)
+            HTTP_SECONDS.labels(method, route, str(status[0])).observe(time.perf_counter() - start)
+            HTTP_REQUEST_BYTES.labels(method, route).observe(sizes["request"])
+            HTTP_RESPONSE_BYTES.labels(method, route).observe(sizes["response"])
+
+
+def render_metrics():
+    """(body, content type) for the /metrics endpoint"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
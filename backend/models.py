@@ -3,10 +3,14 @@ Database models for multi-tenant chatbot system
 Uses SQLAlchemy with SQLite/PostgreSQL support
 """
 
-from sqlalchemy import create_engine, Column, String, Integer, Text, Boolean, DateTime, JSON
+from sqlalchemy import create_engine, event, inspect, select, text, update, Column, String, Integer, BigInteger, Float, Text, Boolean, DateTime, JSON, Index
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
+from typing import List, Optional
+import asyncio
+import hashlib
 import os
 
 Base = declarative_base()
@@ -45,43 +49,75 @@ class Company(Base):
 
     # Features
     sms_enabled = Column(Boolean, default=False)
-    sms_phone_number = Column(String(20))
+    sms_phone_number = Column(String(20), index=True)  # Inbound SMS are routed by this (E.164)
+
+    # Chat admission control (None = RATE_LIMIT_SITE_* defaults, per_minute 0 = unlimited)
+    rate_limit_per_minute = Column(Integer)
+    rate_limit_burst = Column(Integer)
 
     # Metadata
     active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    def to_dict(self):
-        """Convert to dictionary for API responses"""
-        return {
-            'id': self.id,
-            'site_id': self.site_id,
-            'name': self.name,
-            'domain': self.domain,
-            'description': self.description,
-            'branding': {
+    # Columns each to_dict() key needs (used to load only what's asked for)
+    DICT_COLUMNS = {
+        'id': ['id'],
+        'site_id': ['site_id'],
+        'name': ['name'],
+        'domain': ['domain'],
+        'description': ['description'],
+        'branding': ['primary_color', 'greeting'],
+        'ai': ['assistant_id', 'model', 'temperature', 'max_tokens', 'system_prompt'],
+        'contact_info': ['contact_info'],
+        'knowledge_base': ['knowledge_base'],
+        'faqs': ['faqs'],
+        'sms': ['sms_enabled', 'sms_phone_number'],
+        'rate_limits': ['rate_limit_per_minute', 'rate_limit_burst'],
+        'active': ['active'],
+        'created_at': ['created_at'],
+        'updated_at': ['updated_at'],
+    }
+
+    def to_dict(self, fields=None):
+        """
+        Convert to dictionary for API responses
+        fields: optional subset of keys; other columns aren't touched, so
+        deferred ones are never loaded
+        """
+        builders = {
+            'id': lambda: self.id,
+            'site_id': lambda: self.site_id,
+            'name': lambda: self.name,
+            'domain': lambda: self.domain,
+            'description': lambda: self.description,
+            'branding': lambda: {
                 'primary_color': self.primary_color,
                 'greeting': self.greeting
             },
-            'ai': {
+            'ai': lambda: {
                 'assistant_id': self.assistant_id,
                 'model': self.model,
                 'temperature': self.temperature,
                 'max_tokens': self.max_tokens,
                 'system_prompt': self.system_prompt
             },
-            'contact_info': self.contact_info,
-            'knowledge_base': self.knowledge_base,
-            'faqs': self.faqs,
-            'sms': {
+            'contact_info': lambda: self.contact_info,
+            'knowledge_base': lambda: self.knowledge_base,
+            'faqs': lambda: self.faqs,
+            'sms': lambda: {
                 'enabled': self.sms_enabled,
                 'phone_number': self.sms_phone_number
             },
-            'active': self.active,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'rate_limits': lambda: {
+                'per_minute': self.rate_limit_per_minute,
+                'burst': self.rate_limit_burst
+            },
+            'active': lambda: self.active,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'updated_at': lambda: self.updated_at.isoformat() if self.updated_at else None
         }
+        return {key: build() for key, build in builders.items() if fields is None or key in fields}
 
 
 class ChatSession(Base):
@@ -96,7 +132,135 @@ class ChatSession(Base):
     thread_id = Column(String(100))  # OpenAI thread ID
     message_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
-    last_activity = Column(DateTime, default=datetime.utcnow)
+    last_activity = Column(DateTime, default=datetime.utcnow, index=True)
+    # History compaction (see history.py)
+    history_tokens = Column(Integer, default=0)  # Estimated tokens a run would send
+    summary = Column(Text)  # Rolling summary of turns no longer sent
+    recent_turns = Column(JSON)  # [[question, answer], ...] still sent verbatim
+
+
+class AssistantSync(Base):
+    """
+    What was last pushed to each company's OpenAI assistant
+    Lets syncs skip assistants whose instructions/model haven't changed
+    """
+    __tablename__ = 'assistant_sync'
+
+    site_id = Column(String(50), primary_key=True)
+    assistant_id = Column(String(100))
+    content_hash = Column(String(64), nullable=False)  # sha256 of model + instructions
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    """
+    Durable background job (assistant runs for chat/SMS)
+    Workers claim queued jobs with a lease; a job whose lease runs out
+    (worker died) is picked up again
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (Index('ix_jobs_status_run_after', 'status', 'run_after'),)
+
+    id = Column(String(40), primary_key=True)  # e.g. 'job_3f2a...'
+    kind = Column(String(20), nullable=False)  # 'chat', 'sms'
+    site_id = Column(String(50), index=True)
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = Column(JSON)
+    result = Column(JSON)
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    idempotency_key = Column(String(200), unique=True)  # Repeat enqueues return the same job
+    conversation_key = Column(String(200), index=True)  # Jobs sharing a key run one at a time, in order
+    run_after = Column(DateTime, default=datetime.utcnow)
+    locked_until = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+
+class RateLimitBucket(Base):
+    """
+    Shared token bucket state (RATE_LIMIT_BACKEND=database)
+    Lets every process enforce one limit instead of one each
+    """
+    __tablename__ = 'rate_limit_buckets'
+
+    key = Column(String(200), primary_key=True)  # e.g. 'site:rx4miracles'
+    tokens = Column(Float, nullable=False)
+    updated = Column(Float, nullable=False, index=True)  # Unix time of the last refill
+
+
+class UsageRollup(Base):
+    """
+    Assistant usage per tenant, model and hour
+    Written in batches by usage.UsageTracker (counters are added to, never overwritten)
+    """
+    __tablename__ = 'usage_rollups'
+
+    site_id = Column(String(50), primary_key=True)
+    model = Column(String(50), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True, index=True)  # Start of the hour (UTC)
+    runs = Column(Integer, nullable=False, default=0)
+    timed_out = Column(Integer, nullable=False, default=0)  # Runs cancelled at the deadline
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    run_seconds = Column(Float, nullable=False, default=0.0)
+
+
+class ChatMessageLog(Base):
+    """
+    Transcript of chat/SMS conversations: one row per user or assistant message
+    Append-only; written in batches by transcripts.TranscriptLog
+    """
+    __tablename__ = 'chat_messages'
+    __table_args__ = (Index('ix_chat_messages_site_created', 'site_id', 'created_at'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    site_id = Column(String(50), nullable=False)
+    session_id = Column(String(100), nullable=False, index=True)
+    channel = Column(String(10), nullable=False, default='web')  # 'web', 'stream', 'sms'
+    role = Column(String(10), nullable=False)  # 'user', 'assistant'
+    content = Column(Text, nullable=False)
+    source = Column(String(20))  # Assistant messages: assistant, faq, cache, coalesced, fallback
+    latency_ms = Column(Integer)  # Assistant messages: question received until answered
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AnalyticsRollup(Base):
+    """
+    Chat analytics per tenant per hour and per day, built from chat_messages
+    by analytics.aggregate_messages (queries never touch the raw messages)
+    """
+    __tablename__ = 'analytics_rollups'
+
+    site_id = Column(String(50), primary_key=True)
+    period = Column(String(4), primary_key=True)  # 'hour' or 'day'
+    bucket_start = Column(DateTime, primary_key=True, index=True)  # UTC
+    conversations = Column(Integer, nullable=False, default=0)  # Sessions whose first message is in this bucket
+    questions = Column(Integer, nullable=False, default=0)
+    answers = Column(Integer, nullable=False, default=0)
+    sources = Column(JSON)  # {"assistant": n, "faq": n, ...}
+    latency_histogram = Column(JSON)  # Answer counts per analytics.LATENCY_BUCKETS_MS bucket
+    top_questions = Column(JSON)  # Daily rows: space-saving summary {question: [count, error, text]}
+
+
+class AnalyticsState(Base):
+    """Aggregation watermark: chat_messages up to last_message_id are in the rollups"""
+    __tablename__ = 'analytics_state'
+
+    key = Column(String(50), primary_key=True)
+    last_message_id = Column(BigInteger, nullable=False, default=0)
+    last_message_at = Column(DateTime)  # created_at of that message: rollups are complete up to here
+
+
+class SchemaInfo(Base):
+    """Fingerprint of the models the schema was last created from (see init_db)"""
+    __tablename__ = 'schema_info'
+
+    key = Column(String(50), primary_key=True)
+    version = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
 
 
 # Database connection
@@ -118,15 +282,294 @@ def get_database_url():
     return database_url
 
 
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return _is_sqlite(url) and (url.endswith(':memory:') or url.rstrip('/') in ('sqlite:', 'sqlite+aiosqlite:'))
+
+
+def engine_options(url: str) -> dict:
+    """
+    Pool settings for create_engine()/create_async_engine()
+    DB_POOL_SIZE / DB_MAX_OVERFLOW should keep (workers x pool) under the
+    Postgres connection limit; pre-ping and recycle drop connections the
+    server (or Heroku's router) has silently closed
+    """
+    options = {'echo': False}
+
+    if _is_sqlite(url):
+        # Sessions are handed between threadpool threads; wait on locks instead of failing
+        options['connect_args'] = {
+            'check_same_thread': False,
+            'timeout': _env_int('DB_SQLITE_BUSY_TIMEOUT', 30000) / 1000,
+        }
+    if _is_memory_sqlite(url):
+        return options
+
+    options.update(
+        pool_size=_env_int('DB_POOL_SIZE', 5),
+        max_overflow=_env_int('DB_MAX_OVERFLOW', 10),
+        pool_timeout=_env_int('DB_POOL_TIMEOUT', 30),
+        pool_recycle=_env_int('DB_POOL_RECYCLE', 1800),
+        pool_pre_ping=_env_bool('DB_POOL_PRE_PING', True),
+    )
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers run alongside a writer (no more "database is locked"
+    on every chat write); NORMAL sync is safe under WAL
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={_env_int('DB_SQLITE_BUSY_TIMEOUT', 30000)}")
+    cursor.execute("PRAGMA cache_size=-16000")  # 16 MB page cache
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
 # Create engine and session
-engine = create_engine(get_database_url(), echo=False)
+engine = create_engine(get_database_url(), **engine_options(get_database_url()))
+if _is_sqlite(get_database_url()) and not _is_memory_sqlite(get_database_url()):
+    event.listen(engine, 'connect', _set_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def get_async_database_url() -> Optional[str]:
+    """Async driver URL (asyncpg / aiosqlite) for the same database"""
+    url = os.getenv('DATABASE_ASYNC_URL')
+    if url:
+        return url
+
+    url = get_database_url()
+    for prefix, async_prefix in (('postgresql://', 'postgresql+asyncpg://'),
+                                 ('sqlite://', 'sqlite+aiosqlite://')):
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return None
+
+
+_async_sessionmaker = None
+_async_checked = False
+
+
+def get_async_sessionmaker():
+    """
+    Session factory on an async engine, created on first use
+    Only when DB_ASYNC is on and asyncpg/aiosqlite is installed; otherwise None
+    """
+    global _async_sessionmaker, _async_checked
+
+    if _async_checked:
+        return _async_sessionmaker
+    _async_checked = True
+
+    url = get_async_database_url()
+    if not _env_bool('DB_ASYNC', False) or url is None:
+        return None
+
+    try:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        options = engine_options(url)
+        if _is_sqlite(url):
+            # aiosqlite runs its own thread; check_same_thread doesn't apply
+            options['connect_args'].pop('check_same_thread', None)
+        async_engine = create_async_engine(url, **options)
+        if _is_sqlite(url) and not _is_memory_sqlite(url):
+            event.listen(async_engine.sync_engine, 'connect', _set_sqlite_pragmas)
+    except ImportError as e:
+        print(f"⚠ DB_ASYNC is set but the async driver isn't installed ({str(e)}), using the threadpool")
+        return None
+
+    _async_sessionmaker = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    print(f"✓ Async database engine: {url.split('://')[0]}")
+    return _async_sessionmaker
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Run fn(db, *args, **kwargs) without blocking the event loop
+    Uses the async engine when enabled (same sync code, run via run_sync),
+    otherwise a pooled sync session in a worker thread
+    """
+    async_sessionmaker = get_async_sessionmaker()
+    if async_sessionmaker is not None:
+        async with async_sessionmaker() as session:
+            return await session.run_sync(fn, *args, **kwargs)
+
+    def call():
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+
+    return await asyncio.to_thread(call)
+
+
+# Columns added to tables that already existed. create_all only creates missing
+# tables, so init_db adds these to older databases (ALTER TABLE ... ADD COLUMN)
+ADDED_COLUMNS = [
+    ('companies', 'rate_limit_per_minute'),
+    ('companies', 'rate_limit_burst'),
+    ('chat_sessions', 'history_tokens'),
+    ('chat_sessions', 'summary'),
+    ('chat_sessions', 'recent_turns'),
+]
+
+# Indexes added to tables that already existed (create_all skips those tables
+# entirely, so init_db creates these on older databases)
+ADDED_INDEXES = [
+    ('companies', 'ix_companies_sms_phone_number'),
+    ('chat_sessions', 'ix_chat_sessions_last_activity'),
+]
+
+
+def schema_version() -> str:
+    """Hash of every table, column and index the models declare; changes whenever they do"""
+    parts = []
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(table.name)
+        for column in table.columns:
+            parts.append(f"{column.name}:{column.type!r}:{column.nullable}:{column.primary_key}")
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            parts.append(f"{index.name}:{[column.name for column in index.columns]}:{index.unique}")
+    # So a new column migration is applied (and checked) even where the models already had it
+    parts.extend(f"added:{table_name}.{column_name}" for table_name, column_name in ADDED_COLUMNS)
+    parts.extend(f"added:{table_name}.{index_name}" for table_name, index_name in ADDED_INDEXES)
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:16]
+
+
+def _stored_schema_version() -> Optional[str]:
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(SchemaInfo.version).where(SchemaInfo.key == 'models')).scalar()
+    except SQLAlchemyError:
+        return None  # No schema_info table yet: a new database, or one from before it existed
+
+
+def _store_schema_version(version: str):
+    values = {'version': version, 'applied_at': datetime.utcnow()}
+    with engine.begin() as conn:
+        if conn.execute(update(SchemaInfo).where(SchemaInfo.key == 'models').values(**values)).rowcount:
+            return
+    try:
+        with engine.begin() as conn:
+            conn.execute(SchemaInfo.__table__.insert().values(key='models', **values))
+    except IntegrityError:
+        pass  # Another worker booting at the same time got there first
+
+
+def _column_names(table_name: str) -> set:
+    return {column['name'] for column in inspect(engine).get_columns(table_name)}
+
+
+def add_missing_columns() -> List[str]:
+    """Add any ADDED_COLUMNS an existing table lacks (idempotent); returns "table.column" for each added"""
+    added = []
+    for table_name, column_name in ADDED_COLUMNS:
+        if not inspect(engine).has_table(table_name) or column_name in _column_names(table_name):
+            continue
+        column = Base.metadata.tables[table_name].c[column_name]
+        ddl = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column.type.compile(dialect=engine.dialect)}"
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+        except SQLAlchemyError:
+            if column_name not in _column_names(table_name):
+                raise
+            continue  # Another worker booting at the same time added it
+        added.append(f"{table_name}.{column_name}")
+    return added
+
+
+def _index_names(table_name: str) -> set:
+    return {index['name'] for index in inspect(engine).get_indexes(table_name)}
+
+
+def add_missing_indexes() -> List[str]:
+    """Create any ADDED_INDEXES an existing table lacks (idempotent); returns the names created"""
+    added = []
+    for table_name, index_name in ADDED_INDEXES:
+        if not inspect(engine).has_table(table_name) or index_name in _index_names(table_name):
+            continue
+        index = next(index for index in Base.metadata.tables[table_name].indexes if index.name == index_name)
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except SQLAlchemyError:
+            if index_name not in _index_names(table_name):
+                raise
+            continue  # Another worker booting at the same time created it
+        added.append(index_name)
+    return added
+
+
+def missing_indexes() -> List[str]:
+    """Model indexes the live tables don't have"""
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        present = _index_names(table.name)
+        missing.extend(index.name for index in table.indexes if index.name not in present)
+    return missing
+
+
+def missing_columns() -> List[str]:
+    """Model columns the live tables don't have ("table.column")"""
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        present = _column_names(table.name)
+        missing.extend(f"{table.name}.{column.name}" for column in table.columns if column.name not in present)
+    return missing
+
+
 def init_db():
-    """Initialize database tables"""
+    """
+    Initialize database tables
+    DB_SCHEMA_MODE: "auto" (default) skips create_all when the stored schema
+    version matches the models - one SELECT per boot instead of a catalog
+    check per table; "create" always runs it; "skip" trusts the schema
+    (a release step ran init_db already). The version is only stored once
+    the live tables have every model column and index; otherwise this raises
+    """
+    mode = os.getenv('DB_SCHEMA_MODE', 'auto').strip().lower()
+    if mode == 'skip':
+        print("✓ Database schema check skipped (DB_SCHEMA_MODE=skip)")
+        return
+
+    version = schema_version()
+    if mode != 'create' and _stored_schema_version() == version:
+        print(f"✓ Database schema current ({version})")
+        return
+
     Base.metadata.create_all(bind=engine)
-    print(f"✓ Database initialized: {get_database_url()}")
+    for column in add_missing_columns():
+        print(f"✓ Added column {column}")
+    for index in add_missing_indexes():
+        print(f"✓ Added index {index}")
+    # Only record the version once the live tables really match the models
+    missing = missing_columns()
+    if missing:
+        raise RuntimeError(f"Database schema is missing columns the models need: {', '.join(missing)} "
+                           "(add them to models.ADDED_COLUMNS, or ALTER the tables)")
+    missing = missing_indexes()
+    if missing:
+        raise RuntimeError(f"Database schema is missing indexes the models need: {', '.join(missing)} "
+                           "(add them to models.ADDED_INDEXES, or CREATE INDEX them)")
+    _store_schema_version(version)
+    print(f"✓ Database initialized: {get_database_url()} (schema {version})")
 
 
 def get_db():
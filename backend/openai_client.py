@@ -0,0 +1,77 @@
+"""
+Shared async OpenAI client for the chat pipeline
+One pooled HTTP client per worker process, plus per-tenant concurrency limits
+so a single busy site can't starve everyone else's assistant runs
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+_client: Optional[AsyncOpenAI] = None
+_tenant_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment"""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Get the process-wide AsyncOpenAI client
+    Created on first use so .env has been loaded and we're inside the event loop
+    """
+    global _client
+    if _client is None:
+        # Bounded connection pool shared by every tenant in this worker
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=_env_int("OPENAI_MAX_CONNECTIONS", 100),
+                max_keepalive_connections=_env_int("OPENAI_MAX_KEEPALIVE", 20),
+            ),
+            timeout=httpx.Timeout(_env_float("OPENAI_TIMEOUT", 60.0), connect=5.0),
+        )
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,  # Override for local stub servers
+            http_client=http_client,
+        )
+    return _client
+
+
+async def close_async_client():
+    """Close the pooled HTTP connections (call on shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _tenant_semaphore(site_id: str) -> asyncio.Semaphore:
+    semaphore = _tenant_semaphores.get(site_id)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_env_int("TENANT_MAX_CONCURRENCY", 10))
+        _tenant_semaphores[site_id] = semaphore
+    return semaphore
+
+
+@asynccontextmanager
+async def tenant_slot(site_id: str):
+    """
+    Limit in-flight assistant runs per tenant
+    Extra requests for the same site wait here instead of piling onto OpenAI
+    """
+    async with _tenant_semaphore(site_id):
+        yield
@@ -0,0 +1,168 @@
+"""
+Admission control for the chat endpoints
+Token buckets per site and per client IP within a site, checked before any
+session lookup or OpenAI work, so one abusive embed gets cheap 429s instead
+of using up the OpenAI rate limits every tenant shares. Buckets live in
+memory (per process) by default; RATE_LIMIT_BACKEND=database keeps them in
+the rate_limit_buckets table so all processes enforce one shared limit
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import RateLimitBucket, run_db
+from token_bucket import TokenBucket
+from metrics import RATE_LIMITED, site_label
+
+# Defaults; companies can override the site limit (rate_limit_per_minute / rate_limit_burst)
+SITE_PER_MINUTE = float(os.getenv("RATE_LIMIT_SITE_PER_MINUTE", "600"))
+SITE_BURST = float(os.getenv("RATE_LIMIT_SITE_BURST", "100"))
+CLIENT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CLIENT_PER_MINUTE", "30"))
+CLIENT_BURST = float(os.getenv("RATE_LIMIT_CLIENT_BURST", "10"))
+MAX_LOCAL_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+# Proxies in front of us that append to X-Forwarded-For (Heroku's router = 1)
+TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1"))
+STALE_BUCKET_SECONDS = 3600  # Idle DB buckets (long since refilled) are purged after this
+
+
+class Limit(NamedTuple):
+    rate: float  # Tokens per second
+    burst: float
+
+
+def _limit(per_minute: Optional[float], burst: Optional[float]) -> Optional[Limit]:
+    """None means unlimited"""
+    if not per_minute:
+        return None
+    return Limit(per_minute / 60.0, max(1.0, burst or 1.0))
+
+
+class MemoryBackend:
+    """Buckets in this process, least recently used evicted past max_keys"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    async def take(self, key: str, limit: Limit) -> float:
+        """Take one token; returns 0 if allowed, else seconds until one is available"""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.rate != limit.rate or bucket.capacity != limit.burst:
+            bucket = self._buckets[key] = TokenBucket(limit.rate, limit.burst)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        if bucket.try_acquire():
+            return 0.0
+        return bucket.wait_time()
+
+
+def _take_from_db(db: Session, key: str, limit: Limit) -> float:
+    """Refill and take from a shared bucket row (locked on Postgres)"""
+    now = time.time()
+    query = db.query(RateLimitBucket).filter(RateLimitBucket.key == key).with_for_update()
+    row = query.first()
+    if row is None:
+        db.add(RateLimitBucket(key=key, tokens=limit.burst, updated=now))
+        try:
+            db.flush()
+        except IntegrityError:
+            # Another process created it first
+            db.rollback()
+        row = query.one()
+
+    tokens = min(limit.burst, row.tokens + (now - row.updated) * limit.rate)
+    allowed = tokens >= 1
+    row.tokens = tokens - 1 if allowed else tokens
+    row.updated = now
+    db.commit()
+    return 0.0 if allowed else (1 - tokens) / limit.rate
+
+
+def purge_stale_buckets(db: Session) -> int:
+    deleted = db.query(RateLimitBucket).filter(
+        RateLimitBucket.updated < time.time() - STALE_BUCKET_SECONDS
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+class DatabaseBackend:
+    """Buckets shared by every process through the rate_limit_buckets table"""
+
+    def __init__(self, purge_every: int = 1000):
+        self.purge_every = purge_every
+        self._takes = 0
+
+    async def take(self, key: str, limit: Limit) -> float:
+        self._takes += 1
+        if self._takes % self.purge_every == 0:
+            await run_db(purge_stale_buckets)
+        return await run_db(_take_from_db, key, limit)
+
+
+def default_backend():
+    if os.getenv("RATE_LIMIT_BACKEND", "memory") == "database":
+        return DatabaseBackend()
+    return MemoryBackend(MAX_LOCAL_BUCKETS)
+
+
+def client_ip(request: Request) -> str:
+    """
+    The caller's IP: the X-Forwarded-For entry added by our own proxy
+    (earlier entries are client-supplied and can be forged)
+    """
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and TRUSTED_PROXIES > 0:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if hops:
+            return hops[max(0, len(hops) - TRUSTED_PROXIES)]
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def set_backend(self, backend):
+        self.backend = backend
+
+    async def check_client(self, site: str, ip: str):
+        """
+        Per-IP limit within a site; raises a 429 HTTPException when exceeded
+        Call with a known tenant's site_id, never the raw request value (it
+        becomes a bucket key and a metric label)
+        """
+        limit = _limit(CLIENT_PER_MINUTE, CLIENT_BURST)
+        if limit is not None:
+            await self._take(f"client:{site}:{ip}", limit, "client", site)
+
+    async def check_site(self, company):
+        """The company's own limit (or the default); raises a 429 HTTPException when exceeded"""
+        per_minute = company.rate_limit_per_minute
+        if per_minute is None:
+            limit = _limit(SITE_PER_MINUTE, SITE_BURST)
+        else:
+            limit = _limit(per_minute, company.rate_limit_burst or max(1, per_minute // 6))
+        if limit is not None:
+            await self._take(f"site:{company.site_id}", limit, "site", company.site_id)
+
+    async def _take(self, key: str, limit: Limit, scope: str, site: str):
+        retry_after = await self.backend.take(key, limit)
+        if retry_after > 0:
+            RATE_LIMITED.labels(scope, site_label(site)).inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Too many messages, please wait a moment and try again",
+                headers={"Retry-After": str(max(1, round(retry_after)))},
+            )
+
+
+rate_limiter = RateLimiter(default_backend())
@@ -0,0 +1,328 @@
+"""
+Local retrieval over each company's knowledge base
+Splits knowledge_base markdown into heading-based chunks, indexes them with
+BM25 (inverted index persisted to disk), and picks the top-k chunks for a
+question so runs only carry the relevant excerpts instead of the whole document
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from models import Company, SessionLocal
+from faq_matcher import tokenize
+
+INDEX_DIR = Path(os.getenv("RETRIEVAL_INDEX_DIR", str(Path(__file__).parent / "indexes")))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+MAX_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1500"))
+
+# Bump when the on-disk format or chunking changes
+INDEX_FORMAT = 2
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.*\S)\s*$')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+class Chunk(NamedTuple):
+    heading: str  # Full heading path, e.g. "Pricing > Family plans"
+    text: str
+
+
+def chunk_markdown(markdown: str, max_chars: int = MAX_CHUNK_CHARS) -> List[Chunk]:
+    """
+    Split markdown into one chunk per heading section
+    Sections longer than max_chars are split further on paragraph breaks
+    """
+    chunks: List[Chunk] = []
+    headings: List[tuple] = []  # Stack of (level, title)
+    lines: List[str] = []
+
+    def close_section():
+        body = "\n".join(lines).strip()
+        lines.clear()
+        if not body:
+            return
+        heading = " > ".join(title for _, title in headings)
+        for piece in _split_paragraphs(body, max_chars):
+            chunks.append(Chunk(heading, piece))
+
+    for line in (markdown or "").splitlines():
+        match = _HEADING.match(line)
+        if match:
+            close_section()
+            level = len(match.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, match.group(2)))
+        else:
+            lines.append(line)
+    close_section()
+
+    return chunks
+
+
+def _split_paragraphs(body: str, max_chars: int) -> List[str]:
+    if len(body) <= max_chars:
+        return [body]
+
+    pieces, current = [], ""
+    for paragraph in re.split(r'\n\s*\n', body):
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            pieces.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def content_hash(text: str) -> str:
+    """Stable hash used to detect changed content"""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def chunk_hash(chunk: Chunk) -> str:
+    return content_hash(f"{chunk.heading}\0{chunk.text}")[:16]
+
+
+class RetrievalIndex:
+    """
+    BM25 inverted index over a tenant's knowledge chunks
+    Chunks are keyed by content hash, so update() only re-tokenizes sections
+    that actually changed and drops postings for removed ones
+    """
+
+    def __init__(self, chunks: List[Chunk] = (), version: Optional[str] = None):
+        self.version = version
+        self.content_hash: Optional[str] = None  # Hash of the whole knowledge base
+        self.chunks: Dict[str, Chunk] = {}  # chunk hash -> chunk, in document order
+        self.doc_lengths: Dict[str, int] = {}
+        # term -> {chunk hash: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.avg_length = 0.0
+        self.update(chunks)
+
+    def update(self, chunks: List[Chunk]) -> Tuple[int, int]:
+        """
+        Make the index match `chunks`, touching only changed sections
+        Returns (added, removed) chunk counts
+        """
+        new_chunks = {chunk_hash(chunk): chunk for chunk in chunks}
+        removed = [h for h in self.chunks if h not in new_chunks]
+        added = [h for h in new_chunks if h not in self.chunks]
+
+        for h in removed:
+            self.doc_lengths.pop(h)
+            for term in set(tokenize(self._document(self.chunks[h]))):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(h, None)
+                    if not posting:
+                        del self.postings[term]
+
+        for h in added:
+            tokens = tokenize(self._document(new_chunks[h]))
+            self.doc_lengths[h] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, {})[h] = tf
+
+        self.chunks = new_chunks
+        self.avg_length = sum(self.doc_lengths.values()) / len(new_chunks) if new_chunks else 0.0
+        return len(added), len(removed)
+
+    def copy(self) -> "RetrievalIndex":
+        """An independent copy to update while readers keep searching this one"""
+        index = RetrievalIndex(version=self.version)
+        index.content_hash = self.content_hash
+        index.chunks = dict(self.chunks)
+        index.doc_lengths = dict(self.doc_lengths)
+        index.postings = {term: dict(posting) for term, posting in self.postings.items()}
+        index.avg_length = self.avg_length
+        return index
+
+    @staticmethod
+    def _document(chunk: Chunk) -> str:
+        return f"{chunk.heading} {chunk.text}"
+
+    def first_chunk(self) -> Optional[Chunk]:
+        return next(iter(self.chunks.values()), None)
+
+    def search(self, query: str, k: int = TOP_K) -> List[Chunk]:
+        """Top-k chunks for a query, best first"""
+        count = len(self.chunks)
+        scores: Dict[str, float] = {}
+
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for h, tf in posting.items():
+                length_norm = K1 * (1 - B + B * self.doc_lengths[h] / self.avg_length)
+                scores[h] = scores.get(h, 0.0) + idf * tf * (K1 + 1) / (tf + length_norm)
+
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [self.chunks[h] for h in best]
+
+    def save(self, path: Path):
+        """Persist the index (chunks + postings) as JSON"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "format": INDEX_FORMAT,
+                "version": self.version,
+                "content_hash": self.content_hash,
+                "chunks": [[h, chunk.heading, chunk.text] for h, chunk in self.chunks.items()],
+                "doc_lengths": self.doc_lengths,
+                "postings": self.postings,
+            }, f)
+        # Atomic swap so concurrent workers never read a half-written file
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["RetrievalIndex"]:
+        """Load a persisted index, or None if missing/incompatible"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("format") != INDEX_FORMAT:
+            return None
+
+        index = cls()
+        index.version = data["version"]
+        index.content_hash = data["content_hash"]
+        index.chunks = {h: Chunk(heading, text) for h, heading, text in data["chunks"]}
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = data["postings"]
+        index.avg_length = sum(index.doc_lengths.values()) / len(index.chunks) if index.chunks else 0.0
+        return index
+
+
+def format_excerpts(chunks: List[Chunk]) -> str:
+    """Render retrieved chunks as additional run instructions"""
+    sections = "\n\n".join(
+        f"## {chunk.heading}\n{chunk.text}" if chunk.heading else chunk.text
+        for chunk in chunks
+    )
+    return f"""RELEVANT KNOWLEDGE BASE EXCERPTS:
+{sections}
+
+Use the excerpts above to answer accurately. If they don't cover the question, say so rather than guessing."""
+
+
+def _version_key(updated_at: Optional[datetime]) -> Optional[str]:
+    return updated_at.isoformat() if updated_at else None
+
+
+class RetrievalIndexStore:
+    """
+    Per-tenant indexes: in memory, then on disk, then refreshed from the DB
+    An index is current when its version matches the company's updated_at;
+    a stale one is updated incrementally (unchanged sections are kept)
+    """
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = index_dir
+        self._indexes: Dict[str, RetrievalIndex] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, site_id: str) -> Path:
+        return self.index_dir / f"{site_id}.json"
+
+    def current(self, site_id: str, updated_at: Optional[datetime]) -> Optional[RetrievalIndex]:
+        """The in-memory index if it's up to date, else None (never touches disk or the DB)"""
+        index = self._indexes.get(site_id)
+        if index is not None and index.version == _version_key(updated_at):
+            return index
+        return None
+
+    def get(self, site_id: str, updated_at: Optional[datetime]) -> RetrievalIndex:
+        """Up-to-date index, loading or rebuilding it if needed (blocking: call from a thread)"""
+        version = _version_key(updated_at)
+
+        index = self.current(site_id, updated_at)
+        if index is not None:
+            return index
+
+        with self._lock:
+            index = self._indexes.get(site_id)
+            if index is None or index.version != version:
+                index = RetrievalIndex.load(self._path(site_id)) or index
+            if index is None or index.version != version:
+                index = self.refresh(site_id, version, index)
+            self._indexes[site_id] = index
+            return index
+
+    def refresh(self, site_id: str, version: Optional[str],
+                index: Optional[RetrievalIndex] = None) -> RetrievalIndex:
+        """
+        An up-to-date index for the knowledge base in the database
+        `index` itself is never modified - searches may be reading it - the
+        changes go into a copy that the caller swaps in
+        """
+        db = SessionLocal()
+        try:
+            row = db.query(Company.knowledge_base).filter(Company.site_id == site_id).first()
+        finally:
+            db.close()
+
+        knowledge = row[0] if row else ""
+        knowledge_hash = content_hash(knowledge)
+        index = index.copy() if index is not None else RetrievalIndex()
+
+        # Other fields changed (e.g. branding) - the index itself is still good
+        if index.content_hash != knowledge_hash:
+            added, removed = index.update(chunk_markdown(knowledge))
+            index.content_hash = knowledge_hash
+            print(f"✓ Re-indexed {site_id}: {added} sections added, {removed} removed, "
+                  f"{len(index.chunks) - added} unchanged")
+
+        index.version = version
+        index.save(self._path(site_id))
+        return index
+
+    def invalidate(self, site_id: str):
+        self._indexes.pop(site_id, None)
+
+
+index_store = RetrievalIndexStore(INDEX_DIR)
+
+
+def knowledge_mode() -> str:
+    """'retrieval' (default) injects top-k chunks per run; 'embedded' keeps the old full-instructions behaviour"""
+    return os.getenv("KNOWLEDGE_MODE", "retrieval")
+
+
+async def retrieve_instructions(site_id: str, updated_at: Optional[datetime], question: str) -> Optional[str]:
+    """
+    Additional run instructions with the most relevant knowledge excerpts
+    A missing or stale index is loaded/rebuilt in a worker thread (admin
+    writes normally rebuild it ahead of time, see assistant_sync.sync_company)
+    """
+    if knowledge_mode() != "retrieval":
+        return None
+
+    index = index_store.current(site_id, updated_at)
+    if index is None:
+        index = await asyncio.to_thread(index_store.get, site_id, updated_at)
+    if not index.chunks:
+        return None
+
+    # Nothing matched (e.g. "hi") - fall back to the opening section
+    chunks = index.search(question) or [index.first_chunk()]
+    return format_excerpts(chunks)
@@ -0,0 +1,166 @@
+"""
+Adaptive waiting for assistant runs
+Replaces the SDK's fixed-interval create_and_poll: the first status check is
+scheduled from how long runs for the same tenant/model usually take, checks
+are dense around the expected finish and back off past the slow tail, and a
+hard deadline cancels runs that take too long
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE_SECONDS", "25"))  # Under Heroku's 30s router timeout
+RUN_POLL_MIN_INTERVAL = float(os.getenv("RUN_POLL_MIN_INTERVAL", "0.1"))
+RUN_POLL_MAX_INTERVAL = float(os.getenv("RUN_POLL_MAX_INTERVAL", "2.0"))
+HISTORY_SIZE = 200  # Recent run durations kept per tenant/model
+MIN_SAMPLES = 5  # Fewer than this and the model-wide history is used instead
+DENSE_CHECKS = 4  # Checks spread between the typical fast and slow finish
+CANCEL_SETTLE_SECONDS = 5.0  # How long to wait for a cancelled run to stop
+
+ACTIVE = ("queued", "in_progress", "cancelling")
+
+
+class PollResult(NamedTuple):
+    run: Any  # Last Run object seen
+    polls: int  # Status checks made after creating the run
+    seconds: float  # Time from creation until the final status was seen
+    timed_out: bool  # Hit the deadline and was cancelled
+
+
+def _percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class RunTimings:
+    """Per tenant/model run durations and poll counters"""
+
+    def __init__(self, history_size: int):
+        self.history_size = history_size
+        self._durations: Dict[Tuple[str, str], deque] = {}
+        self._by_model: Dict[str, deque] = {}
+        self._counters: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def expected(self, site_id: str, model: str) -> Optional[Tuple[float, float]]:
+        """(p10, p90) run duration for this tenant/model, or None with too little history"""
+        with self._lock:
+            samples = self._durations.get((site_id, model))
+            if samples is None or len(samples) < MIN_SAMPLES:
+                samples = self._by_model.get(model)
+            if samples is None or len(samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        return _percentile(ordered, 0.1), _percentile(ordered, 0.9)
+
+    def record(self, site_id: str, model: str, result: PollResult, duration: Optional[float]):
+        """Count one finished wait; `duration` (completed runs only) feeds the percentiles"""
+        key = (site_id, model)
+        with self._lock:
+            if duration is not None:
+                self._durations.setdefault(key, deque(maxlen=self.history_size)).append(duration)
+                self._by_model.setdefault(model, deque(maxlen=self.history_size)).append(duration)
+            counters = self._counters.setdefault(key, {"runs": 0, "polls": 0, "seconds": 0.0, "timed_out": 0})
+            counters["runs"] += 1
+            counters["polls"] += result.polls
+            counters["seconds"] += result.seconds
+            counters["timed_out"] += int(result.timed_out)
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = {key: (dict(counters), sorted(self._durations.get(key, ())))
+                        for key, counters in self._counters.items()}
+
+        tenants = {}
+        for (site_id, model), (counters, ordered) in snapshot.items():
+            runs = counters["runs"]
+            tenants[f"{site_id}/{model}"] = {
+                "runs": runs,
+                "timed_out": counters["timed_out"],
+                "avg_polls": round(counters["polls"] / runs, 2),
+                "avg_seconds": round(counters["seconds"] / runs, 3),
+                "p50_seconds": round(_percentile(ordered, 0.5), 3) if ordered else None,
+                "p90_seconds": round(_percentile(ordered, 0.9), 3) if ordered else None,
+            }
+        runs = sum(t["runs"] for t in tenants.values())
+        polls = sum(counters["polls"] for counters, _ in snapshot.values())
+        return {
+            "runs": runs,
+            "polls": polls,
+            "avg_polls": round(polls / runs, 2) if runs else 0.0,
+            "timed_out": sum(t["timed_out"] for t in tenants.values()),
+            "by_tenant": tenants,
+        }
+
+
+run_timings = RunTimings(history_size=HISTORY_SIZE)
+
+
+def _next_interval(elapsed: float, previous: Optional[float], expected: Optional[Tuple[float, float]]) -> float:
+    """Seconds to sleep before the next status check"""
+    if expected is None:
+        # No history yet: start quick and back off
+        interval = RUN_POLL_MIN_INTERVAL * 2 if previous is None else previous * 1.5
+    else:
+        fast, slow = expected
+        if elapsed < fast:
+            # Nothing to gain by checking before the quickest typical runs finish
+            interval = fast - elapsed
+        elif elapsed < slow:
+            interval = (slow - fast) / DENSE_CHECKS
+        else:
+            # Past the slow tail: back off
+            interval = (previous or RUN_POLL_MIN_INTERVAL) * 1.5
+    return min(max(interval, RUN_POLL_MIN_INTERVAL), RUN_POLL_MAX_INTERVAL)
+
+
+async def _cancel(client, thread_id: str, run_id: str):
+    """Cancel a run and wait (briefly) until the thread is free for new messages"""
+    try:
+        run = await client.beta.threads.runs.cancel(run_id, thread_id=thread_id)
+        waited = 0.0
+        while run.status in ACTIVE and waited < CANCEL_SETTLE_SECONDS:
+            await asyncio.sleep(0.5)
+            waited += 0.5
+            run = await client.beta.threads.runs.retrieve(run_id, thread_id=thread_id)
+        return run
+    except Exception as e:
+        # The run may have finished in the meantime; it expires server-side regardless
+        print(f"⚠ Cancelling run {run_id} failed: {str(e)}")
+        return None
+
+
+async def wait_for_run(client, run, site_id: str, model: Optional[str],
+                       deadline: float = RUN_DEADLINE) -> PollResult:
+    """
+    Poll a newly created run until it leaves queued/in_progress
+    Past `deadline` seconds the run is cancelled and returned with timed_out=True
+    """
+    loop = asyncio.get_running_loop()
+    model = model or "default"
+    expected = run_timings.expected(site_id, model)
+    started = loop.time()
+    polls, interval, last_pending = 0, None, 0.0
+
+    while run.status in ("queued", "in_progress"):
+        elapsed = loop.time() - started
+        if elapsed >= deadline:
+            cancelled = await _cancel(client, run.thread_id, run.id)
+            result = PollResult(cancelled or run, polls, loop.time() - started, True)
+            run_timings.record(site_id, model, result, None)
+            print(f"⚠ Run {run.id} for {site_id} hit the {deadline:g}s deadline and was cancelled")
+            return result
+
+        last_pending = elapsed
+        interval = _next_interval(elapsed, interval, expected)
+        await asyncio.sleep(min(interval, deadline - elapsed))
+        run = await client.beta.threads.runs.retrieve(run.id, thread_id=run.thread_id)
+        polls += 1
+
+    seen = loop.time() - started
+    result = PollResult(run, polls, seen, False)
+    # It finished somewhere between the last pending check and this one
+    run_timings.record(site_id, model, result, (last_pending + seen) / 2 if run.status == "completed" else None)
+    return result
@@ -6,6 +6,7 @@ Run this once to migrate from YAML to database
 import yaml
 from pathlib import Path
 from models import Company, init_db, SessionLocal
+from company_io import company_fields_from_yaml
 import os
 from dotenv import load_dotenv
 
@@ -48,33 +49,9 @@ def seed_company(db, site_id: str, assistant_id: str = None):
     # Create company record
     company = Company(
         site_id=site_id,
-        name=config['site']['name'],
-        domain=config['site'].get('domain', ''),
-        description=config['site'].get('description', ''),
-
-        # Branding
-        primary_color=config['branding'].get('primary_color', '#0066cc'),
-        greeting=config['branding'].get('greeting', 'Hello! How can I help you today?'),
-
-        # AI config
         assistant_id=assistant_id,
-        model=config['ai'].get('model', 'gpt-4o-mini'),
-        temperature=str(config['ai'].get('temperature', 0.4)),
-        max_tokens=config['ai'].get('max_tokens', 500),
-        system_prompt=config['ai'].get('system_prompt', ''),
-
-        # Contact info
-        contact_info=config.get('business', {}).get('contact', {}),
-
-        # Knowledge and FAQs
-        knowledge_base=knowledge,
-        faqs=config.get('faqs', []),
-
-        # SMS config
-        sms_enabled=config.get('sms', {}).get('enabled', False),
-        sms_phone_number=config.get('sms', {}).get('phone_number', ''),
-
-        active=True
+        active=True,
+        **company_fields_from_yaml(config, knowledge)
     )
 
     db.add(company)
@@ -0,0 +1,161 @@
+"""
+Chat session tracking
+Maps widget session_ids to OpenAI threads so follow-up messages keep context,
+and reaps threads that have gone idle
+"""
+
+import asyncio
+import os
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from openai import NotFoundError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from history import HistoryContext, add_exchange, history_context
+from models import ChatSession, SessionLocal
+from openai_client import get_async_client
+
+
+def get_session_history(db: Session, session_id: Optional[str],
+                        site_id: str) -> Tuple[Optional[str], Optional[HistoryContext]]:
+    """(thread_id, compacted history or None) for a session on this site"""
+    if not session_id:
+        return None, None
+
+    chat_session = db.query(ChatSession).filter(
+        ChatSession.session_id == session_id,
+        ChatSession.site_id == site_id
+    ).first()
+
+    if chat_session is None:
+        return None, None
+    return chat_session.thread_id, history_context(chat_session)
+
+
+async def add_user_message(thread_id: Optional[str], content: str) -> str:
+    """
+    Append the user's message to an existing thread, or start a new one
+    Returns the thread_id the message ended up on
+    """
+    client = get_async_client()
+
+    if thread_id:
+        try:
+            await client.beta.threads.messages.create(
+                thread_id=thread_id,
+                role="user",
+                content=content
+            )
+            return thread_id
+        except NotFoundError:
+            # Thread was deleted on OpenAI's side - start over
+            print(f"⚠ Thread {thread_id} not found, creating a new one")
+
+    thread = await client.beta.threads.create(
+        messages=[{
+            "role": "user",
+            "content": content
+        }]
+    )
+    return thread.id
+
+
+def record_turn(db: Session, session_id: str, site_id: str, thread_id: str,
+                question: Optional[str] = None, answer: Optional[str] = None) -> str:
+    """
+    Create or update the session row after a completed turn (and its compacted history)
+    Returns the session_id it was recorded under - a new one if session_id belongs to another site
+    """
+    chat_session = db.query(ChatSession).filter(
+        ChatSession.session_id == session_id,
+        ChatSession.site_id == site_id
+    ).first()
+
+    if chat_session is None:
+        if db.query(ChatSession.id).filter(ChatSession.session_id == session_id).first() is not None:
+            # Another site's session: never touch its thread or history, start a new one here
+            print(f"⚠ Session {session_id} belongs to another site, starting a new session for {site_id}")
+            session_id = f"session_{uuid.uuid4().hex}"
+        chat_session = ChatSession(session_id=session_id, site_id=site_id, message_count=0)
+        db.add(chat_session)
+
+    if chat_session.thread_id and chat_session.thread_id != thread_id:
+        # The old thread is gone (see add_user_message) - so is its history
+        chat_session.summary, chat_session.recent_turns, chat_session.history_tokens = None, [], 0
+
+    chat_session.thread_id = thread_id
+    add_exchange(chat_session, question, answer)
+    chat_session.message_count = (chat_session.message_count or 0) + 1
+    chat_session.last_activity = datetime.utcnow()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent first turn inserted the row first - apply this turn to it
+        db.rollback()
+        return record_turn(db, session_id, site_id, thread_id, question, answer)
+    return session_id
+
+
+async def reap_idle_sessions(ttl_seconds: int, batch_size: int = 50) -> int:
+    """
+    Delete threads (and session rows) idle for longer than ttl_seconds
+    Works in batches: thread deletes run concurrently, rows go in one DELETE
+    Returns the number of sessions reaped
+    """
+    client = get_async_client()
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl_seconds)
+    reaped = 0
+
+    while True:
+        db = SessionLocal()
+        try:
+            batch = db.query(ChatSession.id, ChatSession.thread_id).filter(
+                ChatSession.last_activity < cutoff
+            ).order_by(ChatSession.last_activity).limit(batch_size).all()
+
+            if not batch:
+                break
+
+            thread_ids = [thread_id for _, thread_id in batch if thread_id]
+            results = await asyncio.gather(
+                *(client.beta.threads.delete(thread_id) for thread_id in thread_ids),
+                return_exceptions=True
+            )
+            for thread_id, result in zip(thread_ids, results):
+                # Already-gone threads are fine; anything else is worth a log line
+                if isinstance(result, Exception) and not isinstance(result, NotFoundError):
+                    print(f"⚠ Failed to delete thread {thread_id}: {result}")
+
+            db.query(ChatSession).filter(
+                ChatSession.id.in_([row_id for row_id, _ in batch])
+            ).delete(synchronize_session=False)
+            db.commit()
+            reaped += len(batch)
+
+            if len(batch) < batch_size:
+                break
+        finally:
+            db.close()
+
+    return reaped
+
+
+async def session_reaper_loop():
+    """Background task: periodically reap idle sessions"""
+    ttl_seconds = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    interval = int(os.getenv("SESSION_REAP_INTERVAL", "300"))
+    batch_size = int(os.getenv("SESSION_REAP_BATCH", "50"))
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            reaped = await reap_idle_sessions(ttl_seconds, batch_size)
+            if reaped:
+                print(f"✓ Reaped {reaped} idle chat sessions")
+        except Exception as e:
+            print(f"ERROR: Session reaper failed: {str(e)}")
+            print(traceback.format_exc())
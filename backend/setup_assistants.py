@@ -8,6 +8,8 @@ from pathlib import Path
 from dotenv import load_dotenv
 from openai import OpenAI
 from models import Company, init_db, SessionLocal
+from retrieval import knowledge_mode
+from assistant_sync import build_instructions, pending_hash, record_sync, assistant_hash
 
 # Load environment variables
 env_path = Path(__file__).parent.parent / '.env'
@@ -26,16 +28,10 @@ def create_assistant_for_company(company: Company) -> str:
     print(f"Creating assistant for: {company.name}")
     print(f"{'='*60}")
 
-    # Combine system prompt with knowledge base
-    full_instructions = f"""{company.system_prompt}
-
-KNOWLEDGE BASE:
-{company.knowledge_base}
-
-Use the knowledge base above to answer questions accurately. Provide responses in a natural, conversational tone without excessive markdown formatting (avoid bullet points and bold text unless specifically needed for clarity)."""
+    full_instructions = build_instructions(company)
 
     # Create assistant
-    print("Creating assistant with embedded knowledge...")
+    print(f"Creating assistant ({knowledge_mode()} knowledge)...")
     assistant = client.beta.assistants.create(
         name=f"{company.name} Support Assistant",
         instructions=full_instructions,
@@ -58,13 +54,7 @@ def update_assistant(company: Company) -> str:
     print(f"Updating assistant for: {company.name}")
     print(f"{'='*60}")
 
-    # Combine system prompt with knowledge base
-    full_instructions = f"""{company.system_prompt}
-
-KNOWLEDGE BASE:
-{company.knowledge_base}
-
-Use the knowledge base above to answer questions accurately. Provide responses in a natural, conversational tone without excessive markdown formatting (avoid bullet points and bold text unless specifically needed for clarity)."""
+    full_instructions = build_instructions(company)
 
     # Update assistant
     print(f"Updating assistant {company.assistant_id}...")
@@ -113,6 +103,7 @@ def setup_all_assistants():
 
             # Save assistant_id to database
             company.assistant_id = assistant_id
+            record_sync(db, company, assistant_hash(company))
             db.commit()
             created_count += 1
 
@@ -133,9 +124,11 @@ def setup_all_assistants():
         db.close()
 
 
-def update_all_assistants():
+def update_all_assistants(force: bool = False):
     """
-    Update all existing assistants with latest content from database
+    Update existing assistants with latest content from database
+    Only assistants whose instructions/model changed since the last sync are
+    pushed, unless force=True
     """
     print("\n" + "="*60)
     print("Updating All Assistants")
@@ -149,11 +142,20 @@ def update_all_assistants():
             Company.assistant_id.isnot(None)
         ).all()
 
+        updated_count = 0
         for company in companies:
+            new_hash = assistant_hash(company) if force else pending_hash(db, company)
+            if new_hash is None:
+                print(f"✓ {company.name} unchanged, skipping")
+                continue
+
             update_assistant(company)
+            record_sync(db, company, new_hash)
+            db.commit()
+            updated_count += 1
             print(f"✓ Updated {company.name}")
 
-        print(f"\n✓ Updated {len(companies)} assistants")
+        print(f"\n✓ Updated {updated_count} assistants ({len(companies) - updated_count} unchanged)")
 
     finally:
         db.close()
@@ -163,6 +165,6 @@ if __name__ == "__main__":
     import sys
 
     if len(sys.argv) > 1 and sys.argv[1] == "--update":
-        update_all_assistants()
+        update_all_assistants(force="--force" in sys.argv)
     else:
         setup_all_assistants()
@@ -0,0 +1,56 @@
+"""
+Single-flight request coalescing
+Concurrent callers asking for the same key share one in-flight call instead
+of each starting their own (e.g. a burst of identical opening questions
+sharing one assistant run)
+"""
+
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0  # Calls actually made
+        self.coalesced = 0  # Callers that joined one already in flight
+        self.site_coalesced = Counter()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], site_id: str = None) -> Tuple[Any, bool]:
+        """
+        Run fn() once per key at a time; everyone waiting on the key gets its result
+        Returns (result, shared) - shared is True for callers that joined
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            if site_id:
+                self.site_coalesced[site_id] += 1
+            # Shielded so one caller disconnecting doesn't cancel the shared call
+            return await asyncio.shield(task), True
+
+        # Own task: the call outlives the leader's request if it goes away
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), False
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+            "by_site": dict(self.site_coalesced),
+        }
+
+
+# Identical first-turn chat questions (site, company version, normalized text)
+chat_flights = SingleFlight()
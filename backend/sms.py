@@ -0,0 +1,241 @@
+"""
+SMS support (Twilio)
+The webhook only routes and enqueues - replies are generated by a pool of
+background workers and sent through a pluggable sender, so Twilio gets its
+acknowledgement well inside its 15 second timeout. In queue mode the work
+goes through the durable job queue instead of the in-memory one
+"""
+
+import asyncio
+import os
+import time
+import traceback
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs
+
+import openai
+from sqlalchemy.orm import Session
+
+from models import Company, run_db
+from tenant_cache import tenant_cache
+from faq_matcher import match_faq
+from sessions import get_session_history, record_turn
+from assistant_runs import degraded_reply, run_turn
+from circuit_breaker import CircuitOpenError
+from transcripts import transcript_log
+from jobs import final_attempt, register_handler
+
+SMS_WORKERS = int(os.getenv("SMS_WORKERS", "8"))
+SMS_QUEUE_SIZE = int(os.getenv("SMS_QUEUE_SIZE", "1000"))
+MAX_SMS_CHARS = 1600  # Twilio's limit for one (multi-part) message
+
+EMPTY_TWIML = '<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+
+
+class InboundSMS(NamedTuple):
+    site_id: str
+    from_number: str
+    to_number: str  # The company's number, replies are sent from it
+    body: str
+    message_sid: Optional[str]
+
+
+class LogSender:
+    """Fallback when Twilio isn't configured: just log the reply"""
+
+    async def send(self, to: str, from_: str, body: str):
+        print(f"📱 SMS {from_} → {to}: {body[:80]}")
+
+
+class TwilioSender:
+    """Sends replies through the Twilio REST API (in a worker thread, it's a sync client)"""
+
+    def __init__(self, account_sid: str, auth_token: str):
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+
+    async def send(self, to: str, from_: str, body: str):
+        await asyncio.to_thread(self.client.messages.create, to=to, from_=from_, body=body)
+
+
+def default_sender():
+    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+    if account_sid and auth_token:
+        return TwilioSender(account_sid, auth_token)
+    print("⚠ TWILIO_ACCOUNT_SID/TWILIO_AUTH_TOKEN not set - SMS replies will only be logged")
+    return LogSender()
+
+
+def parse_form(body: bytes) -> Dict[str, str]:
+    """Twilio posts application/x-www-form-urlencoded"""
+    return {key: values[0] for key, values in parse_qs(body.decode("utf-8"), keep_blank_values=True).items()}
+
+
+def valid_signature(url: str, params: Dict[str, str], signature: Optional[str]) -> bool:
+    """
+    Check X-Twilio-Signature whenever TWILIO_AUTH_TOKEN is set (otherwise no
+    replies are sent); only TWILIO_VALIDATE_SIGNATURE=false turns it off, for local testing
+    """
+    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+    if not auth_token or os.getenv("TWILIO_VALIDATE_SIGNATURE", "true").lower() in ("0", "false", "no"):
+        return True
+
+    from twilio.request_validator import RequestValidator
+    # Behind a proxy the public URL differs from the one we see - allow overriding it
+    url = os.getenv("TWILIO_WEBHOOK_URL") or url
+    return RequestValidator(auth_token).validate(url, params, signature or "")
+
+
+def find_site_for_number(db: Session, to_number: str) -> Optional[str]:
+    """Which active, SMS-enabled company owns this number (indexed lookup)"""
+    row = db.query(Company.site_id).filter(
+        Company.sms_phone_number == to_number,
+        Company.sms_enabled == True,
+        Company.active == True
+    ).first()
+    return row[0] if row else None
+
+
+def sms_session_id(site_id: str, from_number: str) -> str:
+    """Each texter gets one ongoing thread per company"""
+    return f"sms:{site_id}:{from_number}"
+
+
+class SMSQueue:
+    """
+    Bounded queue of inbound messages drained by a pool of worker tasks
+    Messages from the same number are handled one at a time, in order, so a
+    conversation's thread never has two runs at once
+    """
+
+    def __init__(self, workers: int, max_size: int):
+        self.workers = workers
+        self.max_size = max_size
+        self.sender = None
+        self.stats = {"received": 0, "replied": 0, "failed": 0, "dropped": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._conversations: Dict[str, list] = {}  # from key -> [lock, users]
+
+    def set_sender(self, sender):
+        """Swap the outbound sender (e.g. a fake one for local testing)"""
+        self.sender = sender
+
+    def start(self):
+        """Start the workers (idempotent; also done lazily on first enqueue)"""
+        if self._tasks:
+            return
+        if self.sender is None:
+            self.sender = default_sender()
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, message: InboundSMS) -> bool:
+        """Queue a message for a reply; False if the queue is full"""
+        self.start()
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["received"] += 1
+        return True
+
+    async def join(self):
+        """Wait until everything queued so far has been handled"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._handle_in_order(message)
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"ERROR: SMS reply to {message.from_number} failed: {str(e)}")
+                print(traceback.format_exc())
+            finally:
+                self._queue.task_done()
+
+    async def _handle_in_order(self, message: InboundSMS):
+        key = sms_session_id(message.site_id, message.from_number)
+        entry = self._conversations.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self.handle(message)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._conversations[key]
+
+    async def handle(self, message: InboundSMS):
+        """Generate and send the reply to one inbound message"""
+        started = time.perf_counter()
+        if self.sender is None:
+            self.sender = default_sender()
+
+        company = await tenant_cache.get(message.site_id)
+        if company is None:
+            return
+
+        session_id = sms_session_id(message.site_id, message.from_number)
+        thread_id, history = await run_db(get_session_history, session_id, message.site_id)
+        # FAQ answers only open a conversation; follow-ups need the thread
+        faq = match_faq(company.faq_index, message.body) if thread_id is None else None
+        if faq is not None:
+            reply, source = faq.answer, "faq"
+        elif not company.assistant_id:
+            print(f"⚠ No assistant configured for {message.site_id}, SMS from {message.from_number} not answered")
+            return
+        else:
+            # OpenAI errors propagate while a queued SMS job can still be retried;
+            # otherwise (in-memory queue, last attempt) the texter gets a fallback
+            reason = None
+            try:
+                turn = await run_turn(company, thread_id, message.body, history)
+            except CircuitOpenError:
+                turn, reason = None, "circuit_open"
+            except openai.OpenAIError as e:
+                if not final_attempt():
+                    raise
+                print(f"ERROR: Assistant turn for SMS to {message.site_id} failed: {str(e)}")
+                turn, reason = None, "openai_error"
+
+            source = "fallback"
+            if turn is None:
+                reply = degraded_reply(company, message.body, reason)
+            else:
+                await run_db(record_turn, session_id, message.site_id, turn.thread_id, message.body, turn.reply)
+                if turn.status == 'completed':
+                    reply, source = turn.reply, "assistant"
+                else:
+                    reply = degraded_reply(company, message.body, "timeout" if turn.timed_out else "run_failed")
+
+        await self.sender.send(to=message.from_number, from_=message.to_number, body=reply[:MAX_SMS_CHARS])
+        self.stats["replied"] += 1
+        # The reply is out: nothing after this may raise, or a queued job would send it again
+        try:
+            transcript_log.record(message.site_id, session_id, message.body, reply[:MAX_SMS_CHARS], source,
+                                  time.perf_counter() - started, "sms")
+        except Exception as e:
+            print(f"ERROR: Logging SMS transcript for {message.site_id} failed: {str(e)}")
+            print(traceback.format_exc())
+
+
+sms_queue = SMSQueue(workers=SMS_WORKERS, max_size=SMS_QUEUE_SIZE)
+
+
+@register_handler("sms")
+async def sms_job(payload: dict) -> dict:
+    """Job handler: reply to an inbound SMS (ASSISTANT_RUN_MODE=queue)"""
+    await sms_queue.handle(InboundSMS(**payload))
+    return {"replied": True}
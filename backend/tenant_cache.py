@@ -0,0 +1,219 @@
+"""
+In-process cache of tenant (company) config for the hot request paths
+Holds compact records with only the columns chat/widget need - never the
+knowledge_base, and FAQs only as a prebuilt match index - with TTL expiry
+and LRU eviction. Misses load through run_db, off the event loop
+"""
+
+import asyncio
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Company, SessionLocal, run_db
+from faq_matcher import FaqIndex
+
+
+class TenantConfig(NamedTuple):
+    """Compact, read-only view of an active company"""
+    site_id: str
+    name: str
+    primary_color: Optional[str]
+    greeting: Optional[str]
+    assistant_id: Optional[str]
+    model: Optional[str]
+    updated_at: Optional[datetime]
+    rate_limit_per_minute: Optional[int]
+    rate_limit_burst: Optional[int]
+    contact_info: Optional[dict]  # For fallback answers when the assistant is unavailable
+    faq_index: Optional[FaqIndex]
+
+
+# Only these columns are fetched on a cache miss (faqs is turned into faq_index)
+_COLUMNS = [getattr(Company, field) for field in TenantConfig._fields[:-1]] + [Company.faqs]
+
+
+class TenantCache:
+    """
+    Read-through TTL + LRU cache keyed by site_id
+    Unknown/inactive sites are remembered in a separate, smaller and
+    shorter-lived map, so bogus embeds don't hit the DB on every request and
+    random site ids can't evict real tenants
+    """
+
+    def __init__(self, ttl_seconds: float, max_size: int, negative_ttl_seconds: float, negative_max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.negative_max_size = negative_max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, TenantConfig]]" = OrderedDict()
+        self._unknown: "OrderedDict[str, float]" = OrderedDict()  # site_id -> when it was looked up
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._high_water: Optional[datetime] = None
+
+    async def get(self, site_id: str) -> Optional[TenantConfig]:
+        """Get an active tenant's config, loading it from the DB on a miss"""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(site_id)
+            if entry and now - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(site_id)
+                self.hits += 1
+                return entry[1]
+            checked = self._unknown.get(site_id)
+            if checked is not None and now - checked < self.negative_ttl_seconds:
+                self.hits += 1
+                return None
+            self.misses += 1
+            generation = self._generation
+
+        tenant = await run_db(self._load, site_id)
+
+        with self._lock:
+            # Skip the store if an invalidation happened while we were loading
+            if generation == self._generation:
+                if tenant is None:
+                    self._entries.pop(site_id, None)
+                    self._store(self._unknown, site_id, time.monotonic(), self.negative_max_size)
+                else:
+                    self._unknown.pop(site_id, None)
+                    self._store(self._entries, site_id, (time.monotonic(), tenant), self.max_size)
+
+        return tenant
+
+    @staticmethod
+    def _store(entries: OrderedDict, key: str, value, max_size: int):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+    def invalidate(self, site_id: Optional[str] = None):
+        """Drop one tenant (or everything) so the next read reloads from the DB"""
+        with self._lock:
+            self._generation += 1
+            if site_id is None:
+                self._entries.clear()
+                self._unknown.clear()
+            else:
+                self._entries.pop(site_id, None)
+                self._unknown.pop(site_id, None)
+
+    def _load(self, db: Session, site_id: str) -> Optional[TenantConfig]:
+        row = db.query(*_COLUMNS).filter(
+            Company.site_id == site_id,
+            Company.active == True
+        ).first()
+        if not row:
+            return None
+        *fields, faqs = row
+        return TenantConfig(*fields, faq_index=FaqIndex(faqs) if faqs else None)
+
+    def warm(self) -> int:
+        """
+        Load active companies (most recently updated first, up to max_size)
+        in one query, so first requests after a boot are hits.
+        Returns the number loaded
+        """
+        with self._lock:
+            generation = self._generation
+
+        db = SessionLocal()
+        try:
+            rows = db.query(*_COLUMNS).filter(
+                Company.active == True
+            ).order_by(Company.updated_at.desc()).limit(self.max_size).all()
+        finally:
+            db.close()
+
+        tenants = [
+            TenantConfig(*fields, faq_index=FaqIndex(faqs) if faqs else None)
+            for *fields, faqs in reversed(rows)  # Most recent last, i.e. the last to be evicted
+        ]
+
+        with self._lock:
+            if generation != self._generation:
+                return 0  # Invalidated while loading; reads will load fresh copies
+            now = time.monotonic()
+            for tenant in tenants:
+                if tenant.site_id not in self._entries:
+                    self._entries[tenant.site_id] = (now, tenant)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return len(tenants)
+
+    def sync_from_db(self) -> int:
+        """
+        Cross-worker invalidation: drop entries for companies whose
+        updated_at moved past the newest version this worker has seen.
+        Admin writes in other workers bump updated_at, so this catches them
+        (permanent deletes don't, and fall back to TTL expiry).
+        Returns the number of changed companies found
+        """
+        db = SessionLocal()
+        try:
+            query = db.query(Company.site_id, Company.updated_at)
+            if self._high_water is not None:
+                query = query.filter(Company.updated_at > self._high_water)
+            changed = query.all()
+        finally:
+            db.close()
+
+        first_sync = self._high_water is None
+        for site_id, updated_at in changed:
+            if not first_sync:
+                self.invalidate(site_id)
+            if updated_at and (self._high_water is None or updated_at > self._high_water):
+                self._high_water = updated_at
+
+        return 0 if first_sync else len(changed)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "unknown_sites": len(self._unknown),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+tenant_cache = TenantCache(
+    ttl_seconds=float(os.getenv("TENANT_CACHE_TTL", "300")),
+    max_size=int(os.getenv("TENANT_CACHE_SIZE", "1024")),
+    negative_ttl_seconds=float(os.getenv("TENANT_CACHE_NEGATIVE_TTL", "60")),
+    negative_max_size=int(os.getenv("TENANT_CACHE_NEGATIVE_SIZE", "256")),
+)
+
+
+async def warm_tenant_cache():
+    """Background task at startup: preload tenants without holding up the first request"""
+    if os.getenv("TENANT_CACHE_WARM", "true").lower() not in ("1", "true", "yes"):
+        return
+    start = time.perf_counter()
+    try:
+        count = await asyncio.to_thread(tenant_cache.warm)
+        print(f"✓ Tenant cache warmed: {count} companies in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"⚠ Tenant cache warm-up failed, loading tenants on demand: {str(e)}")
+
+
+async def tenant_cache_sync_loop():
+    """Background task: poll for company changes made by other workers"""
+    interval = float(os.getenv("TENANT_CACHE_SYNC_INTERVAL", "5"))
+
+    while True:
+        try:
+            await asyncio.to_thread(tenant_cache.sync_from_db)
+        except Exception as e:
+            print(f"ERROR: Tenant cache sync failed: {str(e)}")
+            print(traceback.format_exc())
+        await asyncio.sleep(interval)
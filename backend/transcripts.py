@@ -0,0 +1,145 @@
+"""
+Chat transcripts
+Every answered message is logged to `chat_messages` (the question and the
+reply, with site, session, source and latency). Request handlers only append
+to a bounded in-memory buffer; a background loop writes it out in batched
+INSERTs, early once a batch has built up. When the buffer is full (database
+down or too slow) new messages are dropped and counted rather than making
+chats wait
+"""
+
+import asyncio
+import os
+import threading
+import traceback
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, List, Optional
+
+from sqlalchemy.orm import Session
+
+from metrics import TRANSCRIPT_DROPPED, site_label
+from models import ChatMessageLog, run_db
+
+TRANSCRIPTS_ENABLED = os.getenv("TRANSCRIPTS", "true").lower() in ("1", "true", "yes")
+TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv("TRANSCRIPT_FLUSH_INTERVAL", "2"))
+TRANSCRIPT_BATCH_SIZE = int(os.getenv("TRANSCRIPT_BATCH_SIZE", "500"))
+TRANSCRIPT_BUFFER_SIZE = int(os.getenv("TRANSCRIPT_BUFFER_SIZE", "20000"))  # Messages held before dropping
+
+
+class TranscriptLog:
+    """Bounded buffer of chat_messages rows, drained to the DB by flush()"""
+
+    def __init__(self, max_rows: int, batch_size: int):
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.written = 0
+        self.dropped = 0
+        self.wake: Optional[asyncio.Event] = None  # Set by the flush loop; record() sets it for early flushes
+        self._rows: Deque[dict] = deque()
+        self._lock = threading.Lock()
+
+    def record(self, site_id: str, session_id: str, question: str, answer: Optional[str], source: str,
+               latency_seconds: float, channel: str = "web") -> bool:
+        """
+        Buffer one exchange (question + reply); never blocks on the DB
+        Call from the event loop. Returns False if the buffer was full and it was dropped
+        """
+        if not TRANSCRIPTS_ENABLED:
+            return False
+
+        answered = datetime.utcnow()
+        common = {"site_id": site_id, "session_id": session_id, "channel": channel}
+        rows = [{**common, "role": "user", "content": question,
+                 "created_at": answered - timedelta(seconds=latency_seconds)}]
+        if answer is not None:
+            rows.append({**common, "role": "assistant", "content": answer, "source": source,
+                         "latency_ms": round(latency_seconds * 1000), "created_at": answered})
+
+        with self._lock:
+            if len(self._rows) + len(rows) > self.max_rows:
+                self.dropped += len(rows)
+                TRANSCRIPT_DROPPED.labels(site_label(site_id)).inc(len(rows))
+                return False
+            self._rows.extend(rows)
+            backlog = len(self._rows)
+
+        if backlog >= self.batch_size and self.wake is not None:
+            self.wake.set()
+        return True
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def _take(self) -> List[dict]:
+        with self._lock:
+            return [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+
+    def _restore(self, rows: List[dict]):
+        """Put a failed batch back at the front, so order is kept and the next flush retries it"""
+        with self._lock:
+            self._rows.extendleft(reversed(rows))
+
+    def flush(self, db: Session) -> int:
+        """Write everything buffered, one transaction per batch; returns rows written"""
+        written = 0
+        while True:
+            rows = self._take()
+            if not rows:
+                return written
+            try:
+                db.bulk_insert_mappings(ChatMessageLog, rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                self._restore(rows)
+                raise
+            written += len(rows)
+            self.written += len(rows)
+
+
+def session_transcript(db: Session, site_id: str, session_id: str, limit: int) -> List[dict]:
+    """A session's logged messages, oldest first (buffered ones show up after the next flush)"""
+    rows = db.query(ChatMessageLog).filter(
+        ChatMessageLog.site_id == site_id,
+        ChatMessageLog.session_id == session_id,
+    ).order_by(ChatMessageLog.id).limit(limit).all()
+    return [
+        {
+            "role": row.role,
+            "content": row.content,
+            "channel": row.channel,
+            "source": row.source,
+            "latency_ms": row.latency_ms,
+            "created_at": row.created_at,
+        }
+        for row in rows
+    ]
+
+
+transcript_log = TranscriptLog(TRANSCRIPT_BUFFER_SIZE, TRANSCRIPT_BATCH_SIZE)
+
+
+async def transcript_flush_loop():
+    """Background task: write buffered messages every TRANSCRIPT_FLUSH_INTERVAL seconds (or once a batch is ready)"""
+    transcript_log.wake = asyncio.Event()
+    while True:
+        try:
+            await asyncio.wait_for(transcript_log.wake.wait(), TRANSCRIPT_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        transcript_log.wake.clear()
+        if not await flush_transcripts():
+            # Don't retry on every new message while the DB is failing
+            await asyncio.sleep(TRANSCRIPT_FLUSH_INTERVAL)
+
+
+async def flush_transcripts() -> bool:
+    try:
+        await run_db(transcript_log.flush)
+        return True
+    except Exception as e:
+        print(f"ERROR: Transcript flush failed ({transcript_log.pending()} messages buffered): {str(e)}")
+        print(traceback.format_exc())
+        return False
@@ -0,0 +1,263 @@
+"""
+Per-tenant assistant usage accounting
+Each finished run adds its tokens and duration to in-memory hourly counters;
+a background loop flushes them to `usage_rollups` in one batched transaction
+(increments, so several processes can share rows) instead of one write per
+request
+"""
+
+import asyncio
+import json
+import os
+import threading
+import traceback
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Company, UsageRollup, run_db
+
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "30"))
+COUNTERS = ("runs", "timed_out", "prompt_tokens", "completion_tokens", "run_seconds")
+
+# USD per 1M (prompt, completion) tokens - for estimates only; override with USAGE_PRICES
+# as JSON, e.g. {"gpt-4o-mini": [0.15, 0.6]}
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+MODEL_PRICES.update({model: tuple(prices) for model, prices in json.loads(os.getenv("USAGE_PRICES", "{}")).items()})
+
+Key = Tuple[str, str, datetime]  # site_id, model, hour
+
+
+def hour_bucket(when: datetime) -> datetime:
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def naive_utc(when: datetime) -> datetime:
+    """Rollups are stored as naive UTC; convert query params that carry a timezone"""
+    if when.tzinfo is None:
+        return when
+    return when.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Estimated USD cost, or None for a model without a known price"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+class UsageTracker:
+    """In-memory hourly usage counters, drained to the DB by flush()"""
+
+    def __init__(self):
+        self._pending: Dict[Key, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self.flushed_rows = 0
+
+    def record(self, site_id: str, model: Optional[str], usage=None, run_seconds: float = 0.0,
+               timed_out: bool = False):
+        """Count one run; `usage` is the run's usage object (None while unknown, e.g. cancelled)"""
+        key = (site_id, model or "default", hour_bucket(datetime.utcnow()))
+        with self._lock:
+            counters = self._pending.get(key)
+            if counters is None:
+                counters = self._pending[key] = dict.fromkeys(COUNTERS, 0)
+            counters["runs"] += 1
+            counters["timed_out"] += int(timed_out)
+            counters["run_seconds"] += run_seconds
+            if usage is not None:
+                counters["prompt_tokens"] += usage.prompt_tokens or 0
+                counters["completion_tokens"] += usage.completion_tokens or 0
+
+    def pending(self, site_id: str) -> List[dict]:
+        """Not yet flushed counters for one tenant (this process only)"""
+        with self._lock:
+            return [
+                {"model": model, "bucket_start": bucket, **counters}
+                for (site, model, bucket), counters in self._pending.items() if site == site_id
+            ]
+
+    def flush(self, db: Session) -> int:
+        """Add pending counters to usage_rollups in one transaction; returns rows touched"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            for (site_id, model, bucket), counters in pending.items():
+                _add_to_row(db, site_id, model, bucket, counters)
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._restore(pending)
+            raise
+        self.flushed_rows += len(pending)
+        return len(pending)
+
+    def _restore(self, pending: Dict[Key, Dict[str, float]]):
+        """Put counters from a failed flush back so the next one retries them"""
+        with self._lock:
+            for key, counters in pending.items():
+                current = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                for name, value in counters.items():
+                    current[name] += value
+
+
+def _add_to_row(db: Session, site_id: str, model: str, bucket: datetime, counters: Dict[str, float]):
+    """Increment a rollup row, creating it if needed (another process may create it first)"""
+    match = db.query(UsageRollup).filter(
+        UsageRollup.site_id == site_id,
+        UsageRollup.model == model,
+        UsageRollup.bucket_start == bucket,
+    )
+    increments = {getattr(UsageRollup, name): getattr(UsageRollup, name) + value
+                  for name, value in counters.items()}
+    if match.update(increments, synchronize_session=False):
+        return
+    try:
+        with db.begin_nested():
+            db.add(UsageRollup(site_id=site_id, model=model, bucket_start=bucket, **counters))
+    except IntegrityError:
+        match.update(increments, synchronize_session=False)
+
+
+usage_tracker = UsageTracker()
+
+
+async def usage_flush_loop():
+    """Background task: write accumulated usage every USAGE_FLUSH_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+        await flush_usage()
+
+
+async def flush_usage():
+    try:
+        await run_db(usage_tracker.flush)
+    except Exception as e:
+        print(f"ERROR: Usage flush failed: {str(e)}")
+        print(traceback.format_exc())
+
+
+def _summarize(counters: Dict[str, float], model_costs: Iterable[Optional[float]]) -> dict:
+    runs = counters["runs"]
+    costs = [cost for cost in model_costs if cost is not None]
+    return {
+        "runs": runs,
+        "timed_out": counters["timed_out"],
+        "prompt_tokens": counters["prompt_tokens"],
+        "completion_tokens": counters["completion_tokens"],
+        "avg_prompt_tokens": round(counters["prompt_tokens"] / runs) if runs else 0,
+        "run_seconds": round(counters["run_seconds"], 3),
+        "avg_run_seconds": round(counters["run_seconds"] / runs, 3) if runs else 0.0,
+        "estimated_cost_usd": round(sum(costs), 4) if costs else None,
+    }
+
+
+def usage_report(db: Session, site_id: str, since: datetime, until: datetime, bucket: str) -> dict:
+    """Hourly or daily rollups (flushed rows plus this process's pending counters) for one tenant"""
+    since, until = naive_utc(since), naive_utc(until)
+    rows = [
+        {"model": row.model, "bucket_start": row.bucket_start, **{name: getattr(row, name) for name in COUNTERS}}
+        for row in db.query(UsageRollup).filter(
+            UsageRollup.site_id == site_id,
+            UsageRollup.bucket_start >= hour_bucket(since),
+            UsageRollup.bucket_start < until,
+        )
+    ]
+    rows += [row for row in usage_tracker.pending(site_id)
+             if hour_bucket(since) <= row["bucket_start"] < until]
+
+    # bucket start -> model -> counters
+    grouped = defaultdict(lambda: defaultdict(lambda: dict.fromkeys(COUNTERS, 0)))
+    for row in rows:
+        start = row["bucket_start"]
+        if bucket == "day":
+            start = start.replace(hour=0)
+        counters = grouped[start][row["model"]]
+        for name in COUNTERS:
+            counters[name] += row[name]
+
+    def combine(by_model: Dict[str, Dict[str, float]]) -> dict:
+        total = dict.fromkeys(COUNTERS, 0)
+        for counters in by_model.values():
+            for name in COUNTERS:
+                total[name] += counters[name]
+        costs = [estimate_cost(model, c["prompt_tokens"], c["completion_tokens"]) for model, c in by_model.items()]
+        return _summarize(total, costs)
+
+    totals_by_model = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for by_model in grouped.values():
+        for model, counters in by_model.items():
+            for name in COUNTERS:
+                totals_by_model[model][name] += counters[name]
+
+    return {
+        "site_id": site_id,
+        "bucket": bucket,
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "totals": combine(totals_by_model),
+        "by_model": {model: _summarize(c, [estimate_cost(model, c["prompt_tokens"], c["completion_tokens"])])
+                     for model, c in totals_by_model.items()},
+        "buckets": [
+            {"start": start.isoformat(), **combine(grouped[start])}
+            for start in sorted(grouped)
+        ],
+    }
+
+
+def top_tenants(db: Session, since: datetime, limit: int, sort: str) -> List[dict]:
+    """
+    Tenants with the most usage since `since` (flushed rows), with knowledge base size
+    alongside - large avg_prompt_tokens with a large knowledge_base_chars points at an
+    oversized knowledge base
+    """
+    since = naive_utc(since)
+    totals = db.query(
+        UsageRollup.site_id,
+        UsageRollup.model,
+        *[func.sum(getattr(UsageRollup, name)).label(name) for name in COUNTERS],
+    ).filter(UsageRollup.bucket_start >= hour_bucket(since)).group_by(
+        UsageRollup.site_id, UsageRollup.model
+    ).all()
+
+    by_site = defaultdict(list)
+    for row in totals:
+        by_site[row.site_id].append(row)
+
+    kb_sizes = dict(db.query(Company.site_id, func.length(Company.knowledge_base)).filter(
+        Company.site_id.in_(list(by_site))
+    ).all()) if by_site else {}
+
+    tenants = []
+    for site, site_rows in by_site.items():
+        total = {name: sum(getattr(row, name) or 0 for row in site_rows) for name in COUNTERS}
+        costs = [estimate_cost(row.model, row.prompt_tokens or 0, row.completion_tokens or 0) for row in site_rows]
+        tenants.append({"site_id": site, "knowledge_base_chars": kb_sizes.get(site) or 0, **_summarize(total, costs)})
+
+    sort_keys = {
+        "cost": lambda t: t["estimated_cost_usd"] or 0,
+        "prompt_tokens": lambda t: t["prompt_tokens"],
+        "avg_prompt_tokens": lambda t: t["avg_prompt_tokens"],
+        "run_seconds": lambda t: t["run_seconds"],
+    }
+    tenants.sort(key=sort_keys[sort], reverse=True)
+    return tenants[:limit]
+
+
+def default_range(days: int = 7) -> Tuple[datetime, datetime]:
+    until = datetime.utcnow()
+    return until - timedelta(days=days), until
@@ -0,0 +1,248 @@
+"""
+Widget delivery
+Every page view on every tenant site loads the widget, so everything it
+fetches is built once and made cacheable: the per-site config JSON (ETag /
+Last-Modified from Company.updated_at, 304s), content-hashed chatbot.js /
+chatbot.css bundles compressed once at load (gzip, plus brotli when the
+optional `brotli` package is installed) and served as immutable, and a
+per-site bootstrap script with the config inlined so a page needs one
+request to our API instead of two
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import Request, Response
+from fastapi.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+WIDGET_DIR = Path(__file__).parent.parent / 'widget'
+BUNDLE_FILES = ("chatbot.js", "chatbot.css")
+CONFIG_MAX_AGE = int(os.getenv("WIDGET_CONFIG_MAX_AGE", "300"))  # How stale a cached config may be after an edit
+STATIC_MAX_AGE = int(os.getenv("WIDGET_STATIC_MAX_AGE", "300"))  # Unversioned /widget/* files
+# The API URL the bootstrap script points the widget at (default: the origin the script was loaded from)
+PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", "").rstrip("/")
+IMMUTABLE = "public, max-age=31536000, immutable"
+CONTENT_TYPES = {".js": "application/javascript; charset=utf-8", ".css": "text/css; charset=utf-8"}
+
+
+class CompiledConfig(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: Optional[str]
+
+
+@lru_cache(maxsize=4096)
+def _compile_config(site_id: str, updated_at: Optional[datetime], name: str,
+                    primary_color: Optional[str], greeting: Optional[str]) -> CompiledConfig:
+    body = json.dumps({
+        "site_name": name,
+        "primary_color": primary_color,
+        "greeting_message": greeting,
+    }, separators=(",", ":")).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+    last_modified = format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True) if updated_at else None
+    return CompiledConfig(body, etag, last_modified)
+
+
+def compiled_config(company) -> CompiledConfig:
+    """The widget config JSON for a tenant, built once per company version"""
+    return _compile_config(company.site_id, company.updated_at, company.name,
+                           company.primary_color, company.greeting)
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[str] = None) -> bool:
+    """Does the client's cached copy (If-None-Match, else If-Modified-Since) still match?"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_response(request: Request, body: bytes, media_type: str, etag: str, cache_control: str,
+                    last_modified: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Response:
+    """200 with validators and Cache-Control, or an empty 304 when the client's copy is current"""
+    headers = {"ETag": etag, "Cache-Control": cache_control, **(headers or {})}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def config_response(request: Request, company) -> Response:
+    config = compiled_config(company)
+    return cached_response(
+        request, config.body, "application/json", config.etag,
+        f"public, max-age={CONFIG_MAX_AGE}, stale-while-revalidate=86400", config.last_modified,
+    )
+
+
+class Asset(NamedTuple):
+    filename: str  # Content-hashed, e.g. chatbot.3f2a1b9c0d4e.js
+    content_type: str
+    digest: str
+    identity: bytes
+    gzip: bytes
+    br: Optional[bytes]
+
+
+class WidgetBundle:
+    """chatbot.js / chatbot.css under content-hashed names, compressed once (files are read on first use)"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._assets: Optional[Dict[str, Asset]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Asset]:
+        assets = {}
+        for name in BUNDLE_FILES:
+            path = self.directory / name
+            body = path.read_bytes()
+            digest = hashlib.sha256(body).hexdigest()[:12]
+            filename = f"{path.stem}.{digest}{path.suffix}"
+            assets[name] = Asset(
+                filename=filename,
+                content_type=CONTENT_TYPES[path.suffix],
+                digest=digest,
+                identity=body,
+                gzip=gzip.compress(body, compresslevel=9, mtime=0),
+                br=brotli.compress(body, quality=11) if brotli else None,
+            )
+        return assets
+
+    @property
+    def assets(self) -> Dict[str, Asset]:
+        if self._assets is None:
+            with self._lock:
+                if self._assets is None:
+                    self._assets = self._load()
+        return self._assets
+
+    def url(self, name: str) -> str:
+        """Path of a bundle file, e.g. /widget/dist/chatbot.3f2a1b9c0d4e.js"""
+        return f"/widget/dist/{self.assets[name].filename}"
+
+    def find(self, filename: str) -> Optional[Asset]:
+        for asset in self.assets.values():
+            if asset.filename == filename:
+                return asset
+        return None
+
+    def versions(self) -> Dict[str, str]:
+        return {name: asset.filename for name, asset in self.assets.items()}
+
+
+widget_bundle = WidgetBundle(WIDGET_DIR)
+
+
+def _accepts(request: Request, encoding: str) -> bool:
+    for part in request.headers.get("accept-encoding", "").split(","):
+        token, _, params = part.strip().partition(";")
+        if token.strip() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def asset_response(request: Request, asset: Asset) -> Response:
+    """A bundle file in the best encoding the client accepts; cacheable forever (its name changes with it)"""
+    headers = {"Vary": "Accept-Encoding"}
+    if asset.br is not None and _accepts(request, "br"):
+        body, headers["Content-Encoding"] = asset.br, "br"
+    elif _accepts(request, "gzip"):
+        body, headers["Content-Encoding"] = asset.gzip, "gzip"
+    else:
+        body = asset.identity
+    # Each encoding is a different representation, so it gets its own ETag
+    etag = f'"{asset.digest}-{headers.get("Content-Encoding", "identity")}"'
+    return cached_response(request, body, asset.content_type, etag, IMMUTABLE, headers=headers)
+
+
+BOOTSTRAP_TEMPLATE = """(function () {
+  var current = document.currentScript;
+  var apiUrl = %(api_url)s || new URL(current.src).origin, site = %(site)s, config = %(config)s;
+  var position = (current && current.getAttribute('data-position')) || 'bottom-right';
+
+  var link = document.createElement('link');
+  link.rel = 'stylesheet';
+  link.href = apiUrl + %(css)s;
+  document.head.appendChild(link);
+
+  function start() {
+    if (!document.getElementById('rx4m-chatbot-container')) {
+      var container = document.createElement('div');
+      container.id = 'rx4m-chatbot-container';
+      document.body.appendChild(container);
+    }
+    var script = document.createElement('script');
+    script.src = apiUrl + %(js)s;
+    script.async = true;
+    script.onload = function () {
+      window.ChatbotWidget.init({ apiUrl: apiUrl, site: site, position: position, widgetConfig: config });
+    };
+    document.head.appendChild(script);
+  }
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', start);
+  } else {
+    start();
+  }
+})();
+"""
+
+
+@lru_cache(maxsize=4096)
+def _compile_bootstrap(site_id: str, config_body: bytes, css: str, js: str) -> bytes:
+    return (BOOTSTRAP_TEMPLATE % {
+        "api_url": json.dumps(PUBLIC_API_URL or None),
+        "site": json.dumps(site_id),
+        "config": config_body.decode().replace("</", "<\\/"),  # Safe even if pasted inline in a <script>
+        "css": json.dumps(css),
+        "js": json.dumps(js),
+    }).encode()
+
+
+def bootstrap_response(request: Request, company) -> Response:
+    """
+    The per-site loader: one <script> tag adds the hashed CSS and JS and starts
+    the widget with its config inlined (no /api/config request). Nothing from
+    the request goes into the (publicly cached) body: the API origin is
+    PUBLIC_API_URL or, in the browser, the script's own URL
+    """
+    config = compiled_config(company)
+    body = _compile_bootstrap(company.site_id, config.body,
+                              widget_bundle.url("chatbot.css"), widget_bundle.url("chatbot.js"))
+    etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+    return cached_response(request, body, CONTENT_TYPES[".js"], etag,
+                           f"public, max-age={CONFIG_MAX_AGE}, stale-while-revalidate=86400")
+
+
+class WidgetStaticFiles(StaticFiles):
+    """StaticFiles for the unversioned /widget/* paths, with a short Cache-Control"""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", f"public, max-age={STATIC_MAX_AGE}")
+        return response
@@ -88,6 +88,12 @@
         },
 
         loadConfig: async function() {
+            // The bootstrap script inlines the site's config - no request needed
+            if (this.config.widgetConfig) {
+                this.updateWidgetStyles(this.config.widgetConfig);
+                return;
+            }
+
             try {
                 const response = await fetch(`${this.config.apiUrl}/api/config/${this.config.site}`);
                 const config = await response.json();
@@ -263,19 +269,11 @@
             this.showTypingIndicator();
 
             try {
-                const response = await fetch(`${this.config.apiUrl}/api/chat`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        message: message,
-                        session_id: this.config.sessionId,
-                        site: this.config.site,
-                    }),
-                });
+                // Stream tokens as they arrive; fall back to the JSON endpoint
+                const streamed = await this.streamMessage(message);
+                if (streamed) return;
 
-                const data = await response.json();
+                const data = await this.fetchReply(message);
 
                 // Remove typing indicator
                 this.removeTypingIndicator();
@@ -286,10 +284,109 @@
             } catch (error) {
                 console.error('Error sending message:', error);
                 this.removeTypingIndicator();
-                this.addMessage('Sorry, I encountered an error. Please try again.', 'bot');
+                this.addMessage(error.status === 429
+                    ? 'You are sending messages too quickly. Please wait a moment and try again.'
+                    : 'Sorry, I encountered an error. Please try again.', 'bot');
             }
         },
 
+        fetchReply: async function(message) {
+            const response = await fetch(`${this.config.apiUrl}/api/chat`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    message: message,
+                    session_id: this.config.sessionId,
+                    site: this.config.site,
+                }),
+            });
+
+            if (!response.ok) throw this.httpError(response);
+            return response.json();
+        },
+
+        httpError: function(response) {
+            const error = new Error(`Chat request failed with status ${response.status}`);
+            error.status = response.status;
+            return error;
+        },
+
+        /**
+         * Stream a reply from /api/chat/stream (Server-Sent Events)
+         * Returns false only when streaming isn't available (no browser support,
+         * network failure, or no stream endpoint), so the caller can fall back;
+         * any other failure throws, since the message may already be in the thread
+         */
+        streamMessage: async function(message) {
+            if (!window.ReadableStream || !window.TextDecoder) return false;
+
+            let response;
+            try {
+                response = await fetch(`${this.config.apiUrl}/api/chat/stream`, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'Accept': 'text/event-stream',
+                    },
+                    body: JSON.stringify({
+                        message: message,
+                        session_id: this.config.sessionId,
+                        site: this.config.site,
+                    }),
+                });
+            } catch (error) {
+                return false;
+            }
+
+            // Only a missing endpoint means "use /api/chat"; 429s, 400s and 500s must not be re-sent
+            if (response.status === 404 || response.status === 405) return false;
+            if (!response.ok) throw this.httpError(response);
+            if (!response.body) return false;
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+            let contentDiv = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+
+                buffer += decoder.decode(value, { stream: true });
+
+                // SSE events are separated by a blank line
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+
+                for (const raw of events) {
+                    const line = raw.split('\n').find(l => l.startsWith('data: '));
+                    if (!line) continue;
+                    const event = JSON.parse(line.slice(6));
+
+                    if (event.type === 'delta') {
+                        text += event.text;
+                        if (!contentDiv) {
+                            // First token: swap the typing indicator for a message bubble
+                            this.removeTypingIndicator();
+                            contentDiv = this.addMessage(text, 'bot');
+                        } else {
+                            contentDiv.textContent = text;
+                            const messagesContainer = document.getElementById('rx4m-chat-messages');
+                            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+                        }
+                    } else if (event.type === 'error') {
+                        throw new Error(event.detail);
+                    }
+                }
+            }
+
+            if (!contentDiv) throw new Error('Stream ended without a reply');
+            return true;
+        },
+
         addMessage: function(text, sender) {
             const messagesContainer = document.getElementById('rx4m-chat-messages');
             const messageDiv = document.createElement('div');
@@ -319,6 +416,8 @@
 
             // Scroll to bottom
             messagesContainer.scrollTop = messagesContainer.scrollHeight;
+
+            return contentDiv;
         },
 
         showTypingIndicator: function() {